@@ -1,6 +1,6 @@
 from typing import Generator, Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from pydantic import ValidationError
@@ -10,42 +10,68 @@ from sqlalchemy import select
 from app.core.config import settings
 from app.core import security
 from app.db.models import User
-from app.db.session import get_db
+from app.db.session import get_db, release_connection
 from app.schemas.token import TokenPayload
+from app.services.auth_cache import Principal, auth_cache
 
 # OAuth2 documentation link
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl="/api/v1/auth/login"
 )
 
+def _reject(token: str, status_code: int, detail: str) -> HTTPException:
+    if settings.AUTH_CACHE_ENABLED:
+        auth_cache.reject(token, status_code, detail)
+    return HTTPException(status_code=status_code, detail=detail)
+
+
 async def get_current_user(
-    db: AsyncSession = Depends(get_db), token: str = Depends(reusable_oauth2)
-) -> User:
+    request: Request, db: AsyncSession = Depends(get_db), token: str = Depends(reusable_oauth2)
+) -> Principal:
     """
     Retrieves the currently authenticated user from the JWT token.
-    Raises 403 if the token is invalid and 404 if the user doesn't exist.
+    Raises 403 if the token is invalid, 404 if the user doesn't exist and
+    400 if the user is inactive.
+    Verified tokens (and rejected ones) are cached briefly, see auth_cache.
     """
+    if settings.AUTH_CACHE_ENABLED:
+        principal = auth_cache.get(token)
+        if principal is not None:
+            # Read-your-writes routing key for this request's session
+            db.info["user_id"] = principal.id
+            # Rate limits are keyed by user (see app.core.rate_limit)
+            request.state.user_id = principal.id
+            return principal
+        rejected = auth_cache.get_rejected(token)
+        if rejected is not None:
+            raise HTTPException(status_code=rejected[0], detail=rejected[1])
+
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
         )
         token_data = TokenPayload(**payload)
     except (jwt.JWTError, ValidationError):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Could not validate credentials",
-        )
+        raise _reject(token, status.HTTP_403_FORBIDDEN, "Could not validate credentials")
     
     try:
         user_id = int(token_data.sub)
     except (ValueError, TypeError):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Could not validate credentials",
-        )
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalars().first()
+        raise _reject(token, status.HTTP_403_FORBIDDEN, "Could not validate credentials")
+    result = await db.execute(
+        select(User.id, User.email, User.is_active).where(User.id == user_id)
+    )
+    row = result.first()
+    await release_connection(db)
     
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+    if not row:
+        raise _reject(token, 404, "User not found")
+    if not row.is_active:
+        raise _reject(token, 400, "Inactive user")
+
+    principal = Principal(row.id, row.email, bool(row.is_active))
+    db.info["user_id"] = principal.id
+    request.state.user_id = principal.id
+    if settings.AUTH_CACHE_ENABLED:
+        auth_cache.put(token, principal, payload.get("exp"))
+    return principal
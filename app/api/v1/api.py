@@ -1,6 +1,7 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import chat, auth
+from app.api.v1.endpoints import chat, auth, usage
 
 api_router = APIRouter()
 api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
-api_router.include_router(chat.router, prefix="/chat", tags=["chat"])
\ No newline at end of file
+api_router.include_router(chat.router, prefix="/chat", tags=["chat"])
+api_router.include_router(usage.router, prefix="/usage", tags=["usage"])
\ No newline at end of file
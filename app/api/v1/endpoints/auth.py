@@ -12,11 +12,21 @@ from app.core.rate_limit import limiter
 from app.api import deps
 from app.db.models import User
 from app.db.session import get_db
+from app.db.routing import use_primary
 from app.schemas.user import UserCreate, UserOut
 from app.schemas.token import Token
 
 router = APIRouter()
 
+
+def _hash_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Authentication service is busy, please retry.",
+        headers={"Retry-After": "1"},
+    )
+
+
 # Pre-computed at import time so "user not found" and "wrong password" take the same time,
 # preventing user-enumeration via timing side-channel.
 _DUMMY_HASH: str = security.pwd_context.hash("__dummy_timing__")
@@ -32,17 +42,22 @@ async def login_access_token(
     """
     OAuth2 compatible token login, get an access token for future requests.
     """
+    # A user who just registered may not have reached the replicas yet
+    use_primary(db)
     result = await db.execute(select(User).where(User.email == form_data.username))
     user = result.scalars().first()
 
-    if not user:
-        # Always run a dummy hash verification so "user not found" and "wrong password"
-        # take the same time — prevents user-enumeration via timing side-channel.
-        await security.verify_password(form_data.password, _DUMMY_HASH)
-        raise HTTPException(status_code=400, detail="Incorrect email or password")
+    try:
+        if not user:
+            # Always run a dummy hash verification so "user not found" and "wrong password"
+            # take the same time — prevents user-enumeration via timing side-channel.
+            await security.verify_password(form_data.password, _DUMMY_HASH)
+            raise HTTPException(status_code=400, detail="Incorrect email or password")
 
-    if not await security.verify_password(form_data.password, user.hashed_password):
-        raise HTTPException(status_code=400, detail="Incorrect email or password")
+        if not await security.verify_password(form_data.password, user.hashed_password):
+            raise HTTPException(status_code=400, detail="Incorrect email or password")
+    except security.PasswordHashBusy:
+        raise _hash_pool_busy()
 
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -74,9 +89,14 @@ async def register_user(
             detail="The user with this username already exists in the system.",
         )
     
+    try:
+        hashed_password = await security.get_password_hash(user_in.password)
+    except security.PasswordHashBusy:
+        raise _hash_pool_busy()
+
     db_obj = User(
         email=user_in.email,
-        hashed_password=await security.get_password_hash(user_in.password),
+        hashed_password=hashed_password,
         is_active=user_in.is_active,
     )
     db.add(db_obj)
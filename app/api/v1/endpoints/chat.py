@@ -1,35 +1,55 @@
-import base64
 import asyncio
 import json
 import logging
 import re
-from typing import Optional
+from contextlib import AsyncExitStack
+from typing import Dict, List, Optional, Tuple, Union
 
-from fastapi import APIRouter, HTTPException, Depends, Request, Form, UploadFile, File
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, Form, UploadFile, File, Query
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.schemas.chat import ChatRequest, ChatResponse
+from app.schemas.chat import (
+    ChatRequest, ChatResponse, FanOutRequest, FanOutResponse, MessagePage, ModelReply, SessionPage,
+)
+from app.services import conversations
+from app.services.admission import AdmissionRejected, Ticket, admission
+from app.services.fan_out import fan_out, fan_out_stream
+from app.services.model_router import model_router
 from app.services.chat_service import ChatService
-from app.db.session import get_db
+from app.services.stream_stats import StreamStats
+from app.services.attachments import Attachment, UploadTooLarge, open_upload
+from app.services.attachment_store import attachment_store
+from app.db.session import get_db, release_connection
 from app.core.config import settings
-from app.core.rate_limit import limiter
+from app.core.rate_limit import limiter, retry_after_header
 from app.api import deps
-from app.db.models import User
+from app.services.auth_cache import Principal
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Uploads processed concurrently per worker (bounds memory held by attachments)
+_upload_slots = asyncio.Semaphore(settings.UPLOAD_MAX_CONCURRENT)
+
+# Milliseconds the request waited in the admission queue
+QUEUE_WAIT_HEADER = "X-Queue-Wait-Ms"
+
 # Regex for validating base64 strings (standard + URL-safe alphabets, padding optional)
 _B64_RE = re.compile(r'^[A-Za-z0-9+/\-_]*={0,2}$')
 
 
-def _validate_model_name(model_input: Optional[str]) -> str:
+def _validate_model_name(model_input: Optional[str], routed: bool = True) -> str:
     """
     Normalizes and validates the requested model against allowed configuration.
+    With `routed`, "auto" and the tier names of MODEL_TIERS are accepted too.
     Raises HTTP 400 if the model is not in the allowed set.
     """
-    m = (model_input or "gemini-2.5-pro").strip().lower()
+    m = (model_input or settings.DEFAULT_MODEL).strip().lower()
+
+    if routed and model_router.is_routed(m):
+        return m
 
     if m not in settings.ALLOWED_MODELS:
         raise HTTPException(
@@ -40,6 +60,18 @@ def _validate_model_name(model_input: Optional[str]) -> str:
     return m
 
 
+def _validate_fan_out_models(models: List[str]) -> List[str]:
+    """Validates every requested model and drops duplicates, keeping the request order."""
+    return list(dict.fromkeys(_validate_model_name(m, routed=False) for m in models))
+
+
+def _fan_out_timeouts(request_data: FanOutRequest) -> Optional[Dict[str, float]]:
+    """Per-model timeouts of a fan-out, keyed by the normalized model names."""
+    if not request_data.timeouts:
+        return None
+    return {m.strip().lower(): t for m, t in request_data.timeouts.items()}
+
+
 def _validate_base64(data: str, field_name: str) -> None:
     """Raises HTTP 422 if `data` is not a valid base64 string."""
     stripped = data.rstrip("=")
@@ -47,13 +79,101 @@ def _validate_base64(data: str, field_name: str) -> None:
         raise HTTPException(status_code=422, detail=f"Invalid base64 encoding in field '{field_name}'")
 
 
+async def _admit(model: str, db: AsyncSession, user: Principal) -> Optional[Ticket]:
+    """
+    Waits for an admission slot on `model`'s lane (see app/services/admission.py);
+    release it with `admission.release`. Raises HTTP 503 with Retry-After if the
+    request can't start within the deadline of its priority class.
+    """
+    # Don't hold a pooled connection while queued
+    await release_connection(db)
+    try:
+        return await admission.acquire(model, admission.priority_for(user.email, model))
+    except AdmissionRejected as e:
+        logger.warning(f"Admission rejected for user {user.id}: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, please retry later.",
+            headers=retry_after_header(e.retry_after),
+        )
+
+
+async def _admit_all(models: List[str], db: AsyncSession, user: Principal) -> List[Optional[Ticket]]:
+    """
+    One admission slot per model of a fan-out, taken in a fixed (sorted) order
+    so two fan-outs never hold each other's lanes; release them with
+    `_release_all`. On a rejection the slots already taken are given back.
+    """
+    tickets: List[Optional[Ticket]] = []
+    try:
+        for model in sorted(models):
+            tickets.append(await _admit(model, db, user))
+    except BaseException:
+        _release_all(tickets)
+        raise
+    return tickets
+
+
+def _release_all(tickets: List[Optional[Ticket]]) -> None:
+    for ticket in tickets:
+        admission.release(ticket)
+
+
+def _queue_wait_headers(*tickets: Optional[Ticket]) -> Dict[str, str]:
+    admitted = [ticket for ticket in tickets if ticket]
+    return {QUEUE_WAIT_HEADER: f"{sum(t.wait_ms for t in admitted):.0f}"} if admitted else {}
+
+
+async def _store_attachment(db: AsyncSession, user_id: int, attachment: Optional[Attachment]) -> Optional[str]:
+    """Saves a newly sent attachment in the store so later turns can reference it by id."""
+    if attachment is None or not settings.ATTACHMENT_STORE_ENABLED:
+        return None
+    try:
+        return await attachment_store.put(db, user_id, attachment)
+    except Exception as e:
+        # The store is an optimization: the request proceeds with the inline data
+        logger.warning(f"Failed to store attachment: {e}")
+        return None
+
+
+async def _resolve_attachments(
+    request_data: Union[ChatRequest, FanOutRequest], db: AsyncSession, user_id: int
+) -> Tuple[Optional[Attachment], Optional[Attachment]]:
+    """
+    Builds (image_data, file_data) from a ChatRequest: either a previously
+    stored attachment referenced by `attachment_id`, or the inline base64
+    payloads (kept as base64; decoded only if a provider needs bytes).
+    Raises HTTP 404 if `attachment_id` is unknown or was evicted.
+    """
+    if request_data.attachment_id:
+        attachment = await attachment_store.get(db, user_id, request_data.attachment_id)
+        if attachment is None:
+            raise HTTPException(status_code=404, detail="Attachment not found; re-send the file")
+        return (attachment, None) if attachment.is_image else (None, attachment)
+
+    image_data = None
+    if request_data.image_base64 and request_data.image_mime_type:
+        _validate_base64(request_data.image_base64, "image_base64")
+        image_data = Attachment.from_base64(request_data.image_base64, request_data.image_mime_type)
+
+    file_data = None
+    if request_data.file_base64 and request_data.file_mime_type:
+        _validate_base64(request_data.file_base64, "file_base64")
+        file_data = Attachment.from_base64(request_data.file_base64, request_data.file_mime_type)
+
+    for attachment in (image_data, file_data):
+        await _store_attachment(db, user_id, attachment)
+    return image_data, file_data
+
+
 @router.post("/", response_model=ChatResponse)
 @limiter.limit("5/minute")
 async def handle_chat_json(
     request: Request,
+    response: Response,
     request_data: ChatRequest,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(deps.get_current_user),
+    current_user: Principal = Depends(deps.get_current_user),
 ):
     """
     Main endpoint for chat via JSON.
@@ -61,31 +181,16 @@ async def handle_chat_json(
     """
     normalized_model = _validate_model_name(request_data.model)
 
-    # Validate and prepare image data
-    image_data = None
-    if request_data.image_base64 and request_data.image_mime_type:
-        _validate_base64(request_data.image_base64, "image_base64")
-        image_data = {
-            "data": request_data.image_base64,
-            "mime_type": request_data.image_mime_type
-        }
-
-    # Validate and prepare file data
-    file_data = None
-    if request_data.file_base64 and request_data.file_mime_type:
-        _validate_base64(request_data.file_base64, "file_base64")
-        file_data = {
-            "data": request_data.file_base64,
-            "mime_type": request_data.file_mime_type
-        }
+    image_data, file_data = await _resolve_attachments(request_data, db, current_user.id)
+    ticket = await _admit(normalized_model, db, current_user)
+    response.headers.update(_queue_wait_headers(ticket))
 
     try:
         # Delegate logic to the orchestrator service
-        reply = await ChatService.process_chat(
+        reply, model_used = await ChatService.process_chat(
             session_id=request_data.session_id,
             prompt=request_data.prompt,
             model_name=normalized_model,
-            db=db,
             user_id=current_user.id,
             openai_client=getattr(request.app.state, "openai_client", None),
             image_data=image_data,
@@ -93,25 +198,32 @@ async def handle_chat_json(
             use_search=request_data.use_search
         )
 
+        stored = image_data or file_data
         return ChatResponse(
             session_id=request_data.session_id,
             reply=reply,
-            model_used=normalized_model
+            model_used=model_used,
+            attachment_id=stored.attachment_id if stored else None,
         )
 
     except ValueError as ve:
         raise HTTPException(status_code=422, detail=str(ve))
+    except HTTPException:
+        raise
     except Exception:
         logger.exception("Error processing JSON chat")
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        admission.release(ticket)
 
 
 @router.post("/upload", response_model=ChatResponse)
 @limiter.limit("5/minute")
 async def handle_chat_with_upload(
     request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(deps.get_current_user),
+    current_user: Principal = Depends(deps.get_current_user),
     session_id: str = Form(...),
     prompt: str = Form(...),
     model: Optional[str] = Form(None),
@@ -122,107 +234,301 @@ async def handle_chat_with_upload(
     Endpoint for chat with binary file upload (multipart/form-data).
     """
     normalized_model = _validate_model_name(model)
+    ticket = await _admit(normalized_model, db, current_user)
+    response.headers.update(_queue_wait_headers(ticket))
 
-    image_data = None
-    file_data = None
+    # Uploads are already spooled to disk by the multipart parser (oversized
+    # bodies were cut off by BodySizeLimitMiddleware); the slot semaphore caps
+    # how many are mapped and in flight to providers at once per worker.
+    try:
+        async with _upload_slots, AsyncExitStack() as stack:
+            image_data = None
+            file_data = None
+
+            if file:
+                try:
+                    attachment = await stack.enter_async_context(open_upload(
+                        file.file,
+                        file.content_type or "application/octet-stream",
+                        max_bytes=settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024,
+                    ))
+                except UploadTooLarge:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large. Maximum size is {settings.MAX_UPLOAD_SIZE_MB} MB."
+                    )
+                except Exception as e:
+                    raise HTTPException(status_code=422, detail=f"Error reading uploaded file: {e}")
+
+                if attachment.is_image:
+                    image_data = attachment
+                else:
+                    file_data = attachment
+                await _store_attachment(db, current_user.id, attachment)
+
+            try:
+                reply, model_used = await ChatService.process_chat(
+                    session_id=session_id,
+                    prompt=prompt,
+                    model_name=normalized_model,
+                    user_id=current_user.id,
+                    openai_client=getattr(request.app.state, "openai_client", None),
+                    image_data=image_data,
+                    file_data=file_data,
+                    use_search=use_search
+                )
 
-    if file:
-        try:
-            contents = await file.read()
-
-            # Enforce upload size limit before processing
-            max_bytes = settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024
-            if len(contents) > max_bytes:
-                raise HTTPException(
-                    status_code=413,
-                    detail=f"File too large. Maximum size is {settings.MAX_UPLOAD_SIZE_MB} MB."
+                return ChatResponse(
+                    session_id=session_id,
+                    reply=reply,
+                    model_used=model_used,
+                    attachment_id=attachment.attachment_id if file else None,
                 )
 
-            # Run CPU-intensive base64 encoding in a thread
-            b64_bytes = await asyncio.to_thread(base64.b64encode, contents)
-            b64_encoded = b64_bytes.decode("utf-8")
-            mime_type = file.content_type or "application/octet-stream"
+            except ValueError as ve:
+                raise HTTPException(status_code=422, detail=str(ve))
+            except HTTPException:
+                raise
+            except Exception:
+                logger.exception("Error processing Upload chat")
+                raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        admission.release(ticket)
 
-            if mime_type.startswith("image/"):
-                image_data = {"data": b64_encoded, "mime_type": mime_type}
-            else:
-                file_data = {"data": b64_encoded, "mime_type": mime_type}
-        except HTTPException:
-            raise
-        except Exception as e:
-            raise HTTPException(status_code=422, detail=f"Error reading uploaded file: {e}")
+
+@router.post("/stream")
+@limiter.limit("5/minute")
+async def handle_chat_stream(
+    request: Request,
+    request_data: ChatRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_user),
+):
+    """
+    Streaming chat via Server-Sent Events (text/event-stream).
+    Each chunk is sent as: data: {"delta": "<text>"}\n\n
+    followed by: data: {"stats": {"model", "ttft_ms", "duration_ms", "chunks",
+    "bytes", "tokens", "tokens_per_second", "max_gap_ms"}}\n\n
+    The stream ends with: data: [DONE]\n\n
+    """
+    normalized_model = _validate_model_name(request_data.model)
+
+    image_data, file_data = await _resolve_attachments(request_data, db, current_user.id)
+    # Admitted before the response starts, so a rejection is a real 503
+    ticket = await _admit(normalized_model, db, current_user)
+
+    async def event_generator():
+        stats = StreamStats()
+        try:
+            async for chunk in ChatService.process_chat_stream(
+                session_id=request_data.session_id,
+                prompt=request_data.prompt,
+                model_name=normalized_model,
+                user_id=current_user.id,
+                openai_client=getattr(request.app.state, "openai_client", None),
+                image_data=image_data,
+                file_data=file_data,
+                use_search=request_data.use_search,
+                stats=stats,
+            ):
+                yield f"data: {json.dumps({'delta': chunk})}\n\n"
+        except HTTPException as e:
+            yield f"data: {json.dumps({'error': e.detail})}\n\n"
+        except Exception:
+            logger.exception("Error in stream event generator")
+            yield f"data: {json.dumps({'error': 'Internal server error'})}\n\n"
+        finally:
+            admission.release(ticket)
+            stats.finish(normalized_model)
+            yield f"data: {json.dumps({'stats': stats.as_dict()})}\n\n"
+            yield "data: [DONE]\n\n"
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers=_queue_wait_headers(ticket),
+        # Also releases the slot if the client left before the body started
+        background=BackgroundTask(admission.release, ticket),
+    )
+
+
+@router.post("/fanout", response_model=FanOutResponse)
+@limiter.limit("5/minute")
+async def handle_fan_out(
+    request: Request,
+    response: Response,
+    request_data: FanOutRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_user),
+):
+    """
+    Sends one prompt to several models concurrently and returns every reply
+    (mode=all), the first one (mode=first) or the first `quorum` ones; models
+    still running at that point are cancelled. Each model has its own timeout.
+    Takes an admission slot on every requested model's lane.
+    """
+    models = _validate_fan_out_models(request_data.models)
+    image_data, file_data = await _resolve_attachments(request_data, db, current_user.id)
+    tickets = await _admit_all(models, db, current_user)
+    response.headers.update(_queue_wait_headers(*tickets))
 
     try:
-        reply = await ChatService.process_chat(
-            session_id=session_id,
-            prompt=prompt,
-            model_name=normalized_model,
+        results, persisted_model = await fan_out(
+            session_id=request_data.session_id,
+            prompt=request_data.prompt,
+            models=models,
             db=db,
             user_id=current_user.id,
+            mode=request_data.mode,
+            quorum=request_data.quorum,
+            timeout=request_data.timeout_seconds,
+            timeouts=_fan_out_timeouts(request_data),
             openai_client=getattr(request.app.state, "openai_client", None),
             image_data=image_data,
             file_data=file_data,
-            use_search=use_search
-        )
-
-        return ChatResponse(
-            session_id=session_id,
-            reply=reply,
-            model_used=normalized_model
+            use_search=request_data.use_search,
+            persist=request_data.persist,
         )
-
-    except ValueError as ve:
-        raise HTTPException(status_code=422, detail=str(ve))
+    except HTTPException:
+        raise
     except Exception:
-        logger.exception("Error processing Upload chat")
+        logger.exception("Error processing fan-out chat")
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        _release_all(tickets)
 
+    if not any(r.status == "ok" for r in results):
+        raise HTTPException(status_code=502, detail={
+            "message": "No model returned an answer",
+            "results": [ModelReply(**vars(r)).model_dump() for r in results],
+        })
 
-@router.post("/stream")
+    attachment = image_data or file_data
+    return FanOutResponse(
+        session_id=request_data.session_id,
+        results=[ModelReply(**vars(r)) for r in results],
+        persisted_model=persisted_model,
+        attachment_id=attachment.attachment_id if attachment else None,
+    )
+
+
+@router.post("/fanout/stream")
 @limiter.limit("5/minute")
-async def handle_chat_stream(
+async def handle_fan_out_stream(
     request: Request,
-    request_data: ChatRequest,
+    request_data: FanOutRequest,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(deps.get_current_user),
+    current_user: Principal = Depends(deps.get_current_user),
 ):
     """
-    Streaming chat via Server-Sent Events (text/event-stream).
-    Each chunk is sent as: data: {"delta": "<text>"}\n\n
+    Streaming fan-out via Server-Sent Events; chunks of all models are
+    interleaved and tagged with their model:
+        data: {"model": "<model>", "delta": "<text>"}\n\n
+        data: {"model": "<model>", "status": "ok" | "error" | "timeout" | "cancelled", ...}\n\n
     The stream ends with: data: [DONE]\n\n
+    Takes an admission slot on every requested model's lane.
     """
-    normalized_model = _validate_model_name(request_data.model)
-
-    image_data = None
-    if request_data.image_base64 and request_data.image_mime_type:
-        _validate_base64(request_data.image_base64, "image_base64")
-        image_data = {"data": request_data.image_base64, "mime_type": request_data.image_mime_type}
-
-    file_data = None
-    if request_data.file_base64 and request_data.file_mime_type:
-        _validate_base64(request_data.file_base64, "file_base64")
-        file_data = {"data": request_data.file_base64, "mime_type": request_data.file_mime_type}
+    models = _validate_fan_out_models(request_data.models)
+    image_data, file_data = await _resolve_attachments(request_data, db, current_user.id)
+    # Admitted before the response starts, so a rejection is a real 503
+    tickets = await _admit_all(models, db, current_user)
 
     async def event_generator():
         try:
-            async for chunk in ChatService.process_chat_stream(
+            async for event in fan_out_stream(
                 session_id=request_data.session_id,
                 prompt=request_data.prompt,
-                model_name=normalized_model,
+                models=models,
                 db=db,
                 user_id=current_user.id,
+                mode=request_data.mode,
+                quorum=request_data.quorum,
+                timeout=request_data.timeout_seconds,
+                timeouts=_fan_out_timeouts(request_data),
                 openai_client=getattr(request.app.state, "openai_client", None),
                 image_data=image_data,
                 file_data=file_data,
                 use_search=request_data.use_search,
+                persist=request_data.persist,
             ):
-                yield f"data: {json.dumps({'delta': chunk})}\n\n"
+                yield f"data: {json.dumps(event)}\n\n"
         except HTTPException as e:
             yield f"data: {json.dumps({'error': e.detail})}\n\n"
         except Exception:
-            logger.exception("Error in stream event generator")
+            logger.exception("Error in fan-out stream event generator")
             yield f"data: {json.dumps({'error': 'Internal server error'})}\n\n"
         finally:
+            _release_all(tickets)
             yield "data: [DONE]\n\n"
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers=_queue_wait_headers(*tickets),
+        # Also releases the slots if the client left before the body started
+        background=BackgroundTask(_release_all, tickets),
+    )
+
+
+@router.get("/sessions", response_model=SessionPage)
+@limiter.limit("60/minute")
+async def list_sessions(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_user),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="`next_cursor` of the previous page"),
+):
+    """
+    Sessions of the current user, most recently active first (keyset-paginated).
+    """
+    try:
+        items, next_cursor = await conversations.list_sessions(db, current_user.id, limit, cursor)
+    except ValueError as ve:
+        raise HTTPException(status_code=422, detail=str(ve))
+    return SessionPage(items=items, next_cursor=next_cursor)
+
+
+@router.get("/sessions/{session_id}/messages", response_model=MessagePage)
+@limiter.limit("60/minute")
+async def list_session_messages(
+    request: Request,
+    session_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_user),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="`next_cursor` of the previous page"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="desc = newest first"),
+):
+    """
+    Messages of a session, keyset-paginated on (timestamp, id).
+    """
+    try:
+        items, next_cursor = await conversations.list_messages(
+            db, current_user.id, session_id, limit, cursor, newest_first=(order == "desc")
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=422, detail=str(ve))
+    return MessagePage(items=items, next_cursor=next_cursor)
+
+
+@router.get("/sessions/{session_id}/export")
+@limiter.limit("5/minute")
+async def export_session(
+    request: Request,
+    session_id: str,
+    current_user: Principal = Depends(deps.get_current_user),
+):
+    """
+    Streams every message of a session as NDJSON (one JSON object per line),
+    oldest first, straight from a server-side cursor.
+    """
+    return StreamingResponse(
+        conversations.export_messages(current_user.id, session_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{_safe_filename(session_id)}.ndjson"'},
+    )
+
+
+def _safe_filename(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", name)[:128] or "session"
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.schemas.usage import ModelUsage, UsageReport, UsageTotals
+from app.services import usage
+from app.db.session import get_db
+from app.core.rate_limit import limiter
+from app.api import deps
+from app.services.auth_cache import Principal
+
+router = APIRouter()
+
+# Period reported when `since` is not given
+DEFAULT_PERIOD = timedelta(days=30)
+
+
+@router.get("/", response_model=UsageReport)
+@limiter.limit("60/minute")
+async def get_usage(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_user),
+    since: Optional[datetime] = Query(None, description="Start of the period (default: 30 days ago)"),
+    until: Optional[datetime] = Query(None, description="End of the period, exclusive (default: now)"),
+):
+    """
+    LLM calls, input/output/cached tokens and average latency of the current
+    user per model, aggregated from the usage recorded with each exchange.
+    """
+    since = _aware(since) if since else datetime.now(timezone.utc) - DEFAULT_PERIOD
+    until = _aware(until) if until else None
+    if until is not None and until <= since:
+        raise HTTPException(status_code=422, detail="`until` must be after `since`")
+
+    models = [ModelUsage(**row) for row in await usage.usage_by_model(db, current_user.id, since, until)]
+    totals = UsageTotals(
+        calls=sum(m.calls for m in models),
+        input_tokens=sum(m.input_tokens for m in models),
+        output_tokens=sum(m.output_tokens for m in models),
+        cached_tokens=sum(m.cached_tokens for m in models),
+    )
+    return UsageReport(since=since, until=until, models=models, totals=totals)
+
+
+def _aware(value: datetime) -> datetime:
+    """Naive query datetimes are taken as UTC."""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
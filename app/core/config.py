@@ -1,5 +1,6 @@
+import os
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List, Set, Any
+from typing import Dict, List, Set, Any
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8')
@@ -18,17 +19,196 @@ class Settings(BaseSettings):
     # Wildcard "*" disables credentials automatically (browser enforces this).
     CORS_ORIGINS: List[str] = ["*"]
 
-    # Maximum number of past messages loaded as context for each LLM request
-    HISTORY_LIMIT: int = 15
+    # Maximum number of past messages fetched per request. The context builder
+    # then trims this window to the model's token budget (see below).
+    HISTORY_LIMIT: int = 50
+
+    # Token budget (history + current prompt, estimated locally) per model alias
+    CONTEXT_TOKEN_BUDGET_DEFAULT: int = 8000
+    CONTEXT_TOKEN_BUDGETS: Dict[str, int] = {
+        "gemini-3.1-pro": 32000,
+        "gemini-3-flash": 16000,
+        "gemini-3.1-flash-lite": 8000,
+        "gpt-5.4-mini": 16000,
+        "gpt-5.4-medium": 16000,
+        "gpt-5.4-high": 32000,
+        "claude-sonnet-4-6": 32000,
+        "claude-haiku-4-5": 16000,
+    }
+
+    # In-process cache of each session's recent history window (write-through on save).
+    # Entries expire after the TTL so other workers' writes are picked up eventually.
+    HISTORY_CACHE_ENABLED: bool = True
+    HISTORY_CACHE_MAX_SESSIONS: int = 10000
+    HISTORY_CACHE_MAX_MB: int = 64
+    HISTORY_CACHE_TTL_SECONDS: int = 120
+
+    # Rolling summary of turns that fall out of the context window (runs in the
+    # background after the reply, with a cheap model)
+    SUMMARY_ENABLED: bool = False
+    SUMMARY_MODEL: str = "gemini-3.1-flash-lite"
+    # Max messages folded into the summary per background run
+    SUMMARY_MAX_MESSAGES: int = 200
+    # Cached summaries are re-read after this, so another worker's compaction is picked up
+    SUMMARY_CACHE_TTL_SECONDS: int = 120
+
+    # Opt-in exact-match reply cache (never used for use_search requests).
+    # "memory" = per-process; or "package.module:ClassName" for a shared backend.
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_BACKEND: str = "memory"
+    RESPONSE_CACHE_MAX_ENTRIES: int = 5000
+    RESPONSE_CACHE_TTL_SECONDS: int = 3600
+
+    # bcrypt cost factor for new password hashes (existing hashes keep their own)
+    BCRYPT_ROUNDS: int = 12
+    # Dedicated password hashing threads per worker, and how many calls may wait
+    # for one before logins/registrations are answered with 503
+    PASSWORD_HASH_WORKERS: int = os.cpu_count() or 1
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+
+    # Database connection pool (per worker). Requests only hold a connection
+    # around their DB reads/writes, never while waiting on an LLM, so a small
+    # pool serves many concurrent streams.
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    # Seconds before a pooled connection is replaced (below server/proxy idle timeouts)
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # asyncpg prepared statement cache per connection (0 behind PgBouncer transaction pooling)
+    DB_STATEMENT_CACHE_SIZE: int = 100
+
+    # Optional read replicas (same driver as DATABASE_URL), as a JSON list.
+    # Plain SELECTs go to a healthy replica round-robin; a replica failing
+    # with a connection error is ejected for DB_REPLICA_EJECT_SECONDS. After a
+    # user's write, their reads stay on the primary for DB_REPLICA_STICKY_SECONDS
+    # (keep it above the replication lag).
+    DATABASE_REPLICA_URLS: List[str] = []
+    DB_REPLICA_EJECT_SECONDS: int = 30
+    DB_REPLICA_STICKY_SECONDS: float = 5.0
+
+    # Per-worker cache of verified bearer tokens (skips JWT decode + user lookup).
+    # A deactivated user is dropped at once in the worker that made the change,
+    # elsewhere within AUTH_CACHE_TTL_SECONDS.
+    AUTH_CACHE_ENABLED: bool = True
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    AUTH_CACHE_TTL_SECONDS: int = 30
+    AUTH_CACHE_NEGATIVE_TTL_SECONDS: int = 10
+
+    # conversation_history partitions (PostgreSQL, monthly on timestamp).
+    # get_history only reads rows newer than HISTORY_LOOKBACK_DAYS, so the
+    # planner prunes older partitions (0 = no cutoff).
+    HISTORY_LOOKBACK_DAYS: int = 365
+    HISTORY_PARTITION_MONTHS_AHEAD: int = 3
+    # Partitions older than this many months are dropped (0 = keep forever),
+    # after being archived as gzip CSV under HISTORY_ARCHIVE_DIR if enabled
+    HISTORY_RETENTION_MONTHS: int = 0
+    HISTORY_ARCHIVE_ENABLED: bool = True
+    HISTORY_ARCHIVE_DIR: str = "data/archive"
+    HISTORY_MAINTENANCE_INTERVAL_SECONDS: int = 6 * 3600
+
+    # Persistence of chat exchanges:
+    #   "direct"     - one commit per exchange, awaited before the reply (default)
+    #   "await"      - batched, but the request waits for its batch to commit
+    #   "background" - batched write-behind, the reply doesn't wait for the DB
+    #                  (opt-in: a crash can lose up to one flush interval of exchanges)
+    EXCHANGE_WRITE_MODE: str = "direct"
+    EXCHANGE_WRITER_BATCH_SIZE: int = 200
+    EXCHANGE_WRITER_FLUSH_MS: int = 50
+    # Queued exchanges per worker before requests wait to enqueue (backpressure)
+    EXCHANGE_WRITER_MAX_PENDING: int = 5000
 
     # Set to false for plain-text logs during local development
     JSON_LOGS: bool = True
 
-    # Maximum size of uploaded files in MB (enforced before reading into memory)
+    # Maximum size of uploaded files in MB (enforced while the body streams in,
+    # and up front from Content-Length)
     MAX_UPLOAD_SIZE_MB: int = 10
 
+    # Content-addressed attachment store (local disk, LRU size cap) so clients can
+    # re-send an attachment by id instead of bytes
+    ATTACHMENT_STORE_ENABLED: bool = True
+    ATTACHMENT_STORE_DIR: str = "data/attachments"
+    ATTACHMENT_STORE_MAX_MB: int = 2048
+    # Stored attachments at least this large are uploaded once to the Gemini
+    # Files API and referenced by URI on later turns
+    GEMINI_FILE_UPLOAD_MIN_BYTES: int = 1024 * 1024
+
+    # Uploads handled concurrently per worker; with MAX_UPLOAD_SIZE_MB this fixes
+    # the attachment memory ceiling (uploads beyond it wait for a slot)
+    UPLOAD_MAX_CONCURRENT: int = 8
+
     # Timeout in seconds for LLM API calls (applies to non-streaming generate())
     LLM_TIMEOUT_SECONDS: int = 60
+    # Per-model timeout of each fan-out call, e.g. {"gemini-3.1-flash-lite": 10};
+    # models not listed use LLM_TIMEOUT_SECONDS
+    FAN_OUT_TIMEOUT_SECONDS_BY_MODEL: Dict[str, float] = {}
+
+    # Shared HTTP connection pool per LLM vendor (see app/services/provider_registry.py)
+    LLM_POOL_MAX_CONNECTIONS: int = 100
+    LLM_POOL_MAX_KEEPALIVE: int = 20
+    LLM_POOL_KEEPALIVE_EXPIRY: float = 30.0
+
+    # Rate limits (see app/core/rate_limit.py), keyed by user id with IP fallback.
+    # "memory://" keeps counters per worker; "redis://host:6379/0" (pip install
+    # redis) shares them across workers. Strategy: moving-window,
+    # sliding-window-counter or fixed-window.
+    RATE_LIMIT_STORAGE_URI: str = "memory://"
+    RATE_LIMIT_STRATEGY: str = "moving-window"
+    # Per-user LLM token budget (history + prompt + reply, estimated locally),
+    # one or more windows separated by ";", e.g. "2000000/hour;10000000/day".
+    # Every call is charged its whole context (up to CONTEXT_TOKEN_BUDGETS), so
+    # size it for long sessions. Empty (the default) disables it.
+    LLM_TOKEN_BUDGET: str = ""
+
+    # Per-vendor circuit breaker + adaptive (AIMD) concurrency limit around every
+    # LLM call attempt (see app/services/provider_guard.py). The circuit opens
+    # after FAILURE_THRESHOLD consecutive rate-limit/timeout/5xx failures and
+    # fails calls fast for OPEN_SECONDS; calls beyond the concurrency limit wait
+    # up to QUEUE_TIMEOUT seconds.
+    PROVIDER_GUARD_ENABLED: bool = True
+    PROVIDER_BREAKER_FAILURE_THRESHOLD: int = 5
+    PROVIDER_BREAKER_OPEN_SECONDS: float = 30.0
+    PROVIDER_BREAKER_HALF_OPEN_PROBES: int = 1
+    PROVIDER_LIMIT_INITIAL: int = 20
+    PROVIDER_LIMIT_MIN: int = 2
+    PROVIDER_LIMIT_MAX: int = 100
+    PROVIDER_LIMIT_QUEUE_TIMEOUT: float = 5.0
+
+    # Admission control in front of the chat endpoints (app/services/admission.py):
+    # at most MAX_IN_FLIGHT requests per requested model (or tier) run at once,
+    # up to MAX_QUEUE more wait, best priority class first (PRIORITIES is ordered
+    # best to worst). A request that can't start within its class deadline gets
+    # a 503 with Retry-After. Classes are assigned per user email, else per
+    # model, else ADMISSION_DEFAULT_PRIORITY.
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_IN_FLIGHT: int = 32
+    ADMISSION_MAX_IN_FLIGHT_BY_MODEL: Dict[str, int] = {}
+    ADMISSION_MAX_QUEUE: int = 100
+    ADMISSION_PRIORITIES: List[str] = ["high", "normal", "low"]
+    ADMISSION_DEFAULT_PRIORITY: str = "normal"
+    ADMISSION_DEADLINE_SECONDS: Dict[str, float] = {"high": 30.0, "normal": 10.0, "low": 3.0}
+    ADMISSION_USER_PRIORITY: Dict[str, str] = {}
+    ADMISSION_MODEL_PRIORITY: Dict[str, str] = {}
+
+    # Model used when a request doesn't name one
+    DEFAULT_MODEL: str = "gemini-3.1-pro"
+
+    # Model routing: requests for "auto" (= MODEL_ROUTER_DEFAULT_TIER) or a tier
+    # name go to the tier's healthiest model and fail over to the next one on
+    # rate limits / timeouts / outages. Policies: "latency" (rolling p95 and
+    # error rate per model) or "static" (tier order). See app/services/model_router.py
+    MODEL_TIERS: Dict[str, List[str]] = {
+        "fast": ["gemini-3.1-flash-lite", "claude-haiku-4-5", "gpt-5.4-mini"],
+        "balanced": ["gemini-3-flash", "gpt-5.4-medium", "claude-sonnet-4-6"],
+        "best": ["gemini-3.1-pro", "gpt-5.4-high", "claude-sonnet-4-6"],
+    }
+    MODEL_ROUTER_DEFAULT_TIER: str = "balanced"
+    MODEL_ROUTER_POLICY: str = "latency"
+    MODEL_ROUTER_WINDOW: int = 200
+    MODEL_ROUTER_MAX_AGE_SECONDS: float = 300.0
+    MODEL_ROUTER_MIN_SAMPLES: int = 5
+    MODEL_ROUTER_MAX_ERROR_RATE: float = 0.5
 
     # Supported models
     ALLOWED_MODELS_LIST: List[str] = [
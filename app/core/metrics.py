@@ -0,0 +1,243 @@
+"""
+In-process metrics, served in the Prometheus text format at GET /metrics.
+
+Counters and histograms are plain objects updated only from the event loop
+thread, so they need no locks: an update is a dict lookup for the label
+values, a bisect and two additions. Each labelled series is created on first
+use and cached; hot paths with fixed labels bind the series once at import
+time. `Collected` metrics are read from existing stats (provider guards,
+admission queue, ...) only when /metrics is scraped.
+"""
+import functools
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Upper bounds in seconds, from a cache hit to a long generation
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+
+    def register(self, metric: "_Metric") -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    @abstractmethod
+    def samples(self) -> Iterable[str]:
+        pass
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One slot per bucket plus +Inf; made cumulative only when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _LabelledMetric(_Metric):
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self._children: Dict[Labels, object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    @abstractmethod
+    def _new_child(self):
+        pass
+
+    def labels(self, *values: str):
+        """The series for these label values (in `labelnames` order)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+
+class Counter(_LabelledMetric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._children[()].inc(amount)
+
+    def samples(self) -> Iterable[str]:
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Histogram(_LabelledMetric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Registry = REGISTRY,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._children[()].observe(value)
+
+    def samples(self) -> Iterable[str]:
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {repr(child.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+def timed(series: "_HistogramChild | Histogram"):
+    """Observes the run time of an async function (every call, success or not) in `series`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                series.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class Collected(_Metric):
+    """Gauge or counter whose series `collect()` returns as (label values, value) at scrape time."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[Labels, float]]],
+        kind: str = "gauge",
+        registry: Registry = REGISTRY,
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self) -> Iterable[str]:
+        for values, value in self.collect():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+# Hot-path metrics
+HISTORY_LOAD_SECONDS = Histogram(
+    "chat_history_load_seconds", "Time to load a session's history window.", ["source"]
+)
+SAVE_EXCHANGE_SECONDS = Histogram(
+    "chat_save_exchange_seconds", "Time spent in save_exchange (direct commit or hand-off to the writer)."
+)
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_time_to_first_token_seconds", "Time from opening a provider stream to its first chunk.", ["model"]
+)
+LLM_GENERATION_SECONDS = Histogram(
+    "llm_generation_seconds", "Total time of a provider call, retries included.", ["model", "call"]
+)
+LLM_ERRORS = Counter(
+    "llm_errors_total", "Provider calls that failed, by exception class.", ["model", "exception"]
+)
+LLM_RETRIES = Counter(
+    "llm_retries_total", "Provider call attempts retried by tenacity, by exception class.", ["vendor", "exception"]
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Time waiting for a pooled database connection."
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_seconds", "bcrypt time per call, excluding the wait for a worker.", ["op"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0),
+)
+ADMISSION_QUEUE_WAIT_SECONDS = Histogram(
+    "admission_queue_wait_seconds", "Time chat requests waited in the admission queue before starting.", ["model"]
+)
+CHAT_STREAM_FIRST_CHUNK_SECONDS = Histogram(
+    "chat_stream_time_to_first_chunk_seconds",
+    "Time from the start of a /chat/stream request to its first chunk (history and routing included).",
+    ["model"],
+)
+CHAT_STREAM_DURATION_SECONDS = Histogram(
+    "chat_stream_duration_seconds", "Total duration of a chat stream.", ["model"]
+)
+CHAT_STREAM_CHUNK_GAP_SECONDS = Histogram(
+    "chat_stream_chunk_gap_seconds", "Time between consecutive chunks of a chat stream.", ["model"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+CHAT_STREAM_TOKENS_PER_SECOND = Histogram(
+    "chat_stream_tokens_per_second", "Output tokens per second after the first chunk (estimated tokens).", ["model"],
+    buckets=(5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500),
+)
+CHAT_STREAM_CHUNKS = Counter("chat_stream_chunks_total", "Chunks sent on chat streams.", ["model"])
+CHAT_STREAM_BYTES = Counter("chat_stream_bytes_total", "UTF-8 bytes of text sent on chat streams.", ["model"])
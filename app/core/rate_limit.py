@@ -1,5 +1,96 @@
+"""
+Request rate limits (slowapi) and per-user LLM token budgets.
+
+Both are keyed by the authenticated user (get_current_user stores the id on
+`request.state`), falling back to the client IP for anonymous endpoints such
+as login, so users behind one NAT no longer share a budget.
+
+Counters live in the storage backend of RATE_LIMIT_STORAGE_URI: "memory://"
+(default) is per worker; "redis://host:6379/0" (needs the `redis` package)
+shares one budget across all workers and hosts. RATE_LIMIT_STRATEGY picks the
+algorithm: "moving-window" (sliding log, default), "sliding-window-counter"
+or "fixed-window"; the limits library updates the counters atomically.
+"""
+import math
+import time
+from typing import Dict, List
+
+from fastapi import Request
+from limits import RateLimitItem, parse_many
+from limits.storage import storage_from_string
+from limits.strategies import STRATEGIES
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
-# Initialize the global Limiter with 'get_remote_address' (client IP) as the key function
-limiter = Limiter(key_func=get_remote_address)
+from app.core.config import settings
+
+
+def rate_limit_key(request: Request) -> str:
+    """Authenticated user id if known, else the client IP."""
+    user_id = getattr(request.state, "user_id", None)
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"ip:{get_remote_address(request)}"
+
+
+# Initialize the global Limiter, keyed by user (IP fallback) on the shared storage
+limiter = Limiter(
+    key_func=rate_limit_key,
+    storage_uri=settings.RATE_LIMIT_STORAGE_URI,
+    strategy=settings.RATE_LIMIT_STRATEGY,
+)
+
+
+class TokenBudgetExceeded(Exception):
+    def __init__(self, limit: str, retry_after: float):
+        super().__init__(f"LLM token budget of {limit} exceeded")
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class TokenBudget:
+    """
+    Per-user budget of LLM tokens (history + prompt + reply) over one or more
+    windows, e.g. "200000/hour;1000000/day". `check` runs before a model call
+    and `charge` after it, with the tokens actually used; a charge larger than
+    what is left exhausts the window, so the next request is the one refused.
+    """
+
+    NAMESPACE = "llm-tokens"
+
+    def __init__(self, limits: str, storage_uri: str, strategy: str):
+        self.items: List[RateLimitItem] = parse_many(limits) if limits else []
+        self.strategy = STRATEGIES[strategy](storage_from_string(storage_uri))
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.items)
+
+    def check(self, user_id: int, tokens: int = 1) -> None:
+        """Raises TokenBudgetExceeded if `tokens` more would not fit in every window."""
+        for item in self.items:
+            if not self.strategy.test(item, self.NAMESPACE, str(user_id), cost=max(1, tokens)):
+                stats = self.strategy.get_window_stats(item, self.NAMESPACE, str(user_id))
+                raise TokenBudgetExceeded(str(item), max(1.0, stats.reset_time - time.time()))
+
+    def charge(self, user_id: int, tokens: int) -> None:
+        if tokens <= 0:
+            return
+        for item in self.items:
+            if not self.strategy.hit(item, self.NAMESPACE, str(user_id), cost=tokens):
+                remaining = self.strategy.get_window_stats(item, self.NAMESPACE, str(user_id)).remaining
+                if remaining > 0:
+                    self.strategy.hit(item, self.NAMESPACE, str(user_id), cost=remaining)
+
+    def remaining(self, user_id: int) -> Dict[str, int]:
+        return {
+            str(item): self.strategy.get_window_stats(item, self.NAMESPACE, str(user_id)).remaining
+            for item in self.items
+        }
+
+
+def retry_after_header(retry_after: float) -> Dict[str, str]:
+    return {"Retry-After": str(math.ceil(retry_after))}
+
+
+llm_token_budget = TokenBudget(settings.LLM_TOKEN_BUDGET, settings.RATE_LIMIT_STORAGE_URI, settings.RATE_LIMIT_STRATEGY)
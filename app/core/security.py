@@ -1,12 +1,91 @@
 import asyncio
-from typing import Any, Union
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar, Union
 from datetime import datetime, timedelta, timezone
 from jose import jwt
 from passlib.context import CryptContext
 from app.core.config import settings
+from app.core.metrics import PASSWORD_HASH_SECONDS
 
 # Security configuration for password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+T = TypeVar("T")
+
+
+class PasswordHashBusy(Exception):
+    """Raised when the password hashing queue is full (callers answer 503)."""
+
+
+class PasswordHashPool:
+    """
+    Dedicated, bounded thread pool for bcrypt.
+
+    bcrypt releases the GIL, so threads give real parallelism up to `workers`;
+    keeping them apart from the default executor means a login storm cannot
+    starve other `asyncio.to_thread` work. Calls beyond `workers + max_queue`
+    outstanding are rejected instead of piling up unbounded latency.
+    Single event loop -> plain counters, no locking needed.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._wait_ms = 0.0
+        self._run_ms = 0.0
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PasswordHashBusy("Password hashing queue is full")
+
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            return started, fn(*args), time.perf_counter()
+
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        # Released when the executor is really done with the job (finished, or
+        # cancelled before it started), not when the awaiting request is cancelled
+        job_future = self._executor.submit(job)
+        job_future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        started, result, finished = await asyncio.wrap_future(job_future)
+        self.completed += 1
+        self._wait_ms += (started - submitted) * 1000
+        self._run_ms += (finished - started) * 1000
+        PASSWORD_HASH_SECONDS.labels(fn.__name__).observe(finished - started)
+        return result
+
+    def _release(self) -> None:
+        self.pending -= 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "workers": self.workers,
+            "in_flight": min(self.pending, self.workers),
+            "queued": max(self.pending - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self._wait_ms / self.completed, 2) if self.completed else 0.0,
+            "avg_hash_ms": round(self._run_ms / self.completed, 2) if self.completed else 0.0,
+        }
+
+
+# Global pool; shut down in the app lifespan
+password_hash_pool = PasswordHashPool(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+)
 
 def create_access_token(
     subject: Union[str, Any], expires_delta: timedelta = None
@@ -21,9 +100,9 @@ def create_access_token(
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 async def get_password_hash(password: str) -> str:
-    # Use to_thread because hashing is CPU-intensive and synchronous
-    return await asyncio.to_thread(pwd_context.hash, password)
+    # Hashing is CPU-intensive and synchronous: run it on the dedicated pool
+    return await password_hash_pool.run(pwd_context.hash, password)
 
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
-    # Also use to_thread for verification to avoid blocking the event loop
-    return await asyncio.to_thread(pwd_context.verify, plain_password, hashed_password)
+    # Also on the dedicated pool, to avoid blocking the event loop
+    return await password_hash_pool.run(pwd_context.verify, plain_password, hashed_password)
@@ -0,0 +1,62 @@
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class BodySizeLimitMiddleware:
+    """
+    Rejects oversized request bodies before they are buffered or spooled.
+
+    - Multipart bodies (file uploads) and other bodies (JSON, which may carry
+      base64 attachments) have separate limits.
+    - Requests whose Content-Length exceeds the limit get 413 without reading the body.
+    - Chunked/streamed bodies are counted as they are received; once the running
+      total passes the limit, HTTPException(413) is raised from `receive`, which
+      aborts multipart parsing (FastAPI re-raises HTTPExceptions from the body reader).
+
+    The endpoints still check the exact per-file limit; this is the coarse,
+    early guard against memory/disk exhaustion.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_bytes: int, max_multipart_bytes: int):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.max_multipart_bytes = max_multipart_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.max_body_bytes
+        declared = 0
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+            elif name == b"content-type" and value.startswith(b"multipart/"):
+                limit = self.max_multipart_bytes
+
+        if declared > limit:
+            response = JSONResponse({"detail": self._detail(limit)}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=self._detail(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    def _detail(limit: int) -> str:
+        return f"Request body too large. Maximum is {limit // (1024 * 1024)} MB."
@@ -1,18 +1,20 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Index, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, Index, Boolean, ForeignKey, UniqueConstraint
 from sqlalchemy.sql import func
 from app.db.base import Base
 
 class ConversationHistory(Base):
     __tablename__ = "conversation_history"
 
-    id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String, nullable=False, index=True)
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String, nullable=False)
     role = Column(String, nullable=False)  # "user" or "model"
     content = Column(Text, nullable=False)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
 
-    # Composite indexes for efficient history queries
+    # Composite indexes for efficient history queries. On PostgreSQL the table
+    # is range-partitioned by month on `timestamp` with primary key
+    # (id, timestamp); see migration e5f6a7b8c9d0 and app/db/partitions.py.
     __table_args__ = (
         Index('ix_session_id_timestamp', "session_id", "timestamp"),
         Index('ix_conv_history_user_session', "user_id", "session_id", "timestamp"),
@@ -21,6 +23,73 @@ class ConversationHistory(Base):
     def __repr__(self):
         return f"<ConversationHistory(session_id='{self.session_id}', role='{self.role}')>"
 
+class ConversationSummary(Base):
+    """Rolling summary of the turns that fell out of a session's context window."""
+    __tablename__ = "conversation_summary"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    session_id = Column(String, nullable=False)
+    summary = Column(Text, nullable=False)
+    # Highest conversation_history.id folded into `summary`
+    covered_through_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "session_id", name="uq_conv_summary_user_session"),
+    )
+
+    def __repr__(self):
+        return f"<ConversationSummary(session_id='{self.session_id}', through={self.covered_through_id})>"
+
+class StoredAttachment(Base):
+    """Metadata for a content-addressed attachment (bytes live in the local attachment store)."""
+    __tablename__ = "attachments"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    mime_type = Column(String, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Provider-side handle (Gemini Files API), reused until it expires
+    gemini_file_uri = Column(String, nullable=True)
+    gemini_file_expires_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "sha256", name="uq_attachments_user_sha256"),
+    )
+
+    def __repr__(self):
+        return f"<StoredAttachment(sha256='{self.sha256[:12]}', mime_type='{self.mime_type}')>"
+
+class LLMUsage(Base):
+    """Tokens and latency of one LLM call, saved with the exchange it answered."""
+    __tablename__ = "llm_usage"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    session_id = Column(String, nullable=False)
+    # conversation_history.id of the exchange's model reply (no FK: that table is partitioned)
+    message_id = Column(Integer, nullable=True)
+    model = Column(String, nullable=False)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)
+    # Counts estimated locally because the provider reported none
+    estimated = Column(Boolean, nullable=False, default=False)
+    latency_ms = Column(Float, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_llm_usage_user_created", "user_id", "created_at"),
+        Index("ix_llm_usage_model_created", "model", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<LLMUsage(model='{self.model}', input={self.input_tokens}, output={self.output_tokens})>"
+
 class User(Base):
     __tablename__ = "users"
 
@@ -0,0 +1,208 @@
+"""
+Monthly partition maintenance for conversation_history (PostgreSQL only).
+
+The partitioned table is created by migration e5f6a7b8c9d0. This module keeps
+it healthy at runtime: it creates the partitions for the coming months and,
+when a retention period is set, archives partitions older than it to
+gzip-compressed CSV files before dropping them. A no-op on other databases
+or if the table isn't partitioned.
+"""
+import asyncio
+import gzip
+import logging
+import os
+import re
+from datetime import date
+from pathlib import Path
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "conversation_history"
+_PARTITION_RE = re.compile(rf"^{PARENT_TABLE}_(\d{{4}})_(\d{{2}})$")
+
+
+def _add_months(d: date, months: int) -> date:
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_{month:%Y_%m}"
+
+
+async def _is_partitioned(conn) -> bool:
+    result = await conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+    ), {"name": PARENT_TABLE})
+    return result.first() is not None
+
+
+async def _monthly_partitions(conn) -> List[str]:
+    result = await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :name AND pg_table_is_visible(p.oid)"
+    ), {"name": PARENT_TABLE})
+    return sorted(name for (name,) in result.all() if _PARTITION_RE.match(name))
+
+
+async def _detached_partitions(conn) -> List[str]:
+    """Monthly tables no longer attached to the parent (left by an interrupted retention run)."""
+    result = await conn.execute(text(
+        "SELECT c.relname FROM pg_class c "
+        "WHERE c.relkind = 'r' AND NOT c.relispartition AND pg_table_is_visible(c.oid) "
+        "AND c.relname LIKE :prefix"
+    ), {"prefix": f"{PARENT_TABLE}\\_%"})
+    return sorted(name for (name,) in result.all() if _PARTITION_RE.match(name))
+
+
+async def ensure_partitions(engine: AsyncEngine, months_ahead: int, today: Optional[date] = None) -> List[str]:
+    """Creates the monthly partitions from the current month to `months_ahead` months ahead."""
+    current = (today or date.today()).replace(day=1)
+    created = []
+    async with engine.begin() as conn:
+        if conn.dialect.name != "postgresql" or not await _is_partitioned(conn):
+            return created
+        existing = set(await _monthly_partitions(conn))
+        for offset in range(months_ahead + 1):
+            month = _add_months(current, offset)
+            name = partition_name(month)
+            if name in existing:
+                continue
+            # Rows for a new month may already sit in the DEFAULT partition
+            # (e.g. the app was down at the month boundary); Postgres refuses to
+            # attach over them, so they are moved in the same transaction.
+            start, end = month.isoformat(), _add_months(month, 1).isoformat()
+            await conn.execute(text(
+                f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            ))
+            moved = await conn.execute(text(
+                f"WITH moved AS (DELETE FROM {PARENT_TABLE}_default "
+                f"WHERE \"timestamp\" >= '{start}' AND \"timestamp\" < '{end}' RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ))
+            await conn.execute(text(
+                f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"
+            ))
+            created.append(name)
+            if moved.rowcount:
+                logger.warning(f"Moved {moved.rowcount} rows from the default partition into {name}")
+    if created:
+        logger.info(f"Created partitions: {', '.join(created)}")
+    return created
+
+
+async def _archive(conn, name: str, archive_dir: Path) -> Path:
+    """Streams the partition to `<archive_dir>/<name>.csv.gz` with COPY (asyncpg)."""
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    path = archive_dir / f"{name}.csv.gz"
+    tmp = path.with_suffix(".gz.tmp")
+    raw = await conn.get_raw_connection()
+    out = await asyncio.to_thread(gzip.open, tmp, "wb")
+    try:
+        async def write(chunk: bytes) -> None:
+            await asyncio.to_thread(out.write, chunk)
+
+        await raw.driver_connection.copy_from_table(name, output=write, format="csv", header=True)
+    finally:
+        await asyncio.to_thread(out.close)
+    os.replace(tmp, path)
+    return path
+
+
+async def apply_retention(
+    engine: AsyncEngine, keep_months: int, archive_dir: Optional[str], today: Optional[date] = None
+) -> List[str]:
+    """
+    Drops monthly partitions that end before the last `keep_months` months,
+    archiving each one first when `archive_dir` is set. Returns the dropped names.
+
+    A partition whose archive or drop fails stays detached and is picked up
+    again by the next run.
+    """
+    if keep_months <= 0:
+        return []
+    cutoff = partition_name(_add_months((today or date.today()).replace(day=1), -keep_months))
+    dropped = []
+    async with engine.connect() as conn:
+        if conn.dialect.name != "postgresql" or not await _is_partitioned(conn):
+            return dropped
+        attached = [name for name in await _monthly_partitions(conn) if name < cutoff]
+        detached = [name for name in await _detached_partitions(conn) if name < cutoff]
+        await conn.commit()
+
+        for name in sorted(attached + detached):
+            try:
+                if name in attached:
+                    # Detach first: queries stop seeing the partition, and the
+                    # COPY below doesn't hold a lock on the parent table.
+                    await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+                    await conn.commit()
+                if archive_dir:
+                    path = await _archive(conn, name, Path(archive_dir))
+                    logger.info(f"Archived {name} to {path}")
+                await conn.execute(text(f"DROP TABLE {name}"))
+                await conn.commit()
+            except Exception as e:
+                await conn.rollback()
+                logger.error(f"Retention of {name} failed (retried on the next run): {e}")
+                continue
+            dropped.append(name)
+    if dropped:
+        logger.info(f"Retention dropped partitions: {', '.join(dropped)}")
+    return dropped
+
+
+class PartitionMaintenance:
+    """Runs ensure_partitions + apply_retention at startup and then every `interval` seconds."""
+
+    def __init__(self, engine: AsyncEngine, interval: float):
+        self.engine = engine
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run_once(self) -> None:
+        await ensure_partitions(self.engine, settings.HISTORY_PARTITION_MONTHS_AHEAD)
+        archive_dir = settings.HISTORY_ARCHIVE_DIR if settings.HISTORY_ARCHIVE_ENABLED else None
+        await apply_retention(self.engine, settings.HISTORY_RETENTION_MONTHS, archive_dir)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Partition maintenance failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+if __name__ == "__main__":
+    # One-off run (e.g. from cron when the API isn't running): python -m app.db.partitions
+    from app.db.session import engine
+
+    async def _main() -> None:
+        await PartitionMaintenance(engine, interval=0).run_once()
+        await engine.dispose()
+
+    asyncio.run(_main())
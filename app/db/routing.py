@@ -0,0 +1,145 @@
+"""
+Read-replica routing for the ORM session.
+
+RoutingSession sends plain SELECTs to a healthy replica (round-robin) and
+everything else - flushes, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE - to
+the primary. Read-your-writes: once a session has written, its reads stay on
+the primary, and so do reads tagged with a user who wrote in the last
+`sticky_seconds` (replication lag window). A replica that fails with a
+connection-level error is ejected for `eject_seconds` and the read is retried
+once on the next candidate. With no replicas configured everything goes to
+the primary.
+"""
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaRouter:
+    """Replica pool with round-robin selection, error-based ejection and write stickiness."""
+
+    def __init__(self, primary: AsyncEngine, replicas: List[AsyncEngine], eject_seconds: float, sticky_seconds: float):
+        self.primary = primary.sync_engine
+        self.replicas = [r.sync_engine for r in replicas]
+        self.eject_seconds = eject_seconds
+        self.sticky_seconds = sticky_seconds
+        self._cycle = itertools.cycle(range(len(self.replicas)))
+        self._ejected_until: Dict[int, float] = {}
+        self._recent_writes: Dict[Any, float] = {}
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.ejections = 0
+
+    def pick(self) -> Engine:
+        """Next healthy replica, or the primary if none is available."""
+        now = time.monotonic()
+        for _ in range(len(self.replicas)):
+            i = next(self._cycle)
+            if self._ejected_until.get(i, 0.0) <= now:
+                self.replica_reads += 1
+                return self.replicas[i]
+        self.primary_reads += 1
+        return self.primary
+
+    def eject(self, bind: Engine, error: Exception) -> None:
+        for i, replica in enumerate(self.replicas):
+            if replica is bind:
+                self._ejected_until[i] = time.monotonic() + self.eject_seconds
+                self.ejections += 1
+                logger.warning(f"Ejected DB replica {replica.url.render_as_string()} for {self.eject_seconds:.0f}s: {error}")
+
+    def mark_written(self, key: Any) -> None:
+        """Pins reads for `key` (e.g. a user id) to the primary for `sticky_seconds`."""
+        if key is None or not self.replicas:
+            return
+        now = time.monotonic()
+        self._recent_writes[key] = now + self.sticky_seconds
+        # Opportunistic cleanup keeps the map bounded by the write rate
+        if len(self._recent_writes) > 10000:
+            self._recent_writes = {k: t for k, t in self._recent_writes.items() if t > now}
+
+    def is_sticky(self, key: Any) -> bool:
+        until = self._recent_writes.get(key)
+        return until is not None and until > time.monotonic()
+
+    def stats(self) -> Dict[str, int]:
+        now = time.monotonic()
+        return {
+            "replicas": len(self.replicas),
+            "healthy": sum(1 for i in range(len(self.replicas)) if self._ejected_until.get(i, 0.0) <= now),
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "ejections": self.ejections,
+        }
+
+
+def _is_connection_error(error: Exception) -> bool:
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated or isinstance(error, (OperationalError, InterfaceError))
+    return isinstance(error, OSError)
+
+
+class RoutingSession(Session):
+    """
+    Session whose `get_bind` picks primary or replica per statement.
+    Tag a session with `session.info["user_id"]` to enable cross-request
+    read-your-writes, or call `use_primary` to pin it to the primary.
+    """
+
+    def __init__(self, *args, router: Optional[ReplicaRouter] = None, **kw):
+        super().__init__(*args, **kw)
+        self.router = router
+        self._wrote = False
+        self._replica: Optional[Engine] = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        self._replica = None
+        router = self.router
+        if router is None or not router.replicas:
+            return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+        is_read = isinstance(clause, Select) and clause._for_update_arg is None and not self._flushing
+        if not is_read:
+            self._wrote = True
+            return router.primary
+        if self._wrote or self.info.get("primary") or router.is_sticky(self.info.get("user_id")):
+            router.primary_reads += 1
+            return router.primary
+
+        bind = router.pick()
+        self._replica = bind if bind is not router.primary else None
+        return bind
+
+    def execute(self, statement, *args, **kw):
+        try:
+            return super().execute(statement, *args, **kw)
+        except Exception as e:
+            replica = self._replica
+            if replica is None or not _is_connection_error(e) or self._wrote or self.new or self.dirty:
+                raise
+            # Read-only session: nothing to lose by resetting it and retrying elsewhere
+            self.router.eject(replica, e)
+            self.rollback()
+            return super().execute(statement, *args, **kw)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session: RoutingSession) -> None:
+    # `_wrote` stays set: the rest of this session keeps reading from the primary
+    if session._wrote and session.router is not None:
+        session.router.mark_written(session.info.get("user_id"))
+
+
+def use_primary(db: AsyncSession) -> None:
+    """Sends every later query of this session to the primary (read-modify-write flows)."""
+    db.info["primary"] = True
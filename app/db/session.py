@@ -1,11 +1,58 @@
+import time
+
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
+from app.core.metrics import DB_POOL_CHECKOUT_SECONDS
+from app.db.routing import ReplicaRouter, RoutingSession
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """The default async queue pool, recording how long each checkout waits."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+
+def _engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {}
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+    if "+asyncpg" in url:
+        # asyncpg's own statement cache and SQLAlchemy's prepared statement cache
+        # (both must be 0 behind PgBouncer in transaction mode)
+        options["connect_args"] = {
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        }
+    return options
 
-# Asynchronous database engine
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    pool_pre_ping=True,
+
+def _create_engine(url: str):
+    return create_async_engine(url, pool_pre_ping=settings.DB_POOL_PRE_PING, **_engine_options(url))
+
+
+# Asynchronous database engine (primary)
+engine = _create_engine(settings.DATABASE_URL)
+
+# Optional read replicas; sessions route SELECTs to them (see app/db/routing.py)
+replica_engines = [_create_engine(url) for url in settings.DATABASE_REPLICA_URLS]
+replica_router = ReplicaRouter(
+    engine,
+    replica_engines,
+    eject_seconds=settings.DB_REPLICA_EJECT_SECONDS,
+    sticky_seconds=settings.DB_REPLICA_STICKY_SECONDS,
 )
 
 # Asynchronous session factory
@@ -13,6 +60,8 @@ engine = create_async_engine(
 AsyncSessionLocal = sessionmaker(
     bind=engine,
     class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    router=replica_router,
     autocommit=False,
     autoflush=False,
     expire_on_commit=False,
@@ -22,3 +71,14 @@ AsyncSessionLocal = sessionmaker(
 async def get_db() -> AsyncSession:
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def release_connection(db: AsyncSession) -> None:
+    """
+    Ends the session's current (read) transaction so its connection goes back
+    to the pool. The session stays usable and checks a connection out again on
+    its next query. Call it before waiting on anything slow, such as an LLM
+    call, so a request doesn't hold a pooled connection while it waits.
+    """
+    if db.in_transaction():
+        await db.commit()
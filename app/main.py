@@ -4,24 +4,37 @@ import sys
 from contextlib import asynccontextmanager
 from app.core.logging import configure_logging
 from app.core.request_id import RequestIDMiddleware
+from app.core.upload_limit import BodySizeLimitMiddleware
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import text
 from alembic.config import Config as AlembicConfig
 from alembic import command as alembic_command
 from app.api.v1.api import api_router
-from app.db.session import engine
+from app.db.session import engine, replica_router
+from app.db.partitions import PartitionMaintenance
 from app.core.config import settings
+from app.core.metrics import REGISTRY, Collected
 from app.core.rate_limit import limiter
+from app.core.security import password_hash_pool
 from slowapi.errors import RateLimitExceeded
 from slowapi import _rate_limit_exceeded_handler
-from google import genai
-from openai import AsyncOpenAI
-import anthropic
+from app.services.provider_registry import provider_registry
+from app.services.history_cache import history_cache
+from app.services.auth_cache import auth_cache
+from app.services.summarizer import session_summaries
+from app.services.exchange_writer import exchange_writer
+from app.services.response_cache import response_cache
+from app.services.model_router import model_router
+from app.services.provider_guard import provider_guards
+from app.services.admission import admission
 
 configure_logging(json_logs=settings.JSON_LOGS)
 logger = logging.getLogger("main")
 
+partition_maintenance = PartitionMaintenance(engine, interval=settings.HISTORY_MAINTENANCE_INTERVAL_SECONDS)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -40,34 +53,27 @@ async def lifespan(app: FastAPI):
         logger.critical(f"DB MIGRATION ERROR: {e}")
         sys.exit(1)
 
-    # 2) Google GenAI (SDK 2025 Check)
-    try:
-        if not settings.GOOGLE_API_KEY:
-            raise ValueError("GOOGLE_API_KEY missing")
-        genai.Client(api_key=settings.GOOGLE_API_KEY)
-        logger.info("Google GenAI Client (v1.51+): Configured.")
-    except Exception as e:
-        logger.error(f"Google Client Error: {e}")
-
-    # 3) OpenAI check
-    if settings.OPENAI_API_KEY:
-        try:
-            app.state.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-            logger.info("OpenAI Client: Ready.")
-        except Exception as e:
-            logger.error(f"OpenAI Error: {e}")
-            app.state.openai_client = None
-
-    # 4) Anthropic check
-    if settings.ANTHROPIC_API_KEY:
-        try:
-            anthropic.AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY)
-            logger.info("Anthropic Client: Ready.")
-        except Exception as e:
-            logger.error(f"Anthropic Error: {e}")
+    # 2) LLM clients — one long-lived client (and connection pool) per vendor,
+    #    shared by every request through the provider registry.
+    provider_registry.startup()
+    app.state.openai_client = provider_registry.openai_client
+
+    # 3) Write-behind queue for chat exchanges (see EXCHANGE_WRITE_MODE).
+    exchange_writer.start()
+
+    # 4) conversation_history partitions: create upcoming months, apply retention.
+    partition_maintenance.start()
 
     yield  # app runs here
 
+    # Shutdown: flush queued exchanges and finish background summaries, then
+    # release the shared HTTP connection pools.
+    await exchange_writer.drain()
+    await partition_maintenance.stop()
+    await session_summaries.drain()
+    await provider_registry.aclose()
+    password_hash_pool.shutdown()
+
 
 app = FastAPI(
     title="Chatbot API (GenAI 2025 Standard)",
@@ -80,6 +86,15 @@ app = FastAPI(
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Early 413 for oversized bodies: multipart gets the upload limit plus room for
+# the form fields; JSON may carry two base64 attachments (4/3 expansion).
+_upload_bytes = settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_body_bytes=2 * (_upload_bytes * 4 // 3) + 1024 * 1024,
+    max_multipart_bytes=_upload_bytes + 1024 * 1024,
+)
+
 app.add_middleware(RequestIDMiddleware)
 
 # allow_credentials=True is unsafe with wildcard origins (any domain could hijack auth).
@@ -102,11 +117,67 @@ async def health_check():
     try:
         async with engine.connect() as conn:
             await conn.execute(text("SELECT 1"))
-        return {"status": "healthy", "database": "connected"}
+        return {
+            "status": "healthy",
+            "database": "connected",
+            "history_cache": history_cache.stats(),
+            "auth_cache": auth_cache.stats(),
+            "password_hash_pool": password_hash_pool.stats(),
+            "exchange_writer": exchange_writer.stats(),
+            "db_replicas": replica_router.stats(),
+            "response_cache": response_cache.stats(),
+            "model_router": model_router.stats(),
+            "providers": provider_guards.stats(),
+            "admission": admission.stats(),
+        }
     except Exception:
         raise HTTPException(status_code=503, detail="Database unavailable")
 
 
+@app.get("/metrics/providers", tags=["Health"])
+async def provider_metrics():
+    """Circuit breaker state, in-flight calls and concurrency limit per LLM vendor."""
+    return provider_guards.stats()
+
+
+@app.get("/metrics/admission", tags=["Health"])
+async def admission_metrics():
+    """In-flight and queued chat requests, rejections and queue wait times per model."""
+    return admission.stats()
+
+
+# Scrape-time metrics read from the services' own stats
+Collected("llm_provider_in_flight", "LLM calls in flight per vendor.", ["vendor"],
+          lambda: (((v,), s["in_flight"]) for v, s in provider_guards.stats().items()))
+Collected("llm_provider_concurrency_limit", "Adaptive concurrency limit per vendor.", ["vendor"],
+          lambda: (((v,), s["concurrency_limit"]) for v, s in provider_guards.stats().items()))
+Collected("llm_provider_circuit_open", "1 while the vendor's circuit breaker is open.", ["vendor"],
+          lambda: (((v,), s["state"] == "open") for v, s in provider_guards.stats().items()))
+Collected("llm_provider_rejected_total", "Calls rejected locally by the provider guard.", ["vendor", "reason"],
+          lambda: (((v, reason), s[f"rejected_{reason}"])
+                   for v, s in provider_guards.stats().items() for reason in ("open", "overloaded")),
+          kind="counter")
+Collected("model_router_failovers_total", "Calls that failed over to the next model of a tier.", [],
+          lambda: [((), model_router.failovers)], kind="counter")
+Collected("admission_in_flight", "Chat requests running per model lane.", ["model"],
+          lambda: (((m,), s["in_flight"]) for m, s in admission.stats().items()))
+Collected("admission_queued", "Chat requests waiting in the admission queue per model lane.", ["model"],
+          lambda: (((m,), s["queued"]) for m, s in admission.stats().items()))
+Collected("admission_rejected_total", "Chat requests refused with 503 by the admission queue.", ["model", "reason"],
+          lambda: (((m, reason), s[key]) for m, s in admission.stats().items()
+                   for reason, key in (("queue_full", "rejected_queue_full"), ("deadline", "rejected_deadline"),
+                                       ("shed", "shed"))),
+          kind="counter")
+Collected("db_pool_connections_in_use", "Connections checked out of the primary database pool.", [],
+          lambda: [((), engine.sync_engine.pool.checkedout())] if hasattr(engine.sync_engine.pool, "checkedout") else [])
+
+
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of the hot-path histograms, counters and gauges."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/", tags=["Root"])
 def read_root():
     return {
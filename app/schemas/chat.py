@@ -1,4 +1,5 @@
-from typing import Optional
+from datetime import datetime
+from typing import Annotated, Dict, List, Literal, Optional
 from pydantic import BaseModel, Field
 
 class ChatRequest(BaseModel):
@@ -8,8 +9,9 @@ class ChatRequest(BaseModel):
     session_id: str = Field(..., min_length=1, max_length=128, description="Unique identifier for the chat session")
     prompt: str = Field(..., min_length=1, max_length=32000, description="The user's message")
 
-    # If not provided, the backend uses the configured default (gemini-3.1-pro)
-    model: Optional[str] = Field(None, description="Example: gemini-3.1-pro, gpt-5.4-mini, claude-sonnet-4-6")
+    # If not provided, the backend uses the configured default (DEFAULT_MODEL, gemini-3.1-pro).
+    # "auto" / "fast" / "balanced" / "best" let the router pick the healthiest model of a tier.
+    model: Optional[str] = Field(None, description="Example: gemini-3.1-pro, gpt-5.4-mini, claude-sonnet-4-6, auto, fast")
     
     # Enable Google Grounding (Web search)
     use_search: bool = Field(False, description="If True, allows the model to perform a Google Search.")
@@ -22,6 +24,10 @@ class ChatRequest(BaseModel):
     file_base64: Optional[str] = None
     file_mime_type: Optional[str] = None
 
+    # Re-use an attachment stored on a previous turn (SHA-256 returned as `attachment_id`)
+    # instead of sending image_base64 / file_base64 again
+    attachment_id: Optional[str] = Field(None, pattern=r"^[0-9a-f]{64}$")
+
 
 class ChatResponse(BaseModel):
     """
@@ -29,4 +35,87 @@ class ChatResponse(BaseModel):
     """
     session_id: str
     reply: str
-    model_used: str  # Returns which model was actually utilized
\ No newline at end of file
+    model_used: str  # Returns which model was actually utilized
+    attachment_id: Optional[str] = None  # Id of the stored attachment, for re-use on later turns
+
+
+class MessageOut(BaseModel):
+    """
+    A stored message of a session.
+    """
+    id: int
+    role: str
+    content: str
+    timestamp: datetime
+
+
+class MessagePage(BaseModel):
+    """
+    One page of messages; pass `next_cursor` back as `cursor` for the next one.
+    """
+    items: List[MessageOut]
+    next_cursor: Optional[str] = None
+
+
+class SessionOut(BaseModel):
+    """
+    A session of the current user, with its activity summary.
+    """
+    session_id: str
+    message_count: int
+    last_message_at: datetime
+
+
+class SessionPage(BaseModel):
+    """
+    One page of sessions, most recently active first.
+    """
+    items: List[SessionOut]
+    next_cursor: Optional[str] = None
+
+
+class FanOutRequest(BaseModel):
+    """
+    Input payload for /api/v1/chat/fanout: one prompt sent to several models at once.
+    """
+    session_id: str = Field(..., min_length=1, max_length=128, description="Unique identifier for the chat session")
+    prompt: str = Field(..., min_length=1, max_length=32000, description="The user's message")
+    models: List[str] = Field(..., min_length=1, max_length=5, description="Example: [\"gemini-3-flash\", \"gpt-5.4-mini\"]")
+
+    # "all": wait for every model; "first": return the first answer; "quorum": wait for `quorum` answers
+    mode: Literal["all", "first", "quorum"] = "all"
+    quorum: Optional[int] = Field(None, ge=1, description="Answers needed in quorum mode (default: majority)")
+    # Timeout of each model call; defaults to FAN_OUT_TIMEOUT_SECONDS_BY_MODEL, then LLM_TIMEOUT_SECONDS
+    timeout_seconds: Optional[float] = Field(None, gt=0, le=300)
+    # Per-model overrides of `timeout_seconds`, e.g. {"gemini-3.1-pro": 60, "gemini-3-flash": 10}
+    timeouts: Optional[Dict[str, Annotated[float, Field(gt=0, le=300)]]] = None
+    # Save the first successful reply as this turn of the session
+    persist: bool = True
+
+    use_search: bool = False
+    image_base64: Optional[str] = None
+    image_mime_type: Optional[str] = None
+    file_base64: Optional[str] = None
+    file_mime_type: Optional[str] = None
+    attachment_id: Optional[str] = Field(None, pattern=r"^[0-9a-f]{64}$")
+
+
+class ModelReply(BaseModel):
+    """
+    Outcome of one model in a fan-out request.
+    """
+    model: str
+    status: str  # ok | error | timeout | cancelled
+    reply: Optional[str] = None
+    error: Optional[str] = None
+    latency_ms: Optional[float] = None
+
+
+class FanOutResponse(BaseModel):
+    """
+    Fan-out results, in the order the models were requested.
+    """
+    session_id: str
+    results: List[ModelReply]
+    persisted_model: Optional[str] = None  # Model whose reply was saved to the session
+    attachment_id: Optional[str] = None
@@ -0,0 +1,31 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class UsageTotals(BaseModel):
+    """
+    LLM calls and tokens over a period.
+    """
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+
+
+class ModelUsage(UsageTotals):
+    """
+    LLM calls, tokens and average latency of one model over a period.
+    """
+    model: str
+    avg_latency_ms: Optional[float] = None
+
+
+class UsageReport(BaseModel):
+    """
+    Output payload for /api/v1/usage/: the current user's usage per model, most tokens first.
+    """
+    since: datetime
+    until: Optional[datetime] = None
+    models: List[ModelUsage]
+    totals: UsageTotals
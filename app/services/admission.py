@@ -0,0 +1,221 @@
+"""
+Admission control for chat requests.
+
+Each requested model (or tier name) is a lane with at most `max_in_flight`
+requests talking to the provider. Requests beyond that wait in a bounded
+priority queue: a higher priority class is admitted first, FIFO within a
+class. A request is refused with AdmissionRejected (HTTP 503 + Retry-After)
+when the queue is full and it does not outrank anyone already waiting
+(otherwise the newest, lowest-priority waiter is shed to make room), or when
+it cannot start within its class deadline. Queue wait times are kept per
+lane for metrics and returned to the client in a response header.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import ADMISSION_QUEUE_WAIT_SECONDS
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, model: str, reason: str, retry_after: float):
+        super().__init__(f"{model}: {reason}")
+        self.model = model
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request; hand it back with AdmissionController.release."""
+
+    __slots__ = ("lane", "priority", "wait_ms", "admitted_at", "released")
+
+    def __init__(self, lane: "_Lane", priority: str, wait_ms: float):
+        self.lane = lane
+        self.priority = priority
+        self.wait_ms = wait_ms
+        self.admitted_at = time.monotonic()
+        self.released = False
+
+
+class _Lane:
+    def __init__(self, model: str, max_in_flight: int):
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        # (rank, seq, future): lower rank = higher priority, seq keeps FIFO order
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.waits_ms: Deque[float] = deque(maxlen=1000)
+        self.wait_seconds = ADMISSION_QUEUE_WAIT_SECONDS.labels(model)
+        self.hold_seconds = 1.0  # EWMA of how long a request keeps its slot
+        self.admitted = 0
+        self.wait_ms_total = 0.0
+        self.rejected_full = 0
+        self.rejected_deadline = 0
+        self.shed = 0
+
+    def retry_after(self) -> float:
+        """Rough time until a slot frees up for a request at the back of the queue."""
+        return max(1.0, self.hold_seconds * (len(self.waiters) + 1) / self.max_in_flight)
+
+    def _remove(self, entry: Tuple[int, int, asyncio.Future]) -> None:
+        try:
+            self.waiters.remove(entry)
+        except ValueError:
+            return
+        heapq.heapify(self.waiters)
+
+    def stats(self) -> Dict[str, object]:
+        waits = sorted(self.waits_ms)
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": len(self.waiters),
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_full,
+            "rejected_deadline": self.rejected_deadline,
+            "shed": self.shed,
+            "wait_ms_total": round(self.wait_ms_total, 1),
+            "wait_p50_ms": round(waits[len(waits) // 2], 1) if waits else None,
+            "wait_p95_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 1) if waits else None,
+        }
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_queue: int,
+        priorities: List[str],
+        deadlines: Dict[str, float],
+        default_priority: str,
+        max_in_flight_by_model: Optional[Dict[str, int]] = None,
+        enabled: bool = True,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.priorities = priorities
+        self.deadlines = deadlines
+        self.default_priority = default_priority
+        self.max_in_flight_by_model = max_in_flight_by_model or {}
+        self.enabled = enabled
+        self._lanes: Dict[str, _Lane] = {}
+        self._seq = itertools.count()
+
+    def _lane(self, model: str) -> _Lane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            limit = self.max_in_flight_by_model.get(model, self.max_in_flight)
+            lane = self._lanes[model] = _Lane(model, limit)
+        return lane
+
+    def _admit(self, lane: _Lane, priority: str, started: float) -> Ticket:
+        wait_ms = (time.monotonic() - started) * 1000
+        lane.admitted += 1
+        lane.wait_ms_total += wait_ms
+        lane.waits_ms.append(wait_ms)
+        lane.wait_seconds.observe(wait_ms / 1000)
+        return Ticket(lane, priority, wait_ms)
+
+    async def acquire(self, model: str, priority: Optional[str] = None) -> Optional[Ticket]:
+        """
+        Waits for a slot on `model`'s lane; raises AdmissionRejected if none is
+        free within the priority class deadline. Returns None when disabled.
+        """
+        if not self.enabled:
+            return None
+        priority = priority if priority in self.priorities else self.default_priority
+        lane = self._lane(model)
+        started = time.monotonic()
+
+        if lane.in_flight < lane.max_in_flight and not lane.waiters:
+            lane.in_flight += 1
+            return self._admit(lane, priority, started)
+
+        rank = self.priorities.index(priority)
+        if len(lane.waiters) >= self.max_queue:
+            worst = max(lane.waiters) if lane.waiters else None
+            if worst is None or worst[0] <= rank:
+                lane.rejected_full += 1
+                raise AdmissionRejected(model, "queue full", lane.retry_after())
+            # Load shedding: the newest waiter of the lowest class makes room
+            lane._remove(worst)
+            lane.shed += 1
+            worst[2].set_exception(AdmissionRejected(model, "shed for a higher-priority request", lane.retry_after()))
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (rank, next(self._seq), future)
+        heapq.heappush(lane.waiters, entry)
+        try:
+            await asyncio.wait({future}, timeout=self.deadlines.get(priority))
+        except asyncio.CancelledError:
+            # The client went away while queued; give back a slot already handed over
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release(Ticket(lane, priority, 0.0))
+            else:
+                future.cancel()
+                lane._remove(entry)
+            raise
+
+        if not future.done():
+            future.cancel()
+            lane._remove(entry)
+            lane.rejected_deadline += 1
+            raise AdmissionRejected(model, "deadline exceeded while queued", lane.retry_after())
+        # Raises AdmissionRejected if this request was shed
+        future.result()
+        return self._admit(lane, priority, started)
+
+    def release(self, ticket: Optional[Ticket]) -> None:
+        """Frees the slot (idempotent); hands it straight to the best waiter, if any."""
+        if ticket is None or ticket.released:
+            return
+        ticket.released = True
+        lane = ticket.lane
+        held = time.monotonic() - ticket.admitted_at
+        lane.hold_seconds = 0.8 * lane.hold_seconds + 0.2 * held
+        while lane.waiters:
+            _, _, future = heapq.heappop(lane.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        lane.in_flight -= 1
+
+    @asynccontextmanager
+    async def admit(self, model: str, priority: Optional[str] = None) -> AsyncIterator[Optional[Ticket]]:
+        ticket = await self.acquire(model, priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def clear(self) -> None:
+        self._lanes.clear()
+
+    def priority_for(self, email: Optional[str], model: str) -> str:
+        """Priority class of a request: per-user setting first, then per-model, then the default."""
+        return (
+            settings.ADMISSION_USER_PRIORITY.get(email or "")
+            or settings.ADMISSION_MODEL_PRIORITY.get(model)
+            or self.default_priority
+        )
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {model: lane.stats() for model, lane in sorted(self._lanes.items())}
+
+
+# Global controller, shared by the chat endpoints of this worker
+admission = AdmissionController(
+    max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    priorities=settings.ADMISSION_PRIORITIES,
+    deadlines=settings.ADMISSION_DEADLINE_SECONDS,
+    default_priority=settings.ADMISSION_DEFAULT_PRIORITY,
+    max_in_flight_by_model=settings.ADMISSION_MAX_IN_FLIGHT_BY_MODEL,
+    enabled=settings.ADMISSION_ENABLED,
+)
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models import StoredAttachment
+from app.db.routing import use_primary
+from app.services.attachments import Attachment
+
+logger = logging.getLogger(__name__)
+
+
+class AttachmentStore:
+    """
+    Content-addressed attachment store.
+
+    Bytes live on local disk under `<root>/<sha[:2]>/<sha>` (shared across users,
+    written once per content), bounded by an LRU size cap on file mtime. The
+    `attachments` table holds per-user metadata, so an attachment id (the
+    SHA-256) is only resolvable by the user who uploaded it, plus any
+    provider-side file handle (Gemini Files API) to reuse on later turns.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._used_bytes: Optional[int] = None
+        self._lock = asyncio.Lock()
+
+    def _path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
+
+    async def put(self, db: AsyncSession, user_id: int, attachment: Attachment) -> str:
+        """Stores the attachment (if new) and returns its id. Marks `attachment` as stored."""
+        sha256 = await asyncio.to_thread(lambda: attachment.digest)
+        path = self._path(sha256)
+
+        if not path.exists():
+            data = await attachment.get_buffer()
+            async with self._lock:
+                if not path.exists():
+                    await asyncio.to_thread(self._write, path, data)
+
+        # Read-modify-write: the existence check must see the primary's rows
+        use_primary(db)
+        row = await self._row(db, user_id, sha256)
+        if row is None:
+            row = StoredAttachment(
+                user_id=user_id,
+                sha256=sha256,
+                mime_type=attachment.mime_type,
+                size_bytes=attachment.size,
+            )
+            db.add(row)
+        else:
+            row.last_used_at = datetime.now(timezone.utc)
+        try:
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+        self._bind(attachment, row, path)
+        return sha256
+
+    async def get(self, db: AsyncSession, user_id: int, attachment_id: str) -> Optional[Attachment]:
+        """Loads a stored attachment of this user, or None if unknown or evicted from disk."""
+        row = await self._row(db, user_id, attachment_id)
+        if row is None:
+            return None
+
+        path = self._path(attachment_id)
+        try:
+            data = await asyncio.to_thread(self._read, path)
+        except FileNotFoundError:
+            return None
+
+        attachment = Attachment.from_bytes(data, row.mime_type)
+        self._bind(attachment, row, path)
+
+        row.last_used_at = datetime.now(timezone.utc)
+        try:
+            await db.commit()
+        except Exception:
+            await db.rollback()
+        return attachment
+
+    async def save_handles(self, db: AsyncSession, user_id: int, attachment: Attachment) -> None:
+        """Persists provider handles a provider attached to a stored attachment."""
+        if not attachment.attachment_id or not attachment.handles_changed:
+            return
+        row = await self._row(db, user_id, attachment.attachment_id)
+        if row is None:
+            return
+        row.gemini_file_uri = attachment.gemini_file_uri
+        row.gemini_file_expires_at = attachment.gemini_file_expires_at
+        try:
+            await db.commit()
+            attachment.handles_changed = False
+        except Exception:
+            await db.rollback()
+            raise
+
+    @staticmethod
+    async def _row(db: AsyncSession, user_id: int, sha256: str) -> Optional[StoredAttachment]:
+        result = await db.execute(
+            select(StoredAttachment).where(
+                StoredAttachment.user_id == user_id,
+                StoredAttachment.sha256 == sha256,
+            )
+        )
+        return result.scalars().first()
+
+    @staticmethod
+    def _bind(attachment: Attachment, row: StoredAttachment, path: Path) -> None:
+        attachment.attachment_id = row.sha256
+        attachment.path = str(path)
+        attachment.gemini_file_uri = row.gemini_file_uri
+        attachment.gemini_file_expires_at = row.gemini_file_expires_at
+        attachment._digest = row.sha256
+
+    @staticmethod
+    def _read(path: Path) -> bytes:
+        data = path.read_bytes()
+        os.utime(path)  # LRU: mtime = last use
+        return data
+
+    def _write(self, path: Path, data) -> None:
+        if self._used_bytes is None:
+            self._used_bytes = self._scan_usage()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique temp name: concurrent writers of the same content don't share one
+        with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp", delete=False) as tmp:
+            try:
+                tmp.write(data)
+            except BaseException:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+        # A concurrent writer of the same content may have got there first
+        replaced = path.exists()
+        os.replace(tmp.name, path)
+        if not replaced:
+            self._used_bytes += len(data)
+        if self._used_bytes > self.max_bytes:
+            self._evict()
+
+    def _blobs(self) -> Iterator[Tuple[float, int, Path]]:
+        """(mtime, size, path) of the stored files; in-progress `.tmp` writes are skipped."""
+        for p in self.root.glob("*/*"):
+            if p.suffix == ".tmp":
+                continue
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            yield st.st_mtime, st.st_size, p
+
+    def _scan_usage(self) -> int:
+        if not self.root.exists():
+            return 0
+        return sum(size for _, size, _ in self._blobs())
+
+    def _evict(self) -> None:
+        """Deletes least recently used files until usage is 10% under the cap."""
+        files = sorted(self._blobs())
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in files:
+            if self._used_bytes <= target:
+                break
+            try:
+                path.unlink()
+                self._used_bytes -= size
+            except FileNotFoundError:
+                pass
+        logger.info(f"Attachment store evicted down to {self._used_bytes / 1024 / 1024:.1f} MB")
+
+
+# Global store instance
+attachment_store = AttachmentStore(
+    root=settings.ATTACHMENT_STORE_DIR,
+    max_bytes=settings.ATTACHMENT_STORE_MAX_MB * 1024 * 1024,
+)
@@ -0,0 +1,158 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import mmap
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import AsyncIterator, BinaryIO, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Payloads above this size are encoded/decoded in a worker thread
+_OFFLOAD_BYTES = 256 * 1024
+
+# Uploads larger than this are memory-mapped from their spool file instead of read
+# (matches Starlette's in-memory spool threshold, so they are already on disk).
+_MMAP_MIN_BYTES = 1024 * 1024
+
+Buffer = Union[bytes, memoryview, mmap.mmap]
+
+
+class Attachment:
+    """
+    An image or file carried from the endpoints through ChatService to the providers.
+
+    Holds the raw bytes (upload path) and/or the base64 text (JSON path) and
+    converts lazily, at most once per representation: Gemini consumes raw
+    bytes, Anthropic/OpenAI consume base64, so each provider only pays for the
+    conversion it needs.
+    """
+
+    __slots__ = (
+        "mime_type", "_data", "_b64", "_digest",
+        # Set for attachments held in the content-addressed store
+        "attachment_id", "path", "gemini_file_uri", "gemini_file_expires_at", "handles_changed",
+    )
+
+    def __init__(self, mime_type: str, data: Optional[Buffer] = None, b64: Optional[str] = None):
+        if data is None and b64 is None:
+            raise ValueError("Attachment needs raw data or base64 text")
+        self.mime_type = mime_type
+        self._data = data
+        self._b64 = b64
+        self._digest: Optional[str] = None
+        self.attachment_id: Optional[str] = None
+        self.path: Optional[str] = None
+        self.gemini_file_uri: Optional[str] = None
+        self.gemini_file_expires_at: Optional[datetime] = None
+        # True once a provider attached a new remote handle that should be persisted
+        self.handles_changed = False
+
+    @classmethod
+    def from_bytes(cls, data: Buffer, mime_type: str) -> "Attachment":
+        return cls(mime_type, data=data)
+
+    @classmethod
+    def from_base64(cls, b64: str, mime_type: str) -> "Attachment":
+        return cls(mime_type, b64=b64)
+
+    @property
+    def is_image(self) -> bool:
+        return self.mime_type.startswith("image/")
+
+    @property
+    def is_text(self) -> bool:
+        return self.mime_type.startswith("text/")
+
+    @property
+    def size(self) -> int:
+        """Size of the raw content in bytes (estimated from the base64 length if not decoded)."""
+        if self._data is not None:
+            return len(self._data)
+        return len(self._b64) * 3 // 4
+
+    def gemini_handle(self) -> Optional[str]:
+        """Gemini Files API URI for this content, if one is known and not about to expire."""
+        if self.gemini_file_uri and self.gemini_file_expires_at:
+            if self.gemini_file_expires_at > datetime.now(timezone.utc):
+                return self.gemini_file_uri
+        return None
+
+    def _raw(self) -> Buffer:
+        if self._data is None:
+            self._data = base64.b64decode(self._b64)
+        return self._data
+
+    def _encoded(self) -> str:
+        if self._b64 is None:
+            self._b64 = base64.b64encode(self._data).decode("ascii")
+        return self._b64
+
+    async def get_bytes(self) -> bytes:
+        """Raw bytes (decoded from base64 once if needed)."""
+        if self._data is None and len(self._b64) > _OFFLOAD_BYTES:
+            await asyncio.to_thread(self._raw)
+        data = self._raw()
+        return data if isinstance(data, bytes) else bytes(data)
+
+    async def get_buffer(self) -> Buffer:
+        """Raw content without copying (bytes, memoryview or mmap)."""
+        if self._data is None:
+            await self.get_bytes()
+        return self._data
+
+    async def get_base64(self) -> str:
+        """Base64 text (encoded from the raw bytes once if needed)."""
+        if self._b64 is None and len(self._data) > _OFFLOAD_BYTES:
+            await asyncio.to_thread(self._encoded)
+        return self._encoded()
+
+    async def get_text(self, limit: int = 5000) -> str:
+        """Leading `limit` characters of a text attachment, decoded as UTF-8."""
+        data = await self.get_bytes() if self._data is None else self._data
+        # 4 bytes per character is the UTF-8 worst case: never decode more than needed
+        return bytes(data[:limit * 4]).decode("utf-8", errors="ignore")[:limit]
+
+    @property
+    def digest(self) -> str:
+        """SHA-256 of the raw content (hex), computed once."""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self._raw()).hexdigest()
+        return self._digest
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+@asynccontextmanager
+async def open_upload(file: BinaryIO, mime_type: str, max_bytes: int) -> AsyncIterator[Attachment]:
+    """
+    Wraps a spooled upload (UploadFile.file) as an Attachment without reading it
+    into a `bytes` object: small uploads are read from the in-memory spool,
+    large ones are memory-mapped read-only from the disk-backed spool file, so
+    pages are loaded on demand and shared with the OS page cache.
+    The mapping is released when the context exits.
+    """
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    if size > max_bytes:
+        raise UploadTooLarge(f"Upload of {size} bytes exceeds {max_bytes} bytes")
+
+    if size < _MMAP_MIN_BYTES:
+        yield Attachment.from_bytes(file.read(), mime_type)
+        return
+
+    mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    attachment = Attachment.from_bytes(mapped, mime_type)
+    try:
+        yield attachment
+    finally:
+        try:
+            mapped.close()
+        except BufferError:
+            # A consumer still holds a view; the mapping is freed with it.
+            logger.warning("Upload mapping still referenced on release")
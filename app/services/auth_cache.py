@@ -0,0 +1,145 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.db.models import User
+
+
+class Principal:
+    """
+    Compact, detached view of an authenticated user (what endpoints need from
+    `get_current_user`), cached in place of an ORM `User` instance.
+    """
+
+    __slots__ = ("id", "email", "is_active")
+
+    def __init__(self, id: int, email: str, is_active: bool):
+        self.id = id
+        self.email = email
+        self.is_active = is_active
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(user.id, user.email, bool(user.is_active))
+
+    def __repr__(self):
+        return f"<Principal(id={self.id}, email={self.email})>"
+
+
+class _Entry:
+    __slots__ = ("principal", "expires_at")
+
+    def __init__(self, principal: Principal, expires_at: float):
+        self.principal = principal
+        self.expires_at = expires_at
+
+
+class AuthCache:
+    """
+    Bounded LRU + TTL cache of bearer token -> Principal, so an authenticated
+    request skips both the JWT decode and the user lookup.
+
+    Positive entries live for `ttl_seconds`, never past the token's own `exp`.
+    Rejected tokens (bad signature, expired, unknown user) are kept in a
+    separate negative cache as (status, detail) for `negative_ttl_seconds`, so
+    replaying a bad token doesn't cost a decode or a query either.
+    Entries for a user are dropped when `is_active` changes or the user is
+    deleted through the ORM in this worker; other workers (and bulk UPDATEs)
+    catch up within `ttl_seconds`.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, negative_ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._rejected: "OrderedDict[str, Tuple[float, int, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def get(self, token: str) -> Optional[Principal]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at < time.monotonic():
+            del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return entry.principal
+
+    def put(self, token: str, principal: Principal, token_exp: Optional[float] = None) -> None:
+        """Caches a verified token. `token_exp` is the JWT `exp` claim (Unix time)."""
+        ttl = self.ttl_seconds
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+            if ttl <= 0:
+                return
+        self._entries[token] = _Entry(principal, time.monotonic() + ttl)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_rejected(self, token: str) -> Optional[Tuple[int, str]]:
+        """(status_code, detail) of a recently rejected token, or None."""
+        item = self._rejected.get(token)
+        if item is None:
+            return None
+        expires_at, status_code, detail = item
+        if expires_at < time.monotonic():
+            del self._rejected[token]
+            return None
+        self.negative_hits += 1
+        return status_code, detail
+
+    def reject(self, token: str, status_code: int, detail: str) -> None:
+        self._rejected[token] = (time.monotonic() + self.negative_ttl_seconds, status_code, detail)
+        self._rejected.move_to_end(token)
+        while len(self._rejected) > self.max_entries:
+            self._rejected.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drops every cached token of `user_id` (linear scan; deactivation is rare)."""
+        stale = [token for token, entry in self._entries.items() if entry.principal.id == user_id]
+        for token in stale:
+            del self._entries[token]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._rejected.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "tokens": len(self._entries),
+            "rejected_tokens": len(self._rejected),
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Global cache instance shared by all requests in this worker
+auth_cache = AuthCache(
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=settings.AUTH_CACHE_NEGATIVE_TTL_SECONDS,
+)
+
+
+@event.listens_for(User.is_active, "set")
+def _on_is_active_set(target: User, value, oldvalue, initiator) -> None:
+    if target.id is not None and value != oldvalue:
+        auth_cache.invalidate_user(target.id)
+
+
+@event.listens_for(User, "after_delete")
+def _on_user_deleted(mapper, connection, target: User) -> None:
+    auth_cache.invalidate_user(target.id)
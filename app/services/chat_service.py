@@ -1,51 +1,118 @@
 import logging
-from typing import Optional, List
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, List, Sequence, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, asc
-from app.db.models import ConversationHistory
-from app.services.llm_providers import GoogleGeminiProvider, OpenAIProvider, ClaudeProvider, LLMProvider
+from sqlalchemy import select
+from app.db.models import ConversationHistory, LLMUsage
+from app.db.session import AsyncSessionLocal, release_connection
+from app.services.llm_providers import (
+    GoogleGeminiProvider, OpenAIProvider, ClaudeProvider, LLMProvider, LLMResult, TokenUsage, SYSTEM_INSTRUCTION,
+)
+from app.services.provider_registry import provider_registry
+from app.services.history_cache import history_cache, HistoryRecord
+from app.services.exchange_writer import exchange_writer
+from app.services.context_window import build_context
+from app.services.model_router import model_router
+from app.services.provider_guard import ProviderUnavailable
+from app.services.summarizer import session_summaries
+from app.services.response_cache import response_cache
+from app.services.attachments import Attachment
+from app.services.attachment_store import attachment_store
+from app.services.single_flight import SingleFlight, StreamFlight, request_key
+from app.services.stream_stats import StreamStats
+from app.services.usage import fill_estimates, usage_rows
+from app.services.tokens import estimate_tokens
 from app.core.config import settings
+from app.core.metrics import HISTORY_LOAD_SECONDS, SAVE_EXCHANGE_SECONDS, timed
+from app.core.rate_limit import TokenBudgetExceeded, llm_token_budget, retry_after_header
 from fastapi import HTTPException
 from openai import APIConnectionError, RateLimitError
 import anthropic
 
 logger = logging.getLogger(__name__)
 
+# (history, system_instruction, compact_through_id) for one model
+Context = Tuple[List[HistoryRecord], Optional[str], Optional[int]]
+
+# Identical in-flight requests (double submits, client retries) share one
+# provider call and one save_exchange.
+_chat_flights = SingleFlight()
+_stream_flights = StreamFlight()
+
+_history_from_cache = HISTORY_LOAD_SECONDS.labels("cache")
+_history_from_db = HISTORY_LOAD_SECONDS.labels("db")
+
 # DB Helpers
 async def get_history(session_id: str, db: AsyncSession, user_id: int, limit: int = settings.HISTORY_LIMIT):
     """
     Returns the most recent `limit` messages for the given user+session in
     chronological (asc) order. Filters by user_id to enforce data isolation.
+    Messages older than HISTORY_LOOKBACK_DAYS are not considered.
+    The default window is served from the in-process history cache when possible.
+    Waits for this session's exchanges still queued in the exchange writer first.
     """
-    newest_ids = (
-        select(ConversationHistory.id)
+    started = time.perf_counter()
+    # Exchanges of this session still queued in the writer must be visible
+    await exchange_writer.pending_for(user_id, session_id)
+
+    use_cache = settings.HISTORY_CACHE_ENABLED and limit == history_cache.window
+    if use_cache:
+        cached = history_cache.get(user_id, session_id)
+        if cached is not None:
+            _history_from_cache.observe(time.perf_counter() - started)
+            return list(cached)
+        generation = history_cache.generation(user_id, session_id)
+
+    # Newest first with a LIMIT (the composite index serves it directly), then
+    # flipped to chronological order. The timestamp cutoff lets Postgres prune
+    # the monthly partitions to recent ones.
+    query = (
+        select(ConversationHistory.id, ConversationHistory.role, ConversationHistory.content)
         .where(
             ConversationHistory.session_id == session_id,
             ConversationHistory.user_id == user_id,
         )
-        .order_by(ConversationHistory.timestamp.desc())
+        .order_by(ConversationHistory.timestamp.desc(), ConversationHistory.id.desc())
         .limit(limit)
-        .scalar_subquery()
-    )
-    result = await db.execute(
-        select(ConversationHistory)
-        .where(ConversationHistory.id.in_(newest_ids))
-        .order_by(asc(ConversationHistory.timestamp))
     )
-    return result.scalars().all()
+    if settings.HISTORY_LOOKBACK_DAYS > 0:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.HISTORY_LOOKBACK_DAYS)
+        query = query.where(ConversationHistory.timestamp >= cutoff)
+    result = await db.execute(query)
+    records = [HistoryRecord.of(*row) for row in reversed(result.all())]
 
+    if use_cache:
+        history_cache.put(user_id, session_id, records, generation)
+    _history_from_db.observe(time.perf_counter() - started)
+    return records
 
+
+@timed(SAVE_EXCHANGE_SECONDS)
 async def save_exchange(
     session_id: str,
     user_msg: str,
     model_reply: str,
     db: AsyncSession,
     user_id: int,
+    calls: Sequence[LLMResult] = (),
 ) -> None:
     """
-    Saves both the user message and model reply in a single atomic commit.
-    If the commit fails both rows are rolled back together.
+    Saves both the user message and model reply atomically, with the usage
+    (tokens, latency) of the LLM calls behind the reply in llm_usage.
+
+    With EXCHANGE_WRITE_MODE "await" or "background" the pair goes through the
+    batched exchange writer (awaiting its commit, or not); "direct" commits on
+    the request's session right away. Either way, on success the cached
+    history window is extended; on failure it is dropped.
     """
+    if settings.EXCHANGE_WRITE_MODE != "direct" and exchange_writer.running:
+        committed = await exchange_writer.submit(user_id, session_id, user_msg, model_reply, calls)
+        if settings.EXCHANGE_WRITE_MODE == "await":
+            await committed
+        return
+
     user_record = ConversationHistory(
         session_id=session_id, role="user", content=user_msg, user_id=user_id
     )
@@ -55,18 +122,113 @@ async def save_exchange(
     db.add(user_record)
     db.add(model_record)
     try:
+        if calls:
+            await db.flush()
+            db.add_all(LLMUsage(**row) for row in usage_rows(user_id, session_id, model_record.id, calls))
         await db.commit()
     except Exception:
         await db.rollback()
+        history_cache.invalidate(user_id, session_id)
         raise
 
+    history_cache.append(user_id, session_id, (
+        HistoryRecord.of(user_record.id, "user", user_msg),
+        HistoryRecord.of(model_record.id, "model", model_reply),
+    ))
+
+
+async def save_attachment_handles(db: AsyncSession, user_id: int, *attachments: Optional[Attachment]) -> None:
+    """Persists provider file handles (e.g. Gemini uploads) created during generation."""
+    for attachment in attachments:
+        if attachment is not None and attachment.handles_changed:
+            try:
+                await attachment_store.save_handles(db, user_id, attachment)
+            except Exception as e:
+                logger.warning(f"Failed to persist attachment handle: {e}")
+
+
+def check_token_budget(user_id: int, prompt: str, calls: int = 1) -> None:
+    """Raises HTTP 429 (with Retry-After) if the user's LLM token budget can't cover `calls` more prompts."""
+    if not llm_token_budget.enabled:
+        return
+    try:
+        llm_token_budget.check(user_id, estimate_tokens(prompt) * calls)
+    except TokenBudgetExceeded as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"LLM token budget exceeded ({e.limit}). Please try again later.",
+            headers=retry_after_header(e.retry_after),
+        )
+
+
+def charge_tokens(user_id: int, history: List[HistoryRecord], prompt: str, reply: str) -> None:
+    """Charges one model call (history + prompt sent, reply received) to the user's token budget."""
+    if llm_token_budget.enabled:
+        used = sum(record.tokens for record in history) + estimate_tokens(prompt) + estimate_tokens(reply)
+        llm_token_budget.charge(user_id, used)
+
 
 class ChatService:
+    @staticmethod
+    async def build_contexts(
+        session_id: str, db: AsyncSession, user_id: int, models: List[str], prompt: str
+    ) -> Dict[str, Context]:
+        """
+        Loads the session history once and fits it to each model's token budget.
+
+        Returns {model: (history, system_instruction, compact_through_id)}. When
+        summarization is enabled and older turns fell out of the window, the
+        stored summary is appended to the system instruction and
+        `compact_through_id` is the newest message out of context (dropped by
+        the budget, or older than a full fetch window) that the summary does
+        not cover yet (None if nothing needs compacting).
+        """
+        fetched = await get_history(session_id, db, user_id=user_id)
+        return {
+            model: await ChatService.fit_context(fetched, session_id, db, user_id, model, prompt)
+            for model in models
+        }
+
+    @staticmethod
+    async def fit_context(
+        fetched: List[HistoryRecord], session_id: str, db: AsyncSession, user_id: int, model_name: str, prompt: str
+    ) -> Tuple[List[HistoryRecord], Optional[str], Optional[int]]:
+        """Fits an already fetched window to one model (see build_contexts)."""
+        history = build_context(fetched, model_name, prompt)
+
+        if not settings.SUMMARY_ENABLED:
+            return history, None, None
+
+        dropped = fetched[:len(fetched) - len(history)]
+        # A full window means older rows exist in the DB, which may be summarized already.
+        if not dropped and len(fetched) < settings.HISTORY_LIMIT:
+            return history, None, None
+
+        summary = await session_summaries.get(db, user_id, session_id)
+        covered = summary[1] if summary else 0
+        # Everything older than the oldest kept row is out of context: the rows
+        # the budget dropped, or (window full, all rows fit) those before the window
+        through_id = dropped[-1].id if dropped else fetched[0].id - 1
+        compact_through_id = through_id if through_id > covered else None
+
+        system_instruction = None
+        if summary:
+            system_instruction = (
+                f"{SYSTEM_INSTRUCTION.strip()}\n\n"
+                f"Summary of the earlier conversation:\n{summary[0]}"
+            )
+        return history, system_instruction, compact_through_id
+
     @staticmethod
     def get_provider(model_name: str, openai_client=None) -> LLMProvider:
         """
-        Factory method to return the appropriate LLM provider based on model name.
+        Returns the LLM provider for the given model name.
+        Uses the long-lived provider from the registry when the app lifespan has
+        started it; otherwise builds a throwaway provider (scripts, one-offs).
         """
+        if provider_registry.started:
+            return provider_registry.get(model_name)
+
         model_lower = model_name.lower()
 
         if "gemini" in model_lower:
@@ -82,45 +244,136 @@ class ChatService:
 
         raise ValueError(f"Model not supported: {model_name}")
 
+    @staticmethod
+    def route(model_name: str, openai_client=None) -> List[str]:
+        """
+        Models to try for `model_name`, best first: for "auto" or a tier name,
+        the tier's models ranked by the model router (vendors without a
+        configured key skipped); otherwise just the model itself.
+        """
+        candidates = model_router.candidates(model_name)
+        if not model_router.is_routed(model_name):
+            return candidates
+        available = []
+        for model in candidates:
+            try:
+                ChatService.get_provider(model, openai_client)
+            except ValueError:
+                continue
+            available.append(model)
+        if not available:
+            raise HTTPException(status_code=503, detail=f"No model available for '{model_name}'.")
+        return available
+
     @staticmethod
     async def process_chat(
         session_id: str,
         prompt: str,
         model_name: str,
-        db: AsyncSession,
         user_id: int,
         openai_client=None,
-        image_data: Optional[dict] = None,
-        file_data: Optional[dict] = None,
+        image_data: Optional[Attachment] = None,
+        file_data: Optional[Attachment] = None,
         use_search: bool = False
-    ) -> str:
+    ) -> Tuple[str, str]:
         """
         Orchestrates the chat process: fetches history, generates reply from LLM,
         and atomically saves user message + model response.
+        `model_name` may be "auto" or a tier name (see ChatService.route).
+        Returns (reply, model that produced it).
+        Identical concurrent requests are coalesced into a single run, which
+        uses its own DB session: it may outlive the request that started it.
         """
         logger.info(f"Processing: Sess={session_id} | Mod={model_name} | Search={use_search}")
+        check_token_budget(user_id, prompt)
+
+        async def run() -> Tuple[str, str]:
+            async with AsyncSessionLocal() as db:
+                # Tags the session so its commit pins the user's next reads to the primary
+                db.info["user_id"] = user_id
+                return await ChatService._process_chat(
+                    session_id, prompt, model_name, db, user_id, openai_client, image_data, file_data, use_search
+                )
 
-        history = await get_history(session_id, db, user_id=user_id)
+        key = await request_key(user_id, session_id, model_name, prompt, image_data, file_data)
+        return await _chat_flights.do(key, run)
+
+    @staticmethod
+    async def _process_chat(
+        session_id: str,
+        prompt: str,
+        model_name: str,
+        db: AsyncSession,
+        user_id: int,
+        openai_client=None,
+        image_data: Optional[Attachment] = None,
+        file_data: Optional[Attachment] = None,
+        use_search: bool = False
+    ) -> Tuple[str, str]:
+        candidates = ChatService.route(model_name, openai_client)
+        contexts = await ChatService.build_contexts(session_id, db, user_id, candidates, prompt)
+        # Don't hold a pooled connection while waiting on the LLM
+        await release_connection(db)
 
         try:
-            provider = ChatService.get_provider(model_name, openai_client)
+            # Exact-match cache (for the model that would be tried first): grounded
+            # (use_search) answers are time-sensitive, never cached.
+            history, system_instruction, _ = contexts[candidates[0]]
+            cache_key = None
+            cached = None
+            if settings.RESPONSE_CACHE_ENABLED and not use_search:
+                cache_key = response_cache.make_key(
+                    candidates[0], system_instruction or SYSTEM_INSTRUCTION, history, prompt, image_data, file_data
+                )
+                cached = await response_cache.get(cache_key)
 
-            reply = await provider.generate(
-                prompt=prompt,
-                history=history,
-                image_data=image_data,
-                file_data=file_data,
-                use_search=use_search
-            )
+            # A cache hit made no LLM call, so it records no usage
+            calls: List[LLMResult] = []
+            if cached is not None:
+                model_used, reply = candidates[0], cached.reply
+            else:
+                async def generate(model: str) -> LLMResult:
+                    history, system_instruction, _ = contexts[model]
+                    provider = ChatService.get_provider(model, openai_client)
+                    started = time.perf_counter()
+                    result = await provider.generate(
+                        prompt=prompt,
+                        history=history,
+                        image_data=image_data,
+                        file_data=file_data,
+                        use_search=use_search,
+                        system_instruction=system_instruction,
+                    )
+                    if cache_key and model == candidates[0]:
+                        await response_cache.set(cache_key, result.text, (time.perf_counter() - started) * 1000)
+                    return result
+
+                # Tries the candidates in order, failing over on rate limits / timeouts / outages
+                model_used, result = await model_router.run(candidates, generate)
+                reply = result.text
+                calls.append(fill_estimates(result, contexts[model_used][0], prompt))
+                charge_tokens(user_id, contexts[model_used][0], prompt, reply)
+                await save_attachment_handles(db, user_id, image_data, file_data)
 
             # Save both messages atomically after a successful LLM response.
             try:
-                await save_exchange(session_id, prompt, reply, db, user_id=user_id)
+                await save_exchange(session_id, prompt, reply, db, user_id=user_id, calls=calls)
             except Exception:
                 logger.error(f"Failed to persist exchange for session {session_id}")
                 # The client still receives the reply even if persistence fails.
 
-            return reply
+            # Compact turns that fell out of the window, after the reply is ready.
+            compact_through_id = contexts[model_used][2]
+            if compact_through_id:
+                session_summaries.schedule(user_id, session_id, compact_through_id)
+
+            return reply, model_used
+
+        except ProviderUnavailable as e:
+            logger.warning(f"LLM provider rejected locally (Sess={session_id}): {e}")
+            raise HTTPException(
+                status_code=503, detail="LLM Provider Unavailable.", headers={"Retry-After": str(math.ceil(e.retry_after))}
+            )
 
         except (RateLimitError, anthropic.RateLimitError):
             logger.warning(f"Rate limit hit in LLM provider (Sess={session_id})")
@@ -146,38 +399,93 @@ class ChatService:
         session_id: str,
         prompt: str,
         model_name: str,
-        db: AsyncSession,
         user_id: int,
         openai_client=None,
-        image_data: Optional[dict] = None,
-        file_data: Optional[dict] = None,
+        image_data: Optional[Attachment] = None,
+        file_data: Optional[Attachment] = None,
         use_search: bool = False,
+        stats: Optional[StreamStats] = None,
     ):
         """
         Async generator that streams LLM response chunks.
         Persists user + model messages to DB atomically after the stream completes.
+        Identical concurrent requests subscribe to one upstream stream, which
+        uses its own DB session and stops once every subscriber has gone away.
+        Every chunk is recorded in `stats` (TTFT, size, gaps), which is finished
+        - and its aggregate metrics recorded - when the stream ends.
         """
         logger.info(f"Streaming: Sess={session_id} | Mod={model_name}")
+        stats = stats or StreamStats()
+        check_token_budget(user_id, prompt)
+
+        async def upstream():
+            async with AsyncSessionLocal() as db:
+                db.info["user_id"] = user_id
+                async for item in ChatService._stream_chat(
+                    session_id, prompt, model_name, db, user_id, openai_client, image_data, file_data, use_search
+                ):
+                    yield item
+
+        key = await request_key(user_id, session_id, model_name, prompt, image_data, file_data)
+        try:
+            async for model_used, chunk in _stream_flights.subscribe(key, upstream):
+                stats.chunk(chunk, model_used)
+                yield chunk
+        finally:
+            stats.finish(model_name)
 
-        history = await get_history(session_id, db, user_id=user_id)
+    @staticmethod
+    async def _stream_chat(
+        session_id: str,
+        prompt: str,
+        model_name: str,
+        db: AsyncSession,
+        user_id: int,
+        openai_client=None,
+        image_data: Optional[Attachment] = None,
+        file_data: Optional[Attachment] = None,
+        use_search: bool = False,
+    ):
+        """Runs one upstream stream, yielding (model that serves it, chunk)."""
+        candidates = ChatService.route(model_name, openai_client)
+        contexts = await ChatService.build_contexts(session_id, db, user_id, candidates, prompt)
+        # Don't hold a pooled connection while waiting on the LLM
+        await release_connection(db)
 
         try:
-            provider = ChatService.get_provider(model_name, openai_client)
+            providers = {model: ChatService.get_provider(model, openai_client) for model in candidates}
         except ValueError as e:
             raise HTTPException(status_code=422, detail=str(e))
 
-        full_reply: List[str] = []
-        try:
-            async for chunk in provider.generate_stream(
+        # Usage of the attempt in progress (a failover starts a fresh one)
+        usage = TokenUsage()
+        started = time.perf_counter()
+
+        def open_stream(model: str):
+            nonlocal usage, started
+            usage, started = TokenUsage(), time.perf_counter()
+            history, system_instruction, _ = contexts[model]
+            return providers[model].generate_stream(
                 prompt=prompt,
                 history=history,
                 image_data=image_data,
                 file_data=file_data,
                 use_search=use_search,
-            ):
+                system_instruction=system_instruction,
+                usage=usage,
+            )
+
+        full_reply: List[str] = []
+        model_used = None
+        try:
+            # Fails over to the next candidate only until the first chunk is sent
+            async for model_used, chunk in model_router.stream(candidates, open_stream):
                 full_reply.append(chunk)
-                yield chunk
+                yield model_used, chunk
 
+        except ProviderUnavailable as e:
+            logger.warning(f"LLM provider rejected stream locally (Sess={session_id}): {e}")
+            raise HTTPException(status_code=503, detail="LLM Provider Unavailable.")
         except (RateLimitError, anthropic.RateLimitError):
             logger.warning(f"Rate limit hit in stream (Sess={session_id})")
             raise HTTPException(status_code=429, detail="LLM Rate Limit Exceeded.")
@@ -188,9 +496,23 @@ class ChatService:
             logger.exception(f"Stream error: {e}")
             raise HTTPException(status_code=500, detail="Internal Error processing stream.")
         finally:
+            await save_attachment_handles(db, user_id, image_data, file_data)
             if full_reply:
                 reply_text = "".join(full_reply)
+                charge_tokens(user_id, contexts[model_used][0], prompt, reply_text)
+                call = LLMResult(
+                    text=reply_text,
+                    model=model_used,
+                    usage=usage,
+                    latency_ms=round((time.perf_counter() - started) * 1000, 1),
+                )
                 try:
-                    await save_exchange(session_id, prompt, reply_text, db, user_id=user_id)
+                    await save_exchange(
+                        session_id, prompt, reply_text, db, user_id=user_id,
+                        calls=[fill_estimates(call, contexts[model_used][0], prompt)],
+                    )
                 except Exception:
                     logger.error(f"Failed to persist streamed reply for session {session_id}")
+                compact_through_id = contexts[model_used][2]
+                if compact_through_id:
+                    session_summaries.schedule(user_id, session_id, compact_through_id)
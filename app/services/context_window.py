@@ -0,0 +1,32 @@
+from typing import List, Sequence
+
+from app.core.config import settings
+from app.services.history_cache import HistoryRecord
+from app.services.tokens import estimate_tokens
+
+
+def token_budget(model_name: str) -> int:
+    """Context budget (history + current prompt) in estimated tokens for `model_name`."""
+    return settings.CONTEXT_TOKEN_BUDGETS.get(model_name, settings.CONTEXT_TOKEN_BUDGET_DEFAULT)
+
+
+def build_context(history: Sequence[HistoryRecord], model_name: str, prompt: str) -> List[HistoryRecord]:
+    """
+    Selects the history sent to the provider: walks the fetched window from
+    newest to oldest and keeps messages while they fit in the model's token
+    budget (the current prompt is always sent and counted first).
+
+    The result is contiguous and chronological, and never starts with a model
+    turn — Anthropic rejects conversations that open with an assistant message.
+    """
+    remaining = token_budget(model_name) - estimate_tokens(prompt)
+
+    start = len(history)
+    while start > 0 and history[start - 1].tokens <= remaining:
+        start -= 1
+        remaining -= history[start].tokens
+
+    while start < len(history) and history[start].role != "user":
+        start += 1
+
+    return list(history[start:])
@@ -0,0 +1,145 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import ConversationHistory
+from app.db.session import AsyncSessionLocal
+from app.services.exchange_writer import exchange_writer
+
+# Rows fetched per round trip by the export's server-side cursor
+EXPORT_BATCH_ROWS = 1000
+
+
+def encode_cursor(timestamp: datetime, key: Any) -> str:
+    """Opaque keyset cursor for the row (timestamp, key)."""
+    raw = json.dumps([timestamp.isoformat(), key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_type: type) -> Tuple[datetime, Any]:
+    """
+    Inverse of encode_cursor, for a key of `key_type` (int or str).
+    Raises ValueError for a malformed cursor or a key of another type.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, key = json.loads(raw)
+        timestamp = datetime.fromisoformat(timestamp)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    # bool is an int subclass; JSON true/false is never a valid id
+    if not isinstance(key, key_type) or isinstance(key, bool):
+        raise ValueError("Invalid cursor")
+    return timestamp, key
+
+
+async def list_sessions(
+    db: AsyncSession, user_id: int, limit: int, cursor: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    The user's sessions, most recently active first, keyset-paginated on
+    (last_message_at, session_id). Returns (items, next_cursor).
+    """
+    last_message_at = func.max(ConversationHistory.timestamp)
+    query = (
+        select(
+            ConversationHistory.session_id,
+            func.count().label("message_count"),
+            last_message_at.label("last_message_at"),
+        )
+        .where(ConversationHistory.user_id == user_id)
+        .group_by(ConversationHistory.session_id)
+    )
+    if cursor:
+        after_timestamp, after_session = decode_cursor(cursor, str)
+        query = query.having(
+            tuple_(last_message_at, ConversationHistory.session_id) < tuple_(after_timestamp, after_session)
+        )
+    query = query.order_by(last_message_at.desc(), ConversationHistory.session_id.desc()).limit(limit + 1)
+
+    rows = (await db.execute(query)).all()
+    items = [row._asdict() for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["last_message_at"], last["session_id"])
+    return items, next_cursor
+
+
+async def list_messages(
+    db: AsyncSession,
+    user_id: int,
+    session_id: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    newest_first: bool = True,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of a session's messages, keyset-paginated on (timestamp, id),
+    which ix_conv_history_user_session serves after the (user_id, session_id)
+    prefix. Returns (items, next_cursor).
+    """
+    # The writer may still hold this session's latest exchange
+    await exchange_writer.pending_for(user_id, session_id)
+
+    key = tuple_(ConversationHistory.timestamp, ConversationHistory.id)
+    query = select(
+        ConversationHistory.id,
+        ConversationHistory.role,
+        ConversationHistory.content,
+        ConversationHistory.timestamp,
+    ).where(
+        ConversationHistory.user_id == user_id,
+        ConversationHistory.session_id == session_id,
+    )
+    if cursor:
+        after_timestamp, after_id = decode_cursor(cursor, int)
+        after = tuple_(after_timestamp, after_id)
+        query = query.where(key < after if newest_first else key > after)
+    if newest_first:
+        query = query.order_by(ConversationHistory.timestamp.desc(), ConversationHistory.id.desc())
+    else:
+        query = query.order_by(ConversationHistory.timestamp.asc(), ConversationHistory.id.asc())
+
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    items = [row._asdict() for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["timestamp"], last["id"])
+    return items, next_cursor
+
+
+async def export_messages(user_id: int, session_id: str) -> AsyncIterator[str]:
+    """
+    Yields every message of the session as NDJSON lines, oldest first.
+
+    Rows come from a server-side cursor (stream_scalars with yield_per), so
+    memory stays flat however long the session is. Uses its own DB session,
+    held open for the whole export rather than tied to the request scope.
+    """
+    await exchange_writer.pending_for(user_id, session_id)
+
+    async with AsyncSessionLocal() as db:
+        messages = await db.stream_scalars(
+            select(ConversationHistory)
+            .where(
+                ConversationHistory.user_id == user_id,
+                ConversationHistory.session_id == session_id,
+            )
+            .order_by(ConversationHistory.timestamp.asc(), ConversationHistory.id.asc())
+            .execution_options(yield_per=EXPORT_BATCH_ROWS)
+        )
+        async for message in messages:
+            yield json.dumps({
+                "id": message.id,
+                "role": message.role,
+                "content": message.content,
+                "timestamp": message.timestamp.isoformat(),
+            }, ensure_ascii=False) + "\n"
+            # Loaded rows are not needed again; keep the identity map from growing
+            db.expunge(message)
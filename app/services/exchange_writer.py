@@ -0,0 +1,209 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.db.models import ConversationHistory, LLMUsage
+from app.db.session import AsyncSessionLocal, replica_router
+from app.services.history_cache import HistoryRecord, history_cache
+from app.services.llm_providers import LLMResult
+from app.services.usage import usage_rows
+
+logger = logging.getLogger(__name__)
+
+SessionKey = Tuple[int, str]
+
+
+class _PendingExchange:
+    __slots__ = ("user_id", "session_id", "user_msg", "model_reply", "calls", "future")
+
+    def __init__(
+        self,
+        user_id: int,
+        session_id: str,
+        user_msg: str,
+        model_reply: str,
+        calls: Sequence[LLMResult],
+        future: asyncio.Future,
+    ):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.user_msg = user_msg
+        self.model_reply = model_reply
+        self.calls = calls
+        self.future = future
+
+    @property
+    def key(self) -> SessionKey:
+        return self.user_id, self.session_id
+
+
+class ExchangeWriter:
+    """
+    Write-behind queue for chat exchanges (user message + model reply).
+
+    Exchanges from all requests are collected and written by one background
+    task as a single multi-row INSERT per batch (plus one for the llm_usage
+    rows of the calls behind them), flushed when `batch_size`
+    exchanges are waiting or `flush_interval` seconds after the first one.
+    The queue is bounded: when it is full, `submit` waits (backpressure).
+
+    Each submit returns a future resolved once its rows are committed, so the
+    caller picks durability: await it, or return right away and let
+    `pending_for` give later reads of the same session their own writes.
+    A failed batch is retried row pair by row pair, so one bad exchange
+    doesn't take the others down with it.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_pending: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "asyncio.Queue[_PendingExchange]" = asyncio.Queue(maxsize=max_pending)
+        self._pending: Dict[SessionKey, List[asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.rows = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(
+        self, user_id: int, session_id: str, user_msg: str, model_reply: str, calls: Sequence[LLMResult] = ()
+    ) -> asyncio.Future:
+        """Queues an exchange (and the usage of its LLM calls); returns a future resolved when it is committed."""
+        if not self.running:
+            raise RuntimeError("ExchangeWriter is not running")
+        future = asyncio.get_running_loop().create_future()
+        item = _PendingExchange(user_id, session_id, user_msg, model_reply, calls, future)
+        self._pending.setdefault(item.key, []).append(future)
+        future.add_done_callback(lambda f: self._forget(item.key, f))
+        await self._queue.put(item)
+        return future
+
+    async def pending_for(self, user_id: int, session_id: str) -> None:
+        """Waits until exchanges already queued for this session are written (read-your-writes)."""
+        futures = self._pending.get((user_id, session_id))
+        if futures:
+            await asyncio.wait(list(futures))
+
+    async def drain(self, timeout: float = 10.0) -> None:
+        """Flushes everything queued, then stops the background task (app shutdown)."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Exchange writer drain timed out with {self._queue.qsize()} exchanges queued")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "rows": self.rows,
+            "failed_exchanges": self.failed,
+        }
+
+    def _forget(self, key: SessionKey, future: asyncio.Future) -> None:
+        futures = self._pending.get(key)
+        if futures is None:
+            return
+        futures.remove(future)
+        if not futures:
+            del self._pending[key]
+        # Fire-and-forget callers never retrieve a failure; it was already logged
+        if not future.cancelled():
+            future.exception()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: List[_PendingExchange]) -> None:
+        try:
+            await self._insert(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                self._fail(batch[0], e)
+                return
+            logger.warning(f"Batch insert of {len(batch)} exchanges failed ({e}); retrying one by one")
+            for item in batch:
+                try:
+                    await self._insert([item])
+                except Exception as item_error:
+                    self._fail(item, item_error)
+
+    async def _insert(self, batch: List[_PendingExchange]) -> None:
+        rows = []
+        for item in batch:
+            rows.append({"session_id": item.session_id, "role": "user", "content": item.user_msg, "user_id": item.user_id})
+            rows.append({"session_id": item.session_id, "role": "model", "content": item.model_reply, "user_id": item.user_id})
+
+        async with AsyncSessionLocal() as db:
+            # One multi-row INSERT ... RETURNING id, ids in parameter order
+            result = await db.execute(
+                insert(ConversationHistory).returning(ConversationHistory.id, sort_by_parameter_order=True),
+                rows,
+            )
+            ids = result.scalars().all()
+            usage = [
+                row
+                for i, item in enumerate(batch)
+                for row in usage_rows(item.user_id, item.session_id, ids[2 * i + 1], item.calls)
+            ]
+            if usage:
+                await db.execute(insert(LLMUsage), usage)
+            await db.commit()
+
+        self.batches += 1
+        self.rows += len(rows)
+        for i, item in enumerate(batch):
+            replica_router.mark_written(item.user_id)
+            history_cache.append(item.user_id, item.session_id, (
+                HistoryRecord.of(ids[2 * i], "user", item.user_msg),
+                HistoryRecord.of(ids[2 * i + 1], "model", item.model_reply),
+            ))
+            if not item.future.done():
+                item.future.set_result(None)
+
+    def _fail(self, item: _PendingExchange, error: Exception) -> None:
+        self.failed += 1
+        logger.error(f"Failed to persist exchange for session {item.session_id}: {error}")
+        history_cache.invalidate(item.user_id, item.session_id)
+        if not item.future.done():
+            item.future.set_exception(error)
+
+
+# Global writer; started and drained in the app lifespan
+exchange_writer = ExchangeWriter(
+    batch_size=settings.EXCHANGE_WRITER_BATCH_SIZE,
+    flush_interval=settings.EXCHANGE_WRITER_FLUSH_MS / 1000,
+    max_pending=settings.EXCHANGE_WRITER_MAX_PENDING,
+)
@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import anthropic
+from openai import APIConnectionError, RateLimitError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal, release_connection
+from app.services.attachments import Attachment
+from app.services.chat_service import (
+    ChatService, Context, charge_tokens, check_token_budget, save_attachment_handles, save_exchange,
+)
+from app.services.llm_providers import LLMResult, TokenUsage
+from app.services.provider_guard import ProviderUnavailable
+from app.services.summarizer import session_summaries
+from app.services.usage import fill_estimates
+
+logger = logging.getLogger(__name__)
+
+# When to stop waiting: first answer, `quorum` answers, or every model
+FAN_OUT_MODES = ("all", "first", "quorum")
+
+# Wrap-ups of fan-out streams still running after their client left
+_finishing: Set[asyncio.Task] = set()
+
+
+@dataclass
+class ModelResult:
+    model: str
+    status: str = "pending"  # ok | error | timeout | cancelled
+    reply: Optional[str] = None
+    error: Optional[str] = None
+    latency_ms: Optional[float] = None
+
+
+def _needed(mode: str, quorum: Optional[int], n: int) -> int:
+    if mode == "first":
+        return 1
+    if mode == "quorum":
+        return max(1, min(quorum or (n // 2 + 1), n))
+    return n
+
+
+def _timeout_for(model: str, timeout: Optional[float], timeouts: Optional[Dict[str, float]]) -> float:
+    """Per-model override of the request, the request-wide timeout, the configured per-model one, the default."""
+    return (
+        (timeouts or {}).get(model)
+        or timeout
+        or settings.FAN_OUT_TIMEOUT_SECONDS_BY_MODEL.get(model)
+        or settings.LLM_TIMEOUT_SECONDS
+    )
+
+
+def _describe(error: BaseException) -> Tuple[str, str]:
+    """(status, client-safe message) for a failed model call."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout", "No answer within the timeout"
+    if isinstance(error, (RateLimitError, anthropic.RateLimitError)):
+        return "error", "LLM Rate Limit Exceeded"
+    if isinstance(error, (APIConnectionError, anthropic.APIConnectionError, ProviderUnavailable)):
+        return "error", "LLM Provider Unavailable"
+    if isinstance(error, ValueError):
+        return "error", str(error)
+    return "error", "Internal error"
+
+
+async def _load_contexts(
+    session_id: str, prompt: str, models: List[str], db: AsyncSession, user_id: int
+) -> Dict[str, Context]:
+    """Fetches the history window once and fits it to each model's token budget."""
+    contexts = await ChatService.build_contexts(session_id, db, user_id, models, prompt)
+    # Don't hold a pooled connection while waiting on the LLMs
+    await release_connection(db)
+    return contexts
+
+
+async def _persist(
+    session_id: str,
+    prompt: str,
+    reply: str,
+    db: AsyncSession,
+    user_id: int,
+    compact_through_id: Optional[int],
+    calls: List[LLMResult],
+) -> None:
+    try:
+        await save_exchange(session_id, prompt, reply, db, user_id=user_id, calls=calls)
+    except Exception:
+        logger.error(f"Failed to persist fan-out exchange for session {session_id}")
+    if compact_through_id:
+        session_summaries.schedule(user_id, session_id, compact_through_id)
+
+
+async def fan_out(
+    session_id: str,
+    prompt: str,
+    models: List[str],
+    db: AsyncSession,
+    user_id: int,
+    mode: str = "all",
+    quorum: Optional[int] = None,
+    timeout: Optional[float] = None,
+    timeouts: Optional[Dict[str, float]] = None,
+    openai_client=None,
+    image_data: Optional[Attachment] = None,
+    file_data: Optional[Attachment] = None,
+    use_search: bool = False,
+    persist: bool = True,
+) -> Tuple[List[ModelResult], Optional[str]]:
+    """
+    Sends the same prompt to several models concurrently and returns
+    (results in `models` order, model whose reply was saved).
+
+    History is loaded once. Each model gets its own timeout (see
+    _timeout_for: `timeouts`, `timeout`, then the configured defaults); the call
+    returns as soon as `mode` is satisfied (the first answer, a quorum, or all
+    models) and cancels the rest, so the wall time is the slowest *needed*
+    model, not the sum. The first successful reply is saved as the exchange,
+    with the usage of every model that answered.
+    """
+    check_token_budget(user_id, prompt, calls=len(models))
+    contexts = await _load_contexts(session_id, prompt, models, db, user_id)
+    results = {model: ModelResult(model) for model in models}
+
+    tasks: Dict[asyncio.Task, str] = {}
+    for model in models:
+        try:
+            provider = ChatService.get_provider(model, openai_client)
+        except ValueError as e:
+            results[model].status, results[model].error = "error", str(e)
+            continue
+        history, system_instruction, _ = contexts[model]
+        tasks[asyncio.create_task(asyncio.wait_for(provider.generate(
+            prompt=prompt,
+            history=history,
+            image_data=image_data,
+            file_data=file_data,
+            use_search=use_search,
+            system_instruction=system_instruction,
+        ), _timeout_for(model, timeout, timeouts)))] = model
+
+    needed = _needed(mode, quorum, len(models))
+    answered: List[str] = []
+    calls: List[LLMResult] = []
+    started = time.perf_counter()
+    pending = set(tasks)
+    try:
+        while pending and len(answered) < needed:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = results[tasks[task]]
+                result.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+                error = task.exception()
+                if error is None:
+                    call = fill_estimates(task.result(), contexts[result.model][0], prompt)
+                    result.status, result.reply = "ok", call.text
+                    charge_tokens(user_id, contexts[result.model][0], prompt, result.reply)
+                    answered.append(result.model)
+                    calls.append(call)
+                else:
+                    result.status, result.error = _describe(error)
+                    logger.warning(f"Fan-out model {result.model} failed (Sess={session_id}): {error!r}")
+    finally:
+        for task in pending:
+            task.cancel()
+            results[tasks[task]].status = "cancelled"
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    await save_attachment_handles(db, user_id, image_data, file_data)
+
+    persisted = answered[0] if answered else None
+    if persist and persisted:
+        await _persist(session_id, prompt, results[persisted].reply, db, user_id, contexts[persisted][2], calls)
+    return [results[model] for model in models], persisted
+
+
+async def fan_out_stream(
+    session_id: str,
+    prompt: str,
+    models: List[str],
+    db: AsyncSession,
+    user_id: int,
+    mode: str = "all",
+    quorum: Optional[int] = None,
+    timeout: Optional[float] = None,
+    timeouts: Optional[Dict[str, float]] = None,
+    openai_client=None,
+    image_data: Optional[Attachment] = None,
+    file_data: Optional[Attachment] = None,
+    use_search: bool = False,
+    persist: bool = True,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming fan-out: yields events tagged with their model, interleaved in
+    arrival order - {"model", "delta"} per chunk, then {"model", "status": "ok",
+    "latency_ms"} or {"model", "status", "error"} when a model finishes, and
+    {"model", "status": "cancelled"} for models stopped once `mode` is met.
+    Each model has its own timeout, as in fan_out. The first complete reply
+    is saved as the exchange, with the usage of every model that streamed
+    output.
+    """
+    check_token_budget(user_id, prompt, calls=len(models))
+    contexts = await _load_contexts(session_id, prompt, models, db, user_id)
+    events: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    replies: Dict[str, str] = {}
+    calls: List[LLMResult] = []
+    started = time.perf_counter()
+
+    async def pump(model: str, provider) -> None:
+        history, system_instruction, _ = contexts[model]
+        parts: List[str] = []
+        usage = TokenUsage()
+        try:
+            async with asyncio.timeout(_timeout_for(model, timeout, timeouts)):
+                async for chunk in provider.generate_stream(
+                    prompt=prompt,
+                    history=history,
+                    image_data=image_data,
+                    file_data=file_data,
+                    use_search=use_search,
+                    system_instruction=system_instruction,
+                    usage=usage,
+                ):
+                    parts.append(chunk)
+                    await events.put({"model": model, "delta": chunk})
+        except Exception as e:
+            status, message = _describe(e)
+            logger.warning(f"Fan-out stream {model} failed (Sess={session_id}): {e!r}")
+            await events.put({"model": model, "status": status, "error": message})
+            return
+        finally:
+            # Streamed output is consumed even if the model is cancelled or fails midway
+            if parts:
+                charge_tokens(user_id, history, prompt, "".join(parts))
+                calls.append(fill_estimates(LLMResult(
+                    text="".join(parts),
+                    model=model,
+                    usage=usage,
+                    latency_ms=round((time.perf_counter() - started) * 1000, 1),
+                ), history, prompt))
+        replies[model] = "".join(parts)
+        await events.put({
+            "model": model, "status": "ok", "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+
+    async def finish() -> None:
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        async with AsyncSessionLocal() as own_db:
+            own_db.info["user_id"] = user_id
+            await save_attachment_handles(own_db, user_id, image_data, file_data)
+            if persist and answered:
+                await _persist(
+                    session_id, prompt, replies[answered[0]], own_db, user_id, contexts[answered[0]][2], calls
+                )
+
+    tasks: Dict[str, asyncio.Task] = {}
+    for model in models:
+        try:
+            provider = ChatService.get_provider(model, openai_client)
+        except ValueError as e:
+            yield {"model": model, "status": "error", "error": str(e)}
+            continue
+        tasks[model] = asyncio.create_task(pump(model, provider))
+
+    needed = _needed(mode, quorum, len(models))
+    finished: List[str] = []
+    answered: List[str] = []
+    try:
+        while len(finished) < len(tasks) and len(answered) < needed:
+            event = await events.get()
+            if "status" in event:
+                finished.append(event["model"])
+                if event["status"] == "ok":
+                    answered.append(event["model"])
+            yield event
+    finally:
+        for model, task in tasks.items():
+            if not task.done():
+                task.cancel()
+        # On a client disconnect this generator is being cancelled or closed, so
+        # the save runs in its own task and session rather than the request's
+        wrap_up = asyncio.create_task(finish())
+        _finishing.add(wrap_up)
+        wrap_up.add_done_callback(_finishing.discard)
+        await asyncio.shield(wrap_up)
+
+    for model in models:
+        if model in tasks and model not in finished:
+            yield {"model": model, "status": "cancelled"}
@@ -0,0 +1,162 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from app.core.config import settings
+from app.services.tokens import estimate_tokens
+
+# Rough per-record bookkeeping cost (tuple + str headers) added to the content
+# length when enforcing the memory cap.
+_RECORD_OVERHEAD_BYTES = 120
+
+
+class HistoryRecord(NamedTuple):
+    """
+    Immutable, compact stand-in for a ConversationHistory row.
+    Exposes the same `role` / `content` attributes the providers read, plus
+    the row's estimated token count (computed once, see `of`).
+    """
+    id: Optional[int]
+    role: str
+    content: str
+    tokens: int
+
+    @classmethod
+    def of(cls, id: Optional[int], role: str, content: str) -> "HistoryRecord":
+        return cls(id, role, content, estimate_tokens(content))
+
+
+CacheKey = Tuple[int, str]
+# (epoch, per-session write count) at the start of a DB read; see HistoryCache.generation
+Generation = Tuple[int, int]
+
+
+class _Entry:
+    __slots__ = ("records", "expires_at", "size")
+
+    def __init__(self, records: Tuple[HistoryRecord, ...], expires_at: float):
+        self.records = records
+        self.expires_at = expires_at
+        self.size = sum(len(r.content) + _RECORD_OVERHEAD_BYTES for r in records)
+
+
+class HistoryCache:
+    """
+    Bounded LRU + TTL cache of the most recent history window per (user_id, session_id).
+
+    Entries are only ever populated from a DB read (the full window) and then
+    extended write-through after a successful commit, so a hit is always the
+    same window the DB would return. Extending an entry keeps its expiry, so
+    writes made by other workers are picked up within the TTL. Single event
+    loop → no locking needed.
+
+    Each write bumps the session's generation; a DB read that started before
+    a write (its `generation` no longer current) is not cached, since it may
+    be missing the rows of that write.
+    """
+
+    def __init__(self, max_sessions: int, max_bytes: int, ttl_seconds: float, window: int):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.window = window
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._writes: Dict[CacheKey, int] = {}
+        # Bumped when `_writes` is pruned, which voids every read in flight
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int, session_id: str) -> Optional[Tuple[HistoryRecord, ...]]:
+        key = (user_id, session_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.records
+
+    def generation(self, user_id: int, session_id: str) -> Generation:
+        """Take before reading the window from the DB; pass to `put`."""
+        return self._epoch, self._writes.get((user_id, session_id), 0)
+
+    def put(self, user_id: int, session_id: str, records: Iterable[HistoryRecord], generation: Generation) -> None:
+        """Stores the full window as read from the DB, unless the session was written since the read began."""
+        key = (user_id, session_id)
+        if generation != self.generation(*key):
+            return
+        self._store(key, tuple(records)[-self.window:], time.monotonic() + self.ttl_seconds)
+
+    def append(self, user_id: int, session_id: str, records: Iterable[HistoryRecord]) -> None:
+        """
+        Extends a cached window after a commit. A session that is not cached is
+        left alone: we don't know its older rows, so the next read goes to the DB.
+        """
+        key = (user_id, session_id)
+        self._written(key)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        self._store(key, (entry.records + tuple(records))[-self.window:], entry.expires_at)
+
+    def invalidate(self, user_id: int, session_id: str) -> None:
+        key = (user_id, session_id)
+        self._written(key)
+        self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        self._writes.clear()
+        self._epoch += 1
+
+    def stats(self) -> Dict[str, int]:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _written(self, key: CacheKey) -> None:
+        self._writes[key] = self._writes.get(key, 0) + 1
+        # Keeps the map bounded; reads in flight are then refused by the new epoch
+        if len(self._writes) > 4 * self.max_sessions:
+            self._writes.clear()
+            self._epoch += 1
+
+    def _store(self, key: CacheKey, records: Tuple[HistoryRecord, ...], expires_at: float) -> None:
+        self._remove(key)
+        entry = _Entry(records, expires_at)
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while len(self._entries) > self.max_sessions or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+
+# Global cache instance shared by all requests in this worker
+history_cache = HistoryCache(
+    max_sessions=settings.HISTORY_CACHE_MAX_SESSIONS,
+    max_bytes=settings.HISTORY_CACHE_MAX_MB * 1024 * 1024,
+    ttl_seconds=settings.HISTORY_CACHE_TTL_SECONDS,
+    window=settings.HISTORY_LIMIT,
+)
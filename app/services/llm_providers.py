@@ -1,6 +1,10 @@
-import base64
 import asyncio
+import functools
+import logging
+import time
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any, Optional
 
 # IMPORT OF THE NEW 2025 SDK
@@ -10,8 +14,13 @@ from google.genai import types
 from openai import AsyncOpenAI, APIConnectionError, RateLimitError, APIStatusError
 import anthropic
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_not_exception_type
-from app.db.models import ConversationHistory
+from app.services.history_cache import HistoryRecord
+from app.services.attachments import Attachment
+from app.services.provider_guard import ProviderUnavailable, guarded, guarded_stream
 from app.core.config import settings
+from app.core.metrics import LLM_ERRORS, LLM_GENERATION_SECONDS, LLM_RETRIES, LLM_TIME_TO_FIRST_TOKEN_SECONDS
+
+logger = logging.getLogger(__name__)
 
 # Global System Prompt
 SYSTEM_INSTRUCTION = """
@@ -19,8 +28,73 @@ You are a professional virtual assistant named 'Clara'.
 You communicate in Spanish or English. Be concise, proactive, and helpful.
 """
 
-# Exceptions that must not be retried
-_NO_RETRY = (RateLimitError, anthropic.RateLimitError, asyncio.TimeoutError)
+# Exceptions that must not be retried (tenacity also sees CancelledError:
+# a cancelled call must stop, not be re-sent; ProviderUnavailable is a local
+# fail-fast rejection from the circuit breaker / concurrency limit)
+_NO_RETRY = (RateLimitError, anthropic.RateLimitError, asyncio.TimeoutError, asyncio.CancelledError, ProviderUnavailable)
+
+
+@dataclass
+class TokenUsage:
+    """
+    Tokens of one call as reported by the provider. `input_tokens` includes
+    the prompt tokens served from the provider's prompt cache (`cached_tokens`).
+    `estimated` marks counts filled in locally because the provider reported none.
+    """
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    estimated: bool = False
+
+    @property
+    def reported(self) -> bool:
+        return bool(self.input_tokens or self.output_tokens)
+
+
+@dataclass
+class LLMResult:
+    text: str
+    # Model alias as requested (see LLMProvider.alias)
+    model: str
+    usage: TokenUsage = field(default_factory=TokenUsage)
+    # Whole call, retries included
+    latency_ms: Optional[float] = None
+
+
+def _gemini_usage(metadata, usage: TokenUsage) -> None:
+    if metadata is None:
+        return
+    usage.input_tokens = metadata.prompt_token_count or 0
+    # Thinking tokens are billed as output
+    usage.output_tokens = (metadata.candidates_token_count or 0) + (metadata.thoughts_token_count or 0)
+    usage.cached_tokens = metadata.cached_content_token_count or 0
+
+
+def _openai_usage(reported, usage: TokenUsage) -> None:
+    if reported is None:
+        return
+    usage.input_tokens = reported.input_tokens or 0
+    usage.output_tokens = reported.output_tokens or 0
+    details = getattr(reported, "input_tokens_details", None)
+    usage.cached_tokens = getattr(details, "cached_tokens", 0) or 0
+
+
+def _anthropic_usage(reported, usage: TokenUsage) -> None:
+    if reported is None:
+        return
+    # Anthropic reports cache reads/writes apart from the uncached input tokens
+    cache_read = getattr(reported, "cache_read_input_tokens", 0) or 0
+    cache_write = getattr(reported, "cache_creation_input_tokens", 0) or 0
+    usage.input_tokens = (reported.input_tokens or 0) + cache_read + cache_write
+    usage.output_tokens = reported.output_tokens or 0
+    usage.cached_tokens = cache_read
+
+
+def _count_retry(retry_state) -> None:
+    provider = retry_state.args[0] if retry_state.args else None
+    LLM_RETRIES.labels(
+        getattr(provider, "vendor", "default"), type(retry_state.outcome.exception()).__name__
+    ).inc()
 
 
 def _retry_policy():
@@ -28,41 +102,106 @@ def _retry_policy():
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=1, max=10),
         retry=retry_if_not_exception_type(_NO_RETRY),
+        before_sleep=_count_retry,
         reraise=True,
     )
 
 
+def _instrumented(method):
+    """
+    Times a provider's `generate` (retries included) into the result's
+    `latency_ms` and the metrics, and counts its failures; apply above the
+    retry decorator.
+    """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = await method(self, *args, **kwargs)
+        except asyncio.CancelledError:
+            # Cancelled by the caller (fan-out loser, client gone); not a provider failure
+            raise
+        except BaseException as e:
+            LLM_ERRORS.labels(self.alias, type(e).__name__).inc()
+            raise
+        elapsed = time.perf_counter() - started
+        LLM_GENERATION_SECONDS.labels(self.alias, "generate").observe(elapsed)
+        result.latency_ms = round(elapsed * 1000, 1)
+        return result
+    return wrapper
+
+
+def _instrumented_stream(method):
+    """`_instrumented` for `generate_stream`, plus the time to the first chunk."""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        first = True
+        try:
+            async for chunk in method(self, *args, **kwargs):
+                if first:
+                    LLM_TIME_TO_FIRST_TOKEN_SECONDS.labels(self.alias).observe(time.perf_counter() - started)
+                    first = False
+                yield chunk
+        except (GeneratorExit, asyncio.CancelledError):
+            # The consumer stopped reading or was cancelled; not a provider failure
+            raise
+        except BaseException as e:
+            LLM_ERRORS.labels(self.alias, type(e).__name__).inc()
+            raise
+        LLM_GENERATION_SECONDS.labels(self.alias, "stream").observe(time.perf_counter() - started)
+    return wrapper
+
+
 class LLMProvider(ABC):
+    # Key of the circuit breaker / concurrency limit shared by the vendor's models
+    vendor: str = "default"
+    # Model name as requested (the metrics label); `model_name` may be mapped for the API
+    alias: str = "default"
+
     @abstractmethod
     async def generate(
         self,
         prompt: str,
-        history: List[ConversationHistory],
-        image_data: Optional[Dict[str, str]] = None,
-        file_data: Optional[Dict[str, str]] = None,
+        history: List[HistoryRecord],
+        image_data: Optional[Attachment] = None,
+        file_data: Optional[Attachment] = None,
         use_search: bool = False,
-    ) -> str:
+        system_instruction: Optional[str] = None,
+    ) -> LLMResult:
         pass
 
     async def generate_stream(
         self,
         prompt: str,
-        history: List[ConversationHistory],
-        image_data: Optional[Dict[str, str]] = None,
-        file_data: Optional[Dict[str, str]] = None,
+        history: List[HistoryRecord],
+        image_data: Optional[Attachment] = None,
+        file_data: Optional[Attachment] = None,
         use_search: bool = False,
+        system_instruction: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
     ):
-        """Default: yield the full response as a single chunk (non-streaming fallback)."""
-        result = await self.generate(prompt, history, image_data, file_data, use_search)
-        yield result
+        """
+        Default: yield the full response as a single chunk (non-streaming fallback).
+        Streams fill `usage`, if given, with the token counts reported at the end.
+        """
+        result = await self.generate(prompt, history, image_data, file_data, use_search, system_instruction)
+        if usage is not None:
+            usage.input_tokens, usage.output_tokens, usage.cached_tokens = (
+                result.usage.input_tokens, result.usage.output_tokens, result.usage.cached_tokens
+            )
+        yield result.text
 
 class GoogleGeminiProvider(LLMProvider):
-    def __init__(self, model_name: str, api_key: str):
-        self.model_name = model_name
-        # Initialization of the unified 2025 client
-        self.client = genai.Client(api_key=api_key)
+    vendor = "google"
 
-    def _format_content(self, history: List[ConversationHistory]) -> List[types.Content]:
+    def __init__(self, model_name: str, api_key: Optional[str] = None, client: Optional[genai.Client] = None):
+        self.model_name = self.alias = model_name
+        # Prefer the shared client from the provider registry; fall back to a
+        # dedicated unified 2025 client when used standalone.
+        self.client = client or genai.Client(api_key=api_key)
+
+    def _format_content(self, history: List[HistoryRecord]) -> List[types.Content]:
         """
         Converts DB history to types.Content objects for the new SDK.
         """
@@ -77,15 +216,45 @@ class GoogleGeminiProvider(LLMProvider):
             )
         return contents
 
+    async def _attachment_part(self, attachment: Attachment) -> types.Part:
+        """
+        Stored attachments above GEMINI_FILE_UPLOAD_MIN_BYTES are uploaded once to
+        the Files API and then sent by reference on every later turn; the new
+        handle is left on the attachment for the service to persist.
+        Everything else is sent inline as raw bytes.
+        """
+        uri = attachment.gemini_handle()
+        if uri is None and attachment.path and attachment.size >= settings.GEMINI_FILE_UPLOAD_MIN_BYTES:
+            try:
+                uploaded = await self.client.aio.files.upload(
+                    file=attachment.path,
+                    config=types.UploadFileConfig(mime_type=attachment.mime_type),
+                )
+                # Files expire after 48h; stop using the handle an hour early
+                expires = uploaded.expiration_time or datetime.now(timezone.utc) + timedelta(hours=48)
+                attachment.gemini_file_uri = uploaded.uri
+                attachment.gemini_file_expires_at = expires - timedelta(hours=1)
+                attachment.handles_changed = True
+                uri = uploaded.uri
+            except Exception as e:
+                logger.warning(f"Gemini file upload failed, sending inline: {e}")
+
+        if uri:
+            return types.Part.from_uri(file_uri=uri, mime_type=attachment.mime_type)
+        return types.Part.from_bytes(data=await attachment.get_bytes(), mime_type=attachment.mime_type)
+
+    @_instrumented
     @_retry_policy()
+    @guarded
     async def generate(
         self,
         prompt: str,
-        history: List[ConversationHistory],
-        image_data: Optional[Dict[str, str]] = None,
-        file_data: Optional[Dict[str, str]] = None,
-        use_search: bool = False
-    ) -> str:
+        history: List[HistoryRecord],
+        image_data: Optional[Attachment] = None,
+        file_data: Optional[Attachment] = None,
+        use_search: bool = False,
+        system_instruction: Optional[str] = None,
+    ) -> LLMResult:
 
         # 1. Tool Configuration (Grounding 2025)
         tools_config = []
@@ -96,7 +265,7 @@ class GoogleGeminiProvider(LLMProvider):
         # 2. Generation Configuration
         config = types.GenerateContentConfig(
             temperature=0.7,
-            system_instruction=SYSTEM_INSTRUCTION, # Passed in config, not in history
+            system_instruction=system_instruction or SYSTEM_INSTRUCTION, # Passed in config, not in history
             tools=tools_config,
             safety_settings=[
                 types.SafetySetting(
@@ -112,67 +281,60 @@ class GoogleGeminiProvider(LLMProvider):
         # Create current user message parts
         current_parts = [types.Part.from_text(text=prompt)]
 
-        # Multimodal handling (New SDK handles raw bytes or base64)
-        if image_data:
-            # Decode base64 to bytes asynchronously
-            img_bytes = await asyncio.to_thread(base64.b64decode, image_data["data"])
-            current_parts.append(
-                types.Part.from_bytes(
-                    data=img_bytes,
-                    mime_type=image_data["mime_type"]
-                )
-            )
-        elif file_data:
-            file_bytes = await asyncio.to_thread(base64.b64decode, file_data["data"])
-            current_parts.append(
-                types.Part.from_bytes(
-                    data=file_bytes,
-                    mime_type=file_data["mime_type"]
-                )
-            )
+        # Multimodal handling: Gemini takes raw bytes (or a Files API reference)
+        attachment = image_data or file_data
+        if attachment:
+            current_parts.append(await self._attachment_part(attachment))
 
         # Append current message at the end
         contents.append(types.Content(role="user", parts=current_parts))
 
-        # 4. Asynchronous Call with timeout (wrapped in thread for the synchronous SDK call)
-        def _call_sync():
-            return self.client.models.generate_content(
-                model=self.model_name,
-                contents=contents,
-                config=config
-            )
-
+        # 4. Native async call with timeout. On timeout wait_for cancels the
+        #    coroutine, which aborts the in-flight HTTP request instead of
+        #    leaving a worker thread blocked on it.
         try:
             response = await asyncio.wait_for(
-                asyncio.to_thread(_call_sync),
+                self.client.aio.models.generate_content(
+                    model=self.model_name,
+                    contents=contents,
+                    config=config
+                ),
                 timeout=settings.LLM_TIMEOUT_SECONDS,
             )
 
+            result = LLMResult(text="", model=self.alias)
+            _gemini_usage(response.usage_metadata, result.usage)
+
             # 5. Text extraction (Grounding might return parts without text)
             if response.text:
-                return response.text.strip()
-
-            # Fallback for purely metadata or tool usage responses
-            return "Processed information, but no verbal text was generated."
+                result.text = response.text.strip()
+            else:
+                # Fallback for purely metadata or tool usage responses
+                result.text = "Processed information, but no verbal text was generated."
+            return result
 
         except asyncio.TimeoutError:
             raise RuntimeError("LLM request timed out")
         except Exception as e:
             # Capture Google GenAI errors
-            raise RuntimeError(f"Google GenAI Error: {str(e)}")
+            raise RuntimeError(f"Google GenAI Error: {str(e)}") from e
 
+    @_instrumented_stream
+    @guarded_stream
     async def generate_stream(
         self,
         prompt: str,
-        history: List[ConversationHistory],
-        image_data: Optional[Dict[str, str]] = None,
-        file_data: Optional[Dict[str, str]] = None,
+        history: List[HistoryRecord],
+        image_data: Optional[Attachment] = None,
+        file_data: Optional[Attachment] = None,
         use_search: bool = False,
+        system_instruction: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
     ):
         tools_config = [types.Tool(google_search=types.GoogleSearch())] if use_search else []
         config = types.GenerateContentConfig(
             temperature=0.7,
-            system_instruction=SYSTEM_INSTRUCTION,
+            system_instruction=system_instruction or SYSTEM_INSTRUCTION,
             tools=tools_config,
             safety_settings=[
                 types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="BLOCK_ONLY_HIGH")
@@ -180,26 +342,29 @@ class GoogleGeminiProvider(LLMProvider):
         )
         contents = self._format_content(history)
         current_parts = [types.Part.from_text(text=prompt)]
-        if image_data:
-            img_bytes = await asyncio.to_thread(base64.b64decode, image_data["data"])
-            current_parts.append(types.Part.from_bytes(data=img_bytes, mime_type=image_data["mime_type"]))
-        elif file_data:
-            file_bytes = await asyncio.to_thread(base64.b64decode, file_data["data"])
-            current_parts.append(types.Part.from_bytes(data=file_bytes, mime_type=file_data["mime_type"]))
+        attachment = image_data or file_data
+        if attachment:
+            current_parts.append(await self._attachment_part(attachment))
         contents.append(types.Content(role="user", parts=current_parts))
 
         try:
-            async for chunk in self.client.aio.models.generate_content_stream(
+            async for chunk in await self.client.aio.models.generate_content_stream(
                 model=self.model_name, contents=contents, config=config
             ):
+                # Running totals; the last chunk carries the final counts
+                if usage is not None:
+                    _gemini_usage(chunk.usage_metadata, usage)
                 if chunk.text:
                     yield chunk.text
         except Exception as e:
-            raise RuntimeError(f"Google GenAI Stream Error: {str(e)}")
+            raise RuntimeError(f"Google GenAI Stream Error: {str(e)}") from e
 
 
 class OpenAIProvider(LLMProvider):
+    vendor = "openai"
+
     def __init__(self, model_name: str, client: AsyncOpenAI):
+        self.alias = model_name
         # Map model alias to reasoning effort and base model name.
         # e.g. "gpt-5.4-mini" → effort="low", model="gpt-5.4"
         if "mini" in model_name:
@@ -217,41 +382,43 @@ class OpenAIProvider(LLMProvider):
         )
         self.client = client
 
-    def _format_history(self, history: List[ConversationHistory]) -> List[Dict[str, Any]]:
+    def _format_history(
+        self, history: List[HistoryRecord], system_instruction: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         # Responses API: system message uses plain string content
         messages: List[Dict[str, Any]] = [
-            {"role": "system", "content": SYSTEM_INSTRUCTION.strip()}
+            {"role": "system", "content": (system_instruction or SYSTEM_INSTRUCTION).strip()}
         ]
         for m in history:
             role = "assistant" if m.role == "model" else "user"
             messages.append({"role": role, "content": m.content})
         return messages
 
+    @_instrumented
     @_retry_policy()
+    @guarded
     async def generate(
         self,
         prompt: str,
-        history: List[ConversationHistory],
-        image_data: Optional[Dict[str, str]] = None,
-        file_data: Optional[Dict[str, str]] = None,
-        use_search: bool = False
-    ) -> str:
+        history: List[HistoryRecord],
+        image_data: Optional[Attachment] = None,
+        file_data: Optional[Attachment] = None,
+        use_search: bool = False,
+        system_instruction: Optional[str] = None,
+    ) -> LLMResult:
         if not self.client:
             raise RuntimeError("OpenAI Client not initialized.")
 
-        messages = self._format_history(history)
+        messages = self._format_history(history, system_instruction)
 
         user_content = [{"type": "input_text", "text": prompt}]
 
         if image_data:
-            user_content.append({"type": "input_image", "image_base64": image_data["data"]})
+            user_content.append({"type": "input_image", "image_base64": await image_data.get_base64()})
 
-        if file_data and file_data["mime_type"].startswith("text/"):
-             # Decode and decode string in a thread to prevent blocking
-             raw = await asyncio.to_thread(
-                 lambda: base64.b64decode(file_data["data"]).decode("utf-8", errors="ignore")[:5000]
-             )
-             user_content.append({"type": "input_text", "text": f"File Content:\n{raw}"})
+        if file_data and file_data.is_text:
+            raw = await file_data.get_text(5000)
+            user_content.append({"type": "input_text", "text": f"File Content:\n{raw}"})
 
         messages.append({"role": "user", "content": user_content})
 
@@ -265,7 +432,9 @@ class OpenAIProvider(LLMProvider):
                 ),
                 timeout=settings.LLM_TIMEOUT_SECONDS,
             )
-            return resp.output_text or ""
+            result = LLMResult(text=resp.output_text or "", model=self.alias)
+            _openai_usage(resp.usage, result.usage)
+            return result
         except asyncio.TimeoutError:
             raise RuntimeError("LLM request timed out")
         except RateLimitError:
@@ -273,24 +442,28 @@ class OpenAIProvider(LLMProvider):
         except APIConnectionError:
             raise
         except APIStatusError as e:
-            raise RuntimeError(f"OpenAI API Error: {e.status_code} - {e.message}")
+            raise RuntimeError(f"OpenAI API Error: {e.status_code} - {e.message}") from e
         except Exception as e:
-            raise RuntimeError(f"Unexpected OpenAI Error: {str(e)}")
+            raise RuntimeError(f"Unexpected OpenAI Error: {str(e)}") from e
 
+    @_instrumented_stream
+    @guarded_stream
     async def generate_stream(
         self,
         prompt: str,
-        history: List[ConversationHistory],
-        image_data: Optional[Dict[str, str]] = None,
-        file_data: Optional[Dict[str, str]] = None,
+        history: List[HistoryRecord],
+        image_data: Optional[Attachment] = None,
+        file_data: Optional[Attachment] = None,
         use_search: bool = False,
+        system_instruction: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
     ):
-        messages = self._format_history(history)
+        messages = self._format_history(history, system_instruction)
         user_content = [{"type": "input_text", "text": prompt}]
         if image_data:
-            user_content.append({"type": "input_image", "image_base64": image_data["data"]})
-        if file_data and file_data["mime_type"].startswith("text/"):
-            raw = base64.b64decode(file_data["data"]).decode("utf-8", errors="ignore")[:5000]
+            user_content.append({"type": "input_image", "image_base64": await image_data.get_base64()})
+        if file_data and file_data.is_text:
+            raw = await file_data.get_text(5000)
             user_content.append({"type": "input_text", "text": f"File Content:\n{raw}"})
         messages.append({"role": "user", "content": user_content})
 
@@ -304,43 +477,55 @@ class OpenAIProvider(LLMProvider):
                     delta = getattr(event, "output_text_delta", None)
                     if delta:
                         yield delta
+                    elif usage is not None and event.type == "response.completed":
+                        _openai_usage(event.response.usage, usage)
         except RateLimitError:
             raise
         except APIConnectionError:
             raise
         except APIStatusError as e:
-            raise RuntimeError(f"OpenAI Stream Error: {e.status_code} - {e.message}")
+            raise RuntimeError(f"OpenAI Stream Error: {e.status_code} - {e.message}") from e
         except Exception as e:
-            raise RuntimeError(f"Unexpected OpenAI Stream Error: {str(e)}")
+            raise RuntimeError(f"Unexpected OpenAI Stream Error: {str(e)}") from e
 
 
 class ClaudeProvider(LLMProvider):
-    def __init__(self, model_name: str, api_key: str):
-        self.model_name = model_name
+    vendor = "anthropic"
+
+    def __init__(
+        self,
+        model_name: str,
+        api_key: Optional[str] = None,
+        client: Optional[anthropic.AsyncAnthropic] = None,
+    ):
+        self.model_name = self.alias = model_name
         # Map short alias to real Anthropic model ID
         _model_map = {
             "claude-sonnet-4-6": "claude-sonnet-4-6",
             "claude-haiku-4-5":  "claude-haiku-4-5-20251001",
         }
         self.model_id = _model_map.get(model_name, model_name)
-        self.client = anthropic.AsyncAnthropic(api_key=api_key)
+        self.client = client or anthropic.AsyncAnthropic(api_key=api_key)
 
-    def _format_history(self, history: List[ConversationHistory]) -> List[Dict[str, Any]]:
+    def _format_history(self, history: List[HistoryRecord]) -> List[Dict[str, Any]]:
         messages = []
         for m in history:
             role = "assistant" if m.role == "model" else "user"
             messages.append({"role": role, "content": m.content})
         return messages
 
+    @_instrumented
     @_retry_policy()
+    @guarded
     async def generate(
         self,
         prompt: str,
-        history: List[ConversationHistory],
-        image_data: Optional[Dict[str, str]] = None,
-        file_data: Optional[Dict[str, str]] = None,
+        history: List[HistoryRecord],
+        image_data: Optional[Attachment] = None,
+        file_data: Optional[Attachment] = None,
         use_search: bool = False,
-    ) -> str:
+        system_instruction: Optional[str] = None,
+    ) -> LLMResult:
         messages = self._format_history(history)
 
         user_content: List[Dict[str, Any]] = []
@@ -350,13 +535,13 @@ class ClaudeProvider(LLMProvider):
                 "type": "image",
                 "source": {
                     "type": "base64",
-                    "media_type": image_data["mime_type"],
-                    "data": image_data["data"],
+                    "media_type": image_data.mime_type,
+                    "data": await image_data.get_base64(),
                 },
             })
 
-        if file_data and file_data["mime_type"].startswith("text/"):
-            raw = base64.b64decode(file_data["data"]).decode("utf-8", errors="ignore")[:5000]
+        if file_data and file_data.is_text:
+            raw = await file_data.get_text(5000)
             user_content.append({"type": "text", "text": f"File Content:\n{raw}"})
 
         user_content.append({"type": "text", "text": prompt})
@@ -367,38 +552,44 @@ class ClaudeProvider(LLMProvider):
                 self.client.messages.create(
                     model=self.model_id,
                     max_tokens=8096,
-                    system=SYSTEM_INSTRUCTION.strip(),
+                    system=(system_instruction or SYSTEM_INSTRUCTION).strip(),
                     messages=messages,
                 ),
                 timeout=settings.LLM_TIMEOUT_SECONDS,
             )
-            return response.content[0].text
+            result = LLMResult(text=response.content[0].text, model=self.alias)
+            _anthropic_usage(response.usage, result.usage)
+            return result
         except asyncio.TimeoutError:
             raise RuntimeError("LLM request timed out")
         except (anthropic.RateLimitError, anthropic.APIConnectionError):
             raise  # Caught by service layer
         except anthropic.APIStatusError as e:
-            raise RuntimeError(f"Claude API Error: {e.status_code} - {e.message}")
+            raise RuntimeError(f"Claude API Error: {e.status_code} - {e.message}") from e
         except Exception as e:
-            raise RuntimeError(f"Unexpected Claude Error: {str(e)}")
+            raise RuntimeError(f"Unexpected Claude Error: {str(e)}") from e
 
+    @_instrumented_stream
+    @guarded_stream
     async def generate_stream(
         self,
         prompt: str,
-        history: List[ConversationHistory],
-        image_data: Optional[Dict[str, str]] = None,
-        file_data: Optional[Dict[str, str]] = None,
+        history: List[HistoryRecord],
+        image_data: Optional[Attachment] = None,
+        file_data: Optional[Attachment] = None,
         use_search: bool = False,
+        system_instruction: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
     ):
         messages = self._format_history(history)
         user_content: List[Dict[str, Any]] = []
         if image_data:
             user_content.append({
                 "type": "image",
-                "source": {"type": "base64", "media_type": image_data["mime_type"], "data": image_data["data"]},
+                "source": {"type": "base64", "media_type": image_data.mime_type, "data": await image_data.get_base64()},
             })
-        if file_data and file_data["mime_type"].startswith("text/"):
-            raw = base64.b64decode(file_data["data"]).decode("utf-8", errors="ignore")[:5000]
+        if file_data and file_data.is_text:
+            raw = await file_data.get_text(5000)
             user_content.append({"type": "text", "text": f"File Content:\n{raw}"})
         user_content.append({"type": "text", "text": prompt})
         messages.append({"role": "user", "content": user_content})
@@ -407,14 +598,16 @@ class ClaudeProvider(LLMProvider):
             async with self.client.messages.stream(
                 model=self.model_id,
                 max_tokens=8096,
-                system=SYSTEM_INSTRUCTION.strip(),
+                system=(system_instruction or SYSTEM_INSTRUCTION).strip(),
                 messages=messages,
             ) as stream:
                 async for text in stream.text_stream:
                     yield text
+                if usage is not None:
+                    _anthropic_usage((await stream.get_final_message()).usage, usage)
         except (anthropic.RateLimitError, anthropic.APIConnectionError):
             raise
         except anthropic.APIStatusError as e:
-            raise RuntimeError(f"Claude Stream Error: {e.status_code} - {e.message}")
+            raise RuntimeError(f"Claude Stream Error: {e.status_code} - {e.message}") from e
         except Exception as e:
-            raise RuntimeError(f"Unexpected Claude Stream Error: {str(e)}")
+            raise RuntimeError(f"Unexpected Claude Stream Error: {str(e)}") from e
@@ -0,0 +1,243 @@
+"""
+Latency-aware model routing with failover.
+
+Requests for "auto" or a tier ("fast", "balanced", "best") are served by the
+healthiest model of that tier: each model alias keeps a rolling window of
+recent calls (latency, success), a RoutingPolicy ranks the tier's models from
+those stats, and ModelRouter.run tries them in that order, moving on to the
+next one when a call fails with a rate limit, timeout, connection error or
+upstream 5xx. Explicit model names go through the same path with a single
+candidate, so their calls feed the stats too.
+
+Samples older than `max_age` seconds are dropped, so a model that had a bad
+spell gets probed again once its failures have aged out.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from app.core.config import settings
+from app.services.provider_guard import is_failover_error
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+AUTO = "auto"
+
+
+class ModelStats:
+    """Rolling window of (time, latency_ms, ok) samples for one model alias."""
+
+    __slots__ = ("_samples", "max_age", "calls", "errors")
+
+    def __init__(self, window: int, max_age: float):
+        self._samples: Deque[Tuple[float, Optional[float], bool]] = deque(maxlen=window)
+        self.max_age = max_age
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, now: float, latency_ms: Optional[float], ok: bool) -> None:
+        self._samples.append((now, latency_ms, ok))
+        self.calls += 1
+        self.errors += not ok
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.max_age
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def samples(self, now: float) -> int:
+        self._prune(now)
+        return len(self._samples)
+
+    def error_rate(self, now: float) -> float:
+        self._prune(now)
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, _, ok in self._samples if not ok) / len(self._samples)
+
+    def percentile(self, now: float, q: float) -> Optional[float]:
+        """Latency percentile (0-100) over calls that took their full time (successes and timeouts)."""
+        self._prune(now)
+        latencies = sorted(lat for _, lat, _ in self._samples if lat is not None)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q / 100))]
+
+    def snapshot(self, now: float) -> Dict[str, object]:
+        p50, p95 = self.percentile(now, 50), self.percentile(now, 95)
+        return {
+            "samples": self.samples(now),
+            "p50_ms": round(p50, 1) if p50 is not None else None,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+            "error_rate": round(self.error_rate(now), 3),
+            "calls": self.calls,
+            "errors": self.errors,
+        }
+
+
+class RoutingPolicy:
+    """Orders a tier's models; the base policy keeps the configured order (plain priority failover)."""
+
+    name = "static"
+
+    def rank(self, models: List[str], stats: Dict[str, ModelStats], now: float) -> List[str]:
+        return list(models)
+
+
+class LatencyPolicy(RoutingPolicy):
+    """
+    Lowest p95 latency first, inflated by the error rate. Models with fewer
+    than `min_samples` recent calls rank first (optimistic, so they get
+    measured); models above `max_error_rate` go last. Ties keep tier order.
+    """
+
+    name = "latency"
+
+    def __init__(self, min_samples: int = 5, max_error_rate: float = 0.5, error_penalty: float = 4.0):
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.error_penalty = error_penalty
+
+    def score(self, stats: Optional[ModelStats], now: float) -> Tuple[int, float]:
+        if stats is None or stats.samples(now) < self.min_samples:
+            return 0, 0.0
+        error_rate = stats.error_rate(now)
+        p95 = stats.percentile(now, 95)
+        if error_rate > self.max_error_rate or p95 is None:
+            return 1, error_rate
+        return 0, p95 * (1 + self.error_penalty * error_rate)
+
+    def rank(self, models: List[str], stats: Dict[str, ModelStats], now: float) -> List[str]:
+        return sorted(models, key=lambda m: self.score(stats.get(m), now))
+
+
+POLICIES: Dict[str, Callable[..., RoutingPolicy]] = {
+    RoutingPolicy.name: RoutingPolicy,
+    LatencyPolicy.name: LatencyPolicy,
+}
+
+
+class ModelRouter:
+    """
+    Resolves "auto" / tier names to ranked candidate models and runs a call
+    against them with failover. `clock` is injectable for simulations.
+    """
+
+    def __init__(
+        self,
+        tiers: Dict[str, List[str]],
+        policy: RoutingPolicy,
+        default_tier: str,
+        window: int = 200,
+        max_age: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.tiers = tiers
+        self.policy = policy
+        self.default_tier = default_tier
+        self.window = window
+        self.max_age = max_age
+        self.clock = clock
+        self._stats: Dict[str, ModelStats] = {}
+        self.failovers = 0
+
+    def is_routed(self, name: str) -> bool:
+        return name == AUTO or name in self.tiers
+
+    def candidates(self, name: str) -> List[str]:
+        """Models to try for `name`, best first; an explicit model is its only candidate."""
+        if not self.is_routed(name):
+            return [name]
+        tier = self.default_tier if name == AUTO else name
+        return self.policy.rank(self.tiers.get(tier, []), self._stats, self.clock())
+
+    def record(self, model: str, latency_ms: Optional[float], ok: bool) -> None:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats(self.window, self.max_age)
+        stats.record(self.clock(), latency_ms, ok)
+
+    def _record_failure(self, model: str, started: float, error: BaseException) -> None:
+        # Timeouts count with their full latency; fast failures (429s) only as errors
+        timed_out = isinstance(error, (asyncio.TimeoutError, TimeoutError)) or "timed out" in str(error).lower()
+        self.record(model, (self.clock() - started) * 1000 if timed_out else None, False)
+
+    def _should_fail_over(self, model: str, error: BaseException, remaining: int) -> bool:
+        if remaining == 0 or not is_failover_error(error):
+            return False
+        self.failovers += 1
+        logger.warning(f"Model {model} failed ({error!r}); failing over")
+        return True
+
+    async def run(self, candidates: List[str], call: Callable[[str], Awaitable[T]]) -> Tuple[str, T]:
+        """Calls `call(model)` for each candidate in order until one succeeds; returns (model, result)."""
+        if not candidates:
+            raise ValueError("No candidate models")
+        for i, model in enumerate(candidates):
+            started = self.clock()
+            try:
+                result = await call(model)
+            except Exception as e:
+                self._record_failure(model, started, e)
+                if self._should_fail_over(model, e, len(candidates) - i - 1):
+                    continue
+                raise
+            self.record(model, (self.clock() - started) * 1000, True)
+            return model, result
+
+    async def stream(
+        self, candidates: List[str], open_stream: Callable[[str], AsyncIterator[T]]
+    ) -> AsyncIterator[Tuple[str, T]]:
+        """
+        Streaming variant of `run`, yielding (model, chunk). Fails over only
+        before the first chunk: once output has been sent, errors propagate.
+        """
+        if not candidates:
+            raise ValueError("No candidate models")
+        for i, model in enumerate(candidates):
+            started = self.clock()
+            streamed = False
+            try:
+                async for chunk in open_stream(model):
+                    streamed = True
+                    yield model, chunk
+            except Exception as e:
+                self._record_failure(model, started, e)
+                if not streamed and self._should_fail_over(model, e, len(candidates) - i - 1):
+                    continue
+                raise
+            self.record(model, (self.clock() - started) * 1000, True)
+            return
+
+    def stats(self) -> Dict[str, object]:
+        now = self.clock()
+        return {
+            "policy": self.policy.name,
+            "failovers": self.failovers,
+            "models": {model: stats.snapshot(now) for model, stats in sorted(self._stats.items())},
+        }
+
+
+def _build_router() -> ModelRouter:
+    policy_cls = POLICIES.get(settings.MODEL_ROUTER_POLICY)
+    if policy_cls is None:
+        raise ValueError(f"Unknown MODEL_ROUTER_POLICY {settings.MODEL_ROUTER_POLICY!r}; use one of {sorted(POLICIES)}")
+    policy = (
+        LatencyPolicy(settings.MODEL_ROUTER_MIN_SAMPLES, settings.MODEL_ROUTER_MAX_ERROR_RATE)
+        if policy_cls is LatencyPolicy else policy_cls()
+    )
+    return ModelRouter(
+        tiers=settings.MODEL_TIERS,
+        policy=policy,
+        default_tier=settings.MODEL_ROUTER_DEFAULT_TIER,
+        window=settings.MODEL_ROUTER_WINDOW,
+        max_age=settings.MODEL_ROUTER_MAX_AGE_SECONDS,
+    )
+
+
+# Global router, shared by every request of this worker
+model_router = _build_router()
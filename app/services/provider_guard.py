@@ -0,0 +1,280 @@
+"""
+Per-vendor circuit breaker and adaptive concurrency limit for LLM calls.
+
+Every provider call attempt (including each tenacity retry) runs inside its
+vendor's ProviderGuard:
+
+- CircuitBreaker: after `failure_threshold` consecutive overload/outage
+  failures the circuit opens and calls fail fast with CircuitOpenError for
+  `open_seconds`; then a few half-open probe calls decide whether it closes
+  again or re-opens.
+- AIMDLimiter: caps concurrent calls per vendor. The limit grows by ~1 per
+  `limit` successful calls (additive increase) and halves on an overload
+  failure (multiplicative decrease). A call that finds no free slot waits up
+  to `queue_timeout` seconds, then fails with ProviderOverloaded.
+
+Both errors are ProviderUnavailable, which the model router fails over on
+and which is never retried, so an outage costs a request milliseconds
+instead of a full retry cycle.
+"""
+import asyncio
+import functools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Optional
+
+import anthropic
+import httpx
+import openai
+from google.genai import errors as genai_errors
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderUnavailable(Exception):
+    """Rejected locally without calling the provider."""
+
+    def __init__(self, vendor: str, reason: str, retry_after: float):
+        super().__init__(f"{vendor}: {reason}")
+        self.vendor = vendor
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(ProviderUnavailable):
+    pass
+
+
+class ProviderOverloaded(ProviderUnavailable):
+    pass
+
+
+def is_failover_error(error: BaseException) -> bool:
+    """True for failures another model may not have: rate limits, timeouts, outages."""
+    if isinstance(error, ProviderUnavailable):
+        return True
+    if isinstance(error, RuntimeError):
+        # Providers wrap SDK errors in RuntimeError, with the original as the cause
+        if "timed out" in str(error).lower():
+            return True
+        return error.__cause__ is not None and is_failover_error(error.__cause__)
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, openai.APIConnectionError, anthropic.APIConnectionError)):
+        return True
+    if isinstance(error, (openai.APIStatusError, anthropic.APIStatusError)):
+        return error.status_code == 429 or error.status_code >= 500
+    if isinstance(error, genai_errors.APIError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        open_seconds: float,
+        half_open_probes: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.clock = clock
+        self._state = self.CLOSED
+        self._opened_until = 0.0
+        self._failures = 0
+        self._probes = 0
+        self.opens = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self.clock() >= self._opened_until:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_until - self.clock())
+
+    def allow(self) -> bool:
+        """Admits a call or raises CircuitOpenError; returns True for a half-open probe."""
+        state = self.state
+        if state == self.CLOSED:
+            return False
+        if state == self.HALF_OPEN and self._probes < self.half_open_probes:
+            self._probes += 1
+            return True
+        self.rejected += 1
+        raise CircuitOpenError(self.name, "circuit open", self.retry_after or self.open_seconds)
+
+    def record(self, ok: Optional[bool], probe: bool) -> None:
+        """`ok` is None for outcomes that say nothing about provider health (e.g. a 400, a cancel)."""
+        if probe:
+            self._probes = max(0, self._probes - 1)
+        if ok is None:
+            return
+        if ok:
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+            self._failures = 0
+            return
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        if self._state != self.OPEN:
+            self.opens += 1
+        self._state = self.OPEN
+        self._opened_until = self.clock() + self.open_seconds
+        self._failures = 0
+
+
+class AIMDLimiter:
+    def __init__(
+        self, name: str, initial: int, min_limit: int, max_limit: int, queue_timeout: float, backoff: float = 0.5
+    ):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        self.in_flight = 0
+        self.rejected = 0
+        self._cond = asyncio.Condition()
+
+    def _has_slot(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self) -> None:
+        """Takes a slot, waiting up to `queue_timeout`; raises ProviderOverloaded otherwise."""
+        if self._has_slot():
+            self.in_flight += 1
+            return
+        async with self._cond:
+            try:
+                await asyncio.wait_for(self._cond.wait_for(self._has_slot), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise ProviderOverloaded(self.name, f"concurrency limit {int(self.limit)} reached", self.queue_timeout)
+            self.in_flight += 1
+
+    async def release(self, ok: Optional[bool]) -> None:
+        self.in_flight -= 1
+        if ok:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        elif ok is False:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        async with self._cond:
+            self._cond.notify_all()
+
+
+class ProviderGuard:
+    def __init__(self, vendor: str, breaker: CircuitBreaker, limiter: AIMDLimiter, enabled: bool = True):
+        self.vendor = vendor
+        self.breaker = breaker
+        self.limiter = limiter
+        self.enabled = enabled
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Runs one provider call attempt under the breaker and the concurrency limit."""
+        if not self.enabled:
+            yield
+            return
+        probe = self.breaker.allow()
+        try:
+            await self.limiter.acquire()
+        except ProviderUnavailable:
+            self.breaker.record(None, probe)
+            raise
+        ok: Optional[bool] = None
+        try:
+            yield
+            ok = True
+        except Exception as e:
+            ok = False if is_failover_error(e) else None
+            raise
+        finally:
+            opens = self.breaker.opens
+            self.breaker.record(ok, probe)
+            await self.limiter.release(ok)
+            if self.breaker.opens > opens:
+                logger.warning(f"Circuit for {self.vendor} opened for {self.breaker.open_seconds:.0f}s")
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.breaker.state,
+            "in_flight": self.limiter.in_flight,
+            "concurrency_limit": int(self.limiter.limit),
+            "opens": self.breaker.opens,
+            "rejected_open": self.breaker.rejected,
+            "rejected_overloaded": self.limiter.rejected,
+        }
+
+
+class ProviderGuards:
+    """One guard per vendor, created on first use from settings."""
+
+    def __init__(self):
+        self._guards: Dict[str, ProviderGuard] = {}
+
+    def get(self, vendor: str) -> ProviderGuard:
+        guard = self._guards.get(vendor)
+        if guard is None:
+            guard = self._guards[vendor] = ProviderGuard(
+                vendor,
+                CircuitBreaker(
+                    vendor,
+                    settings.PROVIDER_BREAKER_FAILURE_THRESHOLD,
+                    settings.PROVIDER_BREAKER_OPEN_SECONDS,
+                    settings.PROVIDER_BREAKER_HALF_OPEN_PROBES,
+                ),
+                AIMDLimiter(
+                    vendor,
+                    settings.PROVIDER_LIMIT_INITIAL,
+                    settings.PROVIDER_LIMIT_MIN,
+                    settings.PROVIDER_LIMIT_MAX,
+                    settings.PROVIDER_LIMIT_QUEUE_TIMEOUT,
+                ),
+                enabled=settings.PROVIDER_GUARD_ENABLED,
+            )
+        return guard
+
+    def clear(self) -> None:
+        self._guards.clear()
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {vendor: guard.stats() for vendor, guard in sorted(self._guards.items())}
+
+
+provider_guards = ProviderGuards()
+
+
+def guarded(method):
+    """Runs a provider's `generate` attempt under its vendor's guard (apply below the retry decorator)."""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        async with provider_guards.get(self.vendor).slot():
+            return await method(self, *args, **kwargs)
+    return wrapper
+
+
+def guarded_stream(method):
+    """`guarded` for `generate_stream`; the slot is held until the stream ends."""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        async with provider_guards.get(self.vendor).slot():
+            async for chunk in method(self, *args, **kwargs):
+                yield chunk
+    return wrapper
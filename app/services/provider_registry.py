@@ -0,0 +1,154 @@
+import logging
+from typing import Dict, Optional
+
+import anthropic
+import httpx
+from google import genai
+from google.genai import types
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from app.core.config import settings
+from app.services.llm_providers import (
+    ClaudeProvider,
+    GoogleGeminiProvider,
+    LLMProvider,
+    OpenAIProvider,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.LLM_POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+class ProviderRegistry:
+    """
+    Process-wide cache of long-lived LLM providers, one per model alias.
+
+    SDK clients (and their keep-alive HTTP connection pools) are created once
+    in the app lifespan and shared by every provider of the same vendor, so a
+    chat request only pays for a dict lookup instead of a new client + TLS
+    handshake. Call `aclose()` on shutdown to release the pools.
+    """
+
+    def __init__(self):
+        self.google_client: Optional[genai.Client] = None
+        self.openai_client: Optional[AsyncOpenAI] = None
+        self.anthropic_client: Optional[anthropic.AsyncAnthropic] = None
+        self._providers: Dict[str, LLMProvider] = {}
+        self.started = False
+
+    def startup(self) -> None:
+        """Builds the shared SDK clients. Missing API keys leave that vendor disabled."""
+        limits = _pool_limits()
+
+        if settings.GOOGLE_API_KEY:
+            try:
+                self.google_client = genai.Client(
+                    api_key=settings.GOOGLE_API_KEY,
+                    http_options=types.HttpOptions(
+                        client_args={"limits": limits},
+                        async_client_args={"limits": limits},
+                    ),
+                )
+                logger.info("Google GenAI Client: Ready (shared pool).")
+            except Exception as e:
+                logger.error(f"Google Client Error: {e}")
+
+        if settings.OPENAI_API_KEY:
+            try:
+                self.openai_client = AsyncOpenAI(
+                    api_key=settings.OPENAI_API_KEY,
+                    http_client=DefaultAsyncHttpxClient(limits=limits),
+                )
+                logger.info("OpenAI Client: Ready (shared pool).")
+            except Exception as e:
+                logger.error(f"OpenAI Error: {e}")
+
+        if settings.ANTHROPIC_API_KEY:
+            try:
+                self.anthropic_client = anthropic.AsyncAnthropic(
+                    api_key=settings.ANTHROPIC_API_KEY,
+                    http_client=anthropic.DefaultAsyncHttpxClient(limits=limits),
+                )
+                logger.info("Anthropic Client: Ready (shared pool).")
+            except Exception as e:
+                logger.error(f"Anthropic Error: {e}")
+
+        self.started = True
+
+    def get(self, model_name: str) -> LLMProvider:
+        """
+        Returns the cached provider for `model_name`, creating it on first use.
+        Raises ValueError for unknown models or vendors without a configured key.
+        """
+        provider = self._providers.get(model_name)
+        if provider is not None:
+            return provider
+
+        model_lower = model_name.lower()
+
+        if "gemini" in model_lower:
+            if self.google_client is None:
+                raise ValueError("GOOGLE_API_KEY is not configured.")
+            provider = GoogleGeminiProvider(model_name=model_name, client=self.google_client)
+
+        elif "gpt" in model_lower:
+            if self.openai_client is None:
+                raise ValueError("OPENAI_API_KEY is not configured.")
+            provider = OpenAIProvider(model_name=model_name, client=self.openai_client)
+
+        elif "claude" in model_lower:
+            if self.anthropic_client is None:
+                raise ValueError("ANTHROPIC_API_KEY is not configured.")
+            provider = ClaudeProvider(model_name=model_name, client=self.anthropic_client)
+
+        else:
+            raise ValueError(f"Model not supported: {model_name}")
+
+        self._providers[model_name] = provider
+        return provider
+
+    async def aclose(self) -> None:
+        """Closes every shared SDK client. Safe to call more than once."""
+        self._providers.clear()
+
+        if self.google_client is not None:
+            try:
+                # Older google-genai releases have no explicit close; the pools
+                # are then released with the client object.
+                aio_close = getattr(self.google_client.aio, "aclose", None)
+                if aio_close:
+                    await aio_close()
+                sync_close = getattr(self.google_client, "close", None)
+                if sync_close:
+                    sync_close()
+            except Exception as e:
+                logger.warning(f"Error closing Google client: {e}")
+            self.google_client = None
+
+        if self.openai_client is not None:
+            try:
+                await self.openai_client.close()
+            except Exception as e:
+                logger.warning(f"Error closing OpenAI client: {e}")
+            self.openai_client = None
+
+        if self.anthropic_client is not None:
+            try:
+                await self.anthropic_client.close()
+            except Exception as e:
+                logger.warning(f"Error closing Anthropic client: {e}")
+            self.anthropic_client = None
+
+        self.started = False
+        logger.info("LLM provider registry closed.")
+
+
+# Global registry, populated in the app lifespan (see app/main.py)
+provider_registry = ProviderRegistry()
@@ -0,0 +1,153 @@
+import hashlib
+import importlib
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.services.attachments import Attachment
+from app.services.history_cache import HistoryRecord
+
+logger = logging.getLogger(__name__)
+
+# Field separator for the cache key hash (cannot appear in UTF-8 text)
+_SEP = b"\xff"
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    reply: str
+    # Provider latency of the original call, used to report time saved on hits
+    latency_ms: float
+
+
+class ResponseCacheBackend(ABC):
+    """
+    Storage for cached replies. Implement this for a shared store (Redis,
+    memcached, ...) so several uvicorn workers share hits, and point
+    RESPONSE_CACHE_BACKEND at it as "package.module:ClassName". The class is
+    built with `(max_entries, ttl_seconds)`.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: CachedResponse) -> None:
+        pass
+
+
+class InMemoryResponseCacheBackend(ResponseCacheBackend):
+    """Per-process LRU with TTL. Default backend."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, CachedResponse]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: CachedResponse) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def _load_backend(spec: str) -> ResponseCacheBackend:
+    if spec == "memory":
+        cls = InMemoryResponseCacheBackend
+    else:
+        module_name, _, class_name = spec.partition(":")
+        cls = getattr(importlib.import_module(module_name), class_name)
+    return cls(settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_TTL_SECONDS)
+
+
+class ResponseCache:
+    """Exact-match reply cache in front of LLMProvider.generate, with hit/latency accounting."""
+
+    def __init__(self, backend: ResponseCacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.saved_latency_ms = 0.0
+
+    @staticmethod
+    def make_key(
+        model_name: str,
+        system_instruction: str,
+        history: Sequence[HistoryRecord],
+        prompt: str,
+        image_data: Optional[Attachment] = None,
+        file_data: Optional[Attachment] = None,
+    ) -> str:
+        """SHA-256 over model, system instruction, history window, prompt and attachment digests."""
+        h = hashlib.sha256()
+        h.update(model_name.encode())
+        h.update(_SEP)
+        h.update(system_instruction.strip().encode())
+        for m in history:
+            h.update(_SEP)
+            h.update(m.role.encode())
+            h.update(_SEP)
+            h.update(m.content.strip().encode())
+        h.update(_SEP)
+        h.update(prompt.strip().encode())
+        for attachment in (image_data, file_data):
+            h.update(_SEP)
+            if attachment:
+                h.update(attachment.mime_type.encode())
+                h.update(attachment.digest.encode())
+        return h.hexdigest()
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        try:
+            cached = await self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Response cache read failed: {e}")
+            cached = None
+
+        if cached is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.saved_latency_ms += cached.latency_ms
+        stats = self.stats()
+        logger.info(
+            f"Response cache hit (ratio={stats['hit_ratio']:.2%}, "
+            f"saved={cached.latency_ms:.0f} ms, total_saved={self.saved_latency_ms / 1000:.1f} s)"
+        )
+        return cached
+
+    async def set(self, key: str, reply: str, latency_ms: float) -> None:
+        try:
+            await self.backend.set(key, CachedResponse(reply=reply, latency_ms=latency_ms))
+        except Exception as e:
+            logger.warning(f"Response cache write failed: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_latency_ms": round(self.saved_latency_ms, 1),
+        }
+
+
+# Global instance; only consulted when RESPONSE_CACHE_ENABLED is set
+response_cache = ResponseCache(_load_backend(settings.RESPONSE_CACHE_BACKEND))
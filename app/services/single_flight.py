@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, TypeVar
+
+from app.services.attachments import Attachment
+
+T = TypeVar("T")
+
+
+async def request_key(
+    user_id: int, session_id: str, model_name: str, prompt: str, *attachments: Optional[Attachment]
+) -> tuple:
+    """(user_id, session_id, model, hash of prompt + attachments) identifying duplicate requests."""
+    h = hashlib.sha256(prompt.encode())
+    for attachment in attachments:
+        if attachment:
+            # Hashing up to MAX_UPLOAD_SIZE_MB of content would block the event loop
+            digest = await asyncio.to_thread(lambda: attachment.digest)
+            h.update(digest.encode())
+    return user_id, session_id, model_name, h.hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: the first caller for a key starts the
+    work in a task, later callers with the same key await that same task.
+    The task is shielded, so one caller disconnecting doesn't cancel the
+    others' result (or the persistence step inside it).
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved when every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+
+
+class _Broadcast:
+    """Items from one upstream stream, replayable by any number of subscribers."""
+
+    def __init__(self):
+        self.chunks: List[T] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: T) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[T]:
+        i = 0
+        while True:
+            while i < len(self.chunks):
+                yield self.chunks[i]
+                i += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class StreamFlight:
+    """
+    Single-flight for streams: one upstream generator per key, fanned out to
+    every subscriber. Late joiners first replay the items already received.
+    The upstream is cancelled once its last subscriber has gone away.
+    """
+
+    def __init__(self):
+        self._streams: Dict[Hashable, _Broadcast] = {}
+        self.coalesced = 0
+
+    def subscribe(self, key: Hashable, upstream: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            broadcast.task = asyncio.create_task(self._pump(key, broadcast, upstream))
+        else:
+            self.coalesced += 1
+        broadcast.subscribers += 1
+        return self._follow(key, broadcast)
+
+    async def _follow(self, key: Hashable, broadcast: _Broadcast) -> AsyncIterator[T]:
+        try:
+            async for chunk in broadcast.subscribe():
+                yield chunk
+        finally:
+            broadcast.subscribers -= 1
+            if not broadcast.subscribers and not broadcast.done:
+                # Nobody is listening: stop the upstream, and let new requests start a fresh one
+                self._forget(key, broadcast)
+                broadcast.task.cancel()
+
+    async def _pump(self, key: Hashable, broadcast: _Broadcast, upstream: Callable[[], AsyncIterator[T]]) -> None:
+        error = None
+        try:
+            async for chunk in upstream():
+                broadcast.publish(chunk)
+        except asyncio.CancelledError as e:
+            error = e
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            self._forget(key, broadcast)
+            broadcast.close(error)
+
+    def _forget(self, key: Hashable, broadcast: _Broadcast) -> None:
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
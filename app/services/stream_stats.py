@@ -0,0 +1,93 @@
+"""
+Per-response statistics of a chat stream: time to first chunk, chunk count,
+bytes, inter-chunk gaps, duration and output tokens per second.
+
+ChatService.process_chat_stream feeds every chunk it yields to a StreamStats
+and finishes it when the stream ends (completed, failed or abandoned), which
+also records the aggregate chat_stream_* metrics per model. The endpoint
+sends `as_dict()` to the client as the final `stats` event.
+"""
+import time
+from typing import Dict, Optional
+
+from app.core.metrics import (
+    CHAT_STREAM_BYTES, CHAT_STREAM_CHUNK_GAP_SECONDS, CHAT_STREAM_CHUNKS, CHAT_STREAM_DURATION_SECONDS,
+    CHAT_STREAM_FIRST_CHUNK_SECONDS, CHAT_STREAM_TOKENS_PER_SECOND,
+)
+from app.services.tokens import estimate_tokens_from_size
+
+
+class StreamStats:
+    __slots__ = (
+        "model", "started", "first_chunk_at", "last_chunk_at", "finished_at",
+        "chunks", "chars", "bytes", "max_gap", "_gaps",
+    )
+
+    def __init__(self, model: Optional[str] = None):
+        # Model that served the stream; taken from its first chunk (see ChatService.process_chat_stream)
+        self.model = model
+        self.started = time.perf_counter()
+        self.first_chunk_at: Optional[float] = None
+        self.last_chunk_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.chunks = 0
+        self.chars = 0
+        self.bytes = 0
+        self.max_gap = 0.0
+        self._gaps = None
+
+    def chunk(self, text: str, model: str) -> None:
+        """Records one chunk; `model` labels the metrics if no served model is known yet."""
+        now = time.perf_counter()
+        if self.first_chunk_at is None:
+            self.model = self.model or model
+            self.first_chunk_at = now
+            CHAT_STREAM_FIRST_CHUNK_SECONDS.labels(self.model).observe(now - self.started)
+            self._gaps = CHAT_STREAM_CHUNK_GAP_SECONDS.labels(self.model)
+        else:
+            gap = now - self.last_chunk_at
+            self._gaps.observe(gap)
+            if gap > self.max_gap:
+                self.max_gap = gap
+        self.last_chunk_at = now
+        self.chunks += 1
+        self.chars += len(text)
+        self.bytes += len(text.encode("utf-8"))
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens_from_size(self.chars, self.bytes)
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if self.chunks < 2 or self.last_chunk_at <= self.first_chunk_at:
+            return None
+        return self.tokens / (self.last_chunk_at - self.first_chunk_at)
+
+    def finish(self, model: str) -> None:
+        """Ends the stream and records the aggregate metrics (once)."""
+        if self.finished_at is not None:
+            return
+        self.finished_at = time.perf_counter()
+        self.model = self.model or model
+        CHAT_STREAM_DURATION_SECONDS.labels(self.model).observe(self.finished_at - self.started)
+        if self.chunks:
+            CHAT_STREAM_CHUNKS.labels(self.model).inc(self.chunks)
+            CHAT_STREAM_BYTES.labels(self.model).inc(self.bytes)
+        tokens_per_second = self.tokens_per_second
+        if tokens_per_second is not None:
+            CHAT_STREAM_TOKENS_PER_SECOND.labels(self.model).observe(tokens_per_second)
+
+    def as_dict(self) -> Dict[str, object]:
+        end = self.finished_at or time.perf_counter()
+        tokens_per_second = self.tokens_per_second
+        return {
+            "model": self.model,
+            "ttft_ms": round((self.first_chunk_at - self.started) * 1000, 1) if self.first_chunk_at else None,
+            "duration_ms": round((end - self.started) * 1000, 1),
+            "chunks": self.chunks,
+            "bytes": self.bytes,
+            "tokens": self.tokens,
+            "tokens_per_second": round(tokens_per_second, 1) if tokens_per_second is not None else None,
+            "max_gap_ms": round(self.max_gap * 1000, 1),
+        }
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models import ConversationHistory, ConversationSummary
+from app.db.session import AsyncSessionLocal
+from app.services.history_cache import HistoryRecord
+from app.services.provider_registry import provider_registry
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTION = """
+You maintain a running summary of a conversation between a user and an assistant.
+Merge the previous summary with the new messages into one concise summary.
+Keep facts, names, decisions, open questions and user preferences; drop small talk.
+Answer with the summary only, in the language of the conversation.
+"""
+
+# Per-message cap when building the summarization prompt, keeps the cheap call cheap
+_MAX_MESSAGE_CHARS = 2000
+
+SummaryKey = Tuple[int, str]
+
+
+class Summarizer(ABC):
+    @abstractmethod
+    async def summarize(self, previous_summary: Optional[str], messages: Sequence[HistoryRecord]) -> str:
+        pass
+
+
+class LLMSummarizer(Summarizer):
+    """Summarizes with a cheap model from the provider registry (SUMMARY_MODEL)."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    async def summarize(self, previous_summary: Optional[str], messages: Sequence[HistoryRecord]) -> str:
+        transcript = "\n".join(f"{m.role}: {m.content[:_MAX_MESSAGE_CHARS]}" for m in messages)
+        prompt = (
+            f"Previous summary:\n{previous_summary or '(none)'}\n\n"
+            f"New messages:\n{transcript}"
+        )
+        provider = provider_registry.get(self.model_name)
+        result = await provider.generate(prompt=prompt, history=[], system_instruction=SUMMARY_INSTRUCTION)
+        return result.text.strip()
+
+
+_summarizer: Summarizer = LLMSummarizer(settings.SUMMARY_MODEL)
+
+
+def get_summarizer() -> Summarizer:
+    return _summarizer
+
+
+def set_summarizer(summarizer: Summarizer) -> None:
+    """Swaps the summarizer implementation (e.g. a fake in tests)."""
+    global _summarizer
+    _summarizer = summarizer
+
+
+class SessionSummaries:
+    """
+    Loads stored session summaries (with a small in-process LRU + TTL cache,
+    so a compaction done by another worker shows up within `ttl_seconds`) and
+    runs compaction jobs in the background, at most one per session at a time.
+    """
+
+    def __init__(self, max_cached: int, ttl_seconds: float):
+        self.max_cached = max_cached
+        self.ttl_seconds = ttl_seconds
+        # key -> (summary, covered_through_id, expires_at)
+        self._cache: "OrderedDict[SummaryKey, Tuple[str, int, float]]" = OrderedDict()
+        self._running: Dict[SummaryKey, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def get(self, db: AsyncSession, user_id: int, session_id: str) -> Optional[Tuple[str, int]]:
+        """Returns (summary, covered_through_id) for the session, or None."""
+        key = (user_id, session_id)
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[2] >= time.monotonic():
+                self._cache.move_to_end(key)
+                return cached[0], cached[1]
+            del self._cache[key]
+
+        result = await db.execute(
+            select(ConversationSummary.summary, ConversationSummary.covered_through_id).where(
+                ConversationSummary.user_id == user_id,
+                ConversationSummary.session_id == session_id,
+            )
+        )
+        row = result.first()
+        if row is None:
+            return None
+        self._remember(key, (row.summary, row.covered_through_id))
+        return row.summary, row.covered_through_id
+
+    def schedule(self, user_id: int, session_id: str, through_id: int) -> None:
+        """Folds the session's turns up to `through_id` into its summary, off the request path."""
+        key = (user_id, session_id)
+        if key in self._running:
+            return
+        task = asyncio.create_task(self._compact(user_id, session_id, through_id))
+        self._running[key] = task
+        self._tasks.add(task)
+
+        def _done(t: asyncio.Task) -> None:
+            self._tasks.discard(t)
+            self._running.pop(key, None)
+
+        task.add_done_callback(_done)
+
+    async def drain(self, timeout: float = 10.0) -> None:
+        """Waits for in-flight compactions on shutdown; cancels stragglers."""
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+    async def _compact(self, user_id: int, session_id: str, through_id: int) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(ConversationSummary).where(
+                        ConversationSummary.user_id == user_id,
+                        ConversationSummary.session_id == session_id,
+                    )
+                )
+                row = result.scalars().first()
+                covered = row.covered_through_id if row else 0
+                if through_id <= covered:
+                    return
+
+                result = await db.execute(
+                    select(ConversationHistory.id, ConversationHistory.role, ConversationHistory.content)
+                    .where(
+                        ConversationHistory.user_id == user_id,
+                        ConversationHistory.session_id == session_id,
+                        ConversationHistory.id > covered,
+                        ConversationHistory.id <= through_id,
+                    )
+                    .order_by(ConversationHistory.id)
+                    .limit(settings.SUMMARY_MAX_MESSAGES)
+                )
+                messages = [HistoryRecord.of(*r) for r in result.all()]
+                if not messages:
+                    return
+
+                summary = await get_summarizer().summarize(row.summary if row else None, messages)
+                new_through = messages[-1].id
+                if row:
+                    row.summary = summary
+                    row.covered_through_id = new_through
+                else:
+                    db.add(ConversationSummary(
+                        user_id=user_id,
+                        session_id=session_id,
+                        summary=summary,
+                        covered_through_id=new_through,
+                    ))
+                await db.commit()
+
+            self._remember((user_id, session_id), (summary, new_through))
+            logger.info(f"Summarized Sess={session_id} through message {new_through} ({len(messages)} msgs)")
+        except Exception as e:
+            logger.error(f"Failed to summarize session {session_id}: {e}")
+
+    def _remember(self, key: SummaryKey, value: Tuple[str, int]) -> None:
+        self._cache[key] = (*value, time.monotonic() + self.ttl_seconds)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+
+# Global instance; drained in the app lifespan shutdown
+session_summaries = SessionSummaries(
+    max_cached=settings.HISTORY_CACHE_MAX_SESSIONS,
+    ttl_seconds=settings.SUMMARY_CACHE_TTL_SECONDS,
+)
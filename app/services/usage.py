@@ -0,0 +1,76 @@
+"""
+Per-call LLM usage (tokens, latency), saved with each exchange in llm_usage,
+and the aggregate queries over it.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import LLMUsage
+from app.services.history_cache import HistoryRecord
+from app.services.llm_providers import LLMResult
+from app.services.tokens import estimate_tokens
+
+
+def fill_estimates(result: LLMResult, history: Sequence[HistoryRecord], prompt: str) -> LLMResult:
+    """Estimates the token counts locally when the provider reported none (e.g. an interrupted stream)."""
+    if not result.usage.reported:
+        result.usage.input_tokens = sum(record.tokens for record in history) + estimate_tokens(prompt)
+        result.usage.output_tokens = estimate_tokens(result.text)
+        result.usage.estimated = True
+    return result
+
+
+def usage_rows(
+    user_id: int, session_id: str, message_id: Optional[int], calls: Sequence[LLMResult]
+) -> List[Dict[str, Any]]:
+    """llm_usage rows for the calls behind one exchange; `message_id` is its model reply."""
+    return [
+        {
+            "user_id": user_id,
+            "session_id": session_id,
+            "message_id": message_id,
+            "model": call.model,
+            "input_tokens": call.usage.input_tokens,
+            "output_tokens": call.usage.output_tokens,
+            "cached_tokens": call.usage.cached_tokens,
+            "estimated": call.usage.estimated,
+            "latency_ms": call.latency_ms,
+        }
+        for call in calls
+    ]
+
+
+async def usage_by_model(
+    db: AsyncSession, user_id: int, since: datetime, until: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """
+    The user's calls, token totals and average latency per model between
+    `since` and `until`; most tokens first.
+    """
+    total_tokens = func.sum(LLMUsage.input_tokens + LLMUsage.output_tokens)
+    query = (
+        select(
+            LLMUsage.model,
+            func.count().label("calls"),
+            func.sum(LLMUsage.input_tokens).label("input_tokens"),
+            func.sum(LLMUsage.output_tokens).label("output_tokens"),
+            func.sum(LLMUsage.cached_tokens).label("cached_tokens"),
+            func.avg(LLMUsage.latency_ms).label("avg_latency_ms"),
+        )
+        .where(LLMUsage.user_id == user_id, LLMUsage.created_at >= since)
+        .group_by(LLMUsage.model)
+        .order_by(total_tokens.desc())
+    )
+    if until is not None:
+        query = query.where(LLMUsage.created_at < until)
+    rows = (await db.execute(query)).all()
+    return [
+        {
+            **row._asdict(),
+            "avg_latency_ms": round(row.avg_latency_ms, 1) if row.avg_latency_ms is not None else None,
+        }
+        for row in rows
+    ]
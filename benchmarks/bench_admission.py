@@ -0,0 +1,145 @@
+"""
+Benchmark: a traffic spike on POST /api/v1/chat with and without admission control.
+
+A burst of concurrent chat requests (a small share from a "high" priority
+user, the rest "normal") hits the app in-process through httpx's ASGI
+transport. The stub Gemini server slows down in proportion to its load
+beyond `capacity` concurrent requests, like a saturated provider. The run
+is repeated with ADMISSION_ENABLED off and on, and reports per priority
+class how many requests succeeded or got a 503, their latency, and the
+queue wait from the X-Queue-Wait-Ms header, plus the upstream peak load.
+
+Without admission every request goes upstream at once and everyone waits
+for the overloaded provider; with it the provider stays at
+ADMISSION_MAX_IN_FLIGHT, high-priority requests jump the queue, and the
+excess is refused quickly with 503 + Retry-After instead of timing out.
+
+Usage:
+    python -m benchmarks.bench_admission [requests] [high_share]
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-google-key")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.gettempdir()}/bench_admission.db")
+os.environ.setdefault("EXCHANGE_WRITE_MODE", "direct")
+os.environ.setdefault("LLM_TOKEN_BUDGET", "")
+# Isolate admission control from the per-vendor concurrency limit
+os.environ.setdefault("PROVIDER_GUARD_ENABLED", "false")
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+os.environ.setdefault("ADMISSION_MAX_IN_FLIGHT", "16")
+os.environ.setdefault("ADMISSION_MAX_QUEUE", "64")
+os.environ.setdefault("ADMISSION_DEADLINE_SECONDS", '{"high": 20, "normal": 2, "low": 1}')
+
+import httpx  # noqa: E402
+from google import genai  # noqa: E402
+from google.genai import types  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+from app.core import security  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.rate_limit import limiter  # noqa: E402
+from app.db.models import Base, ConversationHistory, User  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services.admission import admission  # noqa: E402
+from app.services.provider_registry import provider_registry  # noqa: E402
+from benchmarks.stub_gemini import StubGeminiServer  # noqa: E402
+
+MODEL = "gemini-3-flash"
+
+
+async def _setup():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    users = {}
+    async with AsyncSessionLocal() as db:
+        for priority in ("high", "normal"):
+            user = User(email=f"bench-{priority}-{time.time_ns()}@example.com", hashed_password="x", is_active=True)
+            db.add(user)
+            await db.flush()
+            users[priority] = user
+        await db.commit()
+    settings.ADMISSION_USER_PRIORITY = {users["high"].email: "high"}
+    return {priority: (user.id, security.create_access_token(user.id)) for priority, user in users.items()}
+
+
+async def _one(client: httpx.AsyncClient, token: str, i: int):
+    started = time.perf_counter()
+    response = await client.post(
+        "/api/v1/chat/",
+        json={"session_id": f"bench-admission-{i}", "prompt": f"ping {i}", "model": MODEL},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    wait = response.headers.get("x-queue-wait-ms")
+    return response.status_code, time.perf_counter() - started, float(wait) if wait else None
+
+
+def _pct(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+async def _spike(server: StubGeminiServer, users, n: int, high_share: float) -> None:
+    server.reset()
+    every = max(1, round(1 / high_share)) if high_share else 0
+    classes = ["high" if every and i % every == 0 else "normal" for i in range(n)]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(_one(client, users[c][1], i) for i, c in enumerate(classes)))
+        elapsed = time.perf_counter() - started
+
+    for priority in ("high", "normal"):
+        rows = [r for r, c in zip(results, classes) if c == priority]
+        if not rows:
+            continue
+        ok = sorted(t for status, t, _ in rows if status == 200)
+        rejected = sorted(t for status, t, _ in rows if status == 503)
+        other = sum(1 for status, _, _ in rows if status not in (200, 503))
+        waits = sorted(w for status, _, w in rows if status == 200 and w is not None)
+        line = (f"  {priority:<7} n={len(rows):<4} ok={len(ok):<4} 503={len(rejected):<4} other={other:<3} "
+                f"ok p50={_pct(ok, 0.5):.2f}s p95={_pct(ok, 0.95):.2f}s")
+        if rejected:
+            line += f" | 503 p50={_pct(rejected, 0.5):.2f}s"
+        if waits:
+            line += f" | queue wait p95={_pct(waits, 0.95):.0f}ms"
+        print(line)
+    print(f"  upstream: calls={server.total} peak in flight={server.peak_in_flight}  wall={elapsed:.2f}s")
+
+
+async def main(n: int, high_share: float) -> None:
+    logging.disable(logging.CRITICAL)
+    limiter.enabled = False
+    server = StubGeminiServer(delay=0.5, capacity=16).start()
+    provider_registry.google_client = genai.Client(
+        api_key="stub", http_options=types.HttpOptions(base_url=server.base_url)
+    )
+    provider_registry.started = True
+    users = await _setup()
+
+    for enabled in (False, True):
+        admission.enabled = enabled
+        admission.clear()
+        print(f"admission {'on' if enabled else 'off'} ({n} concurrent requests, stub capacity {server.capacity}):")
+        await _spike(server, users, n, high_share)
+        if enabled:
+            print(f"  lane: {admission.stats()[MODEL]}")
+
+    async with AsyncSessionLocal() as db:
+        user_ids = [user_id for user_id, _ in users.values()]
+        await db.execute(delete(ConversationHistory).where(ConversationHistory.user_id.in_(user_ids)))
+        await db.execute(delete(User).where(User.id.in_(user_ids)))
+        await db.commit()
+    await engine.dispose()
+    server.stop()
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    share = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    asyncio.run(main(requests, share))
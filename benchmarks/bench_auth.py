@@ -0,0 +1,97 @@
+"""
+Benchmark: auth overhead per request (deps.get_current_user), with and without the token cache.
+
+Creates a user, mints a token and resolves it `requests` times from
+`concurrency` concurrent clients, each call with its own DB session as in a
+real request. Reports p50/p99 per call for:
+
+  - "uncached": JWT decode + user lookup on every call (AUTH_CACHE_ENABLED=false)
+  - "cached":   the same token served from auth_cache
+  - "invalid":  a forged token, served from the negative cache after the first call
+
+Uses a throwaway SQLite file by default; point DATABASE_URL at Postgres to
+include a real network round trip in the uncached numbers.
+
+Usage:
+    python -m benchmarks.bench_auth [requests] [concurrency]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-google-key")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.gettempdir()}/bench_auth.db")
+
+from fastapi import HTTPException  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+from app.api import deps  # noqa: E402
+from app.core import security  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.db.models import Base, User  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+from app.services.auth_cache import auth_cache  # noqa: E402
+
+BENCH_EMAIL = "bench-auth@example.com"
+
+
+async def _setup() -> str:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(User).where(User.email == BENCH_EMAIL))
+        user = User(email=BENCH_EMAIL, hashed_password="x", is_active=True)
+        db.add(user)
+        await db.commit()
+        return security.create_access_token(user.id)
+
+
+async def _resolve(token: str) -> float:
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        try:
+            await deps.get_current_user(db=db, token=token)
+        except HTTPException:
+            pass
+    return (time.perf_counter() - started) * 1000
+
+
+async def _run(token: str, requests: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            return await _resolve(token)
+
+    return await asyncio.gather(*(one() for _ in range(requests)))
+
+
+def _report(name: str, samples) -> None:
+    q = statistics.quantiles(samples, n=100)
+    print(f"{name:<10} p50={q[49]:7.3f} ms  p99={q[98]:7.3f} ms  mean={statistics.mean(samples):7.3f} ms")
+
+
+async def main(requests: int, concurrency: int) -> None:
+    token = await _setup()
+    print(f"{requests} requests, concurrency {concurrency}, db={engine.url.drivername}")
+
+    settings.AUTH_CACHE_ENABLED = False
+    await _run(token, 50, concurrency)  # warm up the pool
+    _report("uncached", await _run(token, requests, concurrency))
+
+    settings.AUTH_CACHE_ENABLED = True
+    auth_cache.clear()
+    _report("cached", await _run(token, requests, concurrency))
+    _report("invalid", await _run(token + "x", requests, concurrency))
+    print(f"auth_cache: {auth_cache.stats()}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    c = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    asyncio.run(main(n, c))
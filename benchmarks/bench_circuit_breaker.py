@@ -0,0 +1,116 @@
+"""
+Benchmark: a Gemini outage with and without the provider circuit breaker.
+
+A stub Gemini server answers normally, then fails every request with 503
+for a while, then recovers. Waves of concurrent ChatService.process_chat
+calls run through all three phases. The run is repeated with
+PROVIDER_GUARD_ENABLED off and on. For each phase it reports how long
+requests took, how many failed, and how many calls reached the upstream.
+
+Without the guard every request in the outage goes through the full tenacity
+retry cycle (3 attempts with backoff) and triples the load on the failing
+upstream; with it the circuit opens after a few failures and the rest fail
+in milliseconds with 503 + Retry-After. After recovery a single half-open
+probe closes the circuit; the rest of that first wave is still rejected.
+
+Usage:
+    python -m benchmarks.bench_circuit_breaker [waves] [concurrency]
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-google-key")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.gettempdir()}/bench_circuit_breaker.db")
+os.environ.setdefault("EXCHANGE_WRITE_MODE", "direct")
+os.environ.setdefault("PROVIDER_BREAKER_OPEN_SECONDS", "2")
+
+from fastapi import HTTPException  # noqa: E402
+from google import genai  # noqa: E402
+from google.genai import types  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.db.models import Base, ConversationHistory, User  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+from app.services.chat_service import ChatService  # noqa: E402
+from app.services.provider_guard import provider_guards  # noqa: E402
+from app.services.provider_registry import provider_registry  # noqa: E402
+from benchmarks.stub_gemini import StubGeminiServer  # noqa: E402
+
+MODEL = "gemini-3-flash"
+
+
+async def _setup() -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"bench-breaker-{time.time_ns()}@example.com", hashed_password="x", is_active=True)
+        db.add(user)
+        await db.commit()
+        return user.id
+
+
+async def _one(user_id: int, i: int):
+    started = time.perf_counter()
+    try:
+        await ChatService.process_chat(
+            session_id=f"bench-breaker-{i}", prompt=f"ping {i}", model_name=MODEL, user_id=user_id
+        )
+        status = 200
+    except HTTPException as e:
+        status = e.status_code
+    return status, time.perf_counter() - started
+
+
+async def _phase(label: str, server: StubGeminiServer, user_id: int, waves: int, concurrency: int) -> None:
+    upstream = server.total
+    results = []
+    for w in range(waves):
+        results += await asyncio.gather(*(_one(user_id, w * concurrency + i) for i in range(concurrency)))
+    latencies = sorted(t for _, t in results)
+    failed = sum(1 for status, _ in results if status != 200)
+    print(f"  {label:<10} requests={len(results):<4} failed={failed:<4} upstream calls={server.total - upstream:<4} "
+          f"p50={latencies[len(latencies) // 2]:.2f}s max={latencies[-1]:.2f}s")
+
+
+async def main(waves: int, concurrency: int) -> None:
+    logging.disable(logging.CRITICAL)
+    server = StubGeminiServer(delay=0.1).start()
+    provider_registry.google_client = genai.Client(
+        api_key="stub", http_options=types.HttpOptions(base_url=server.base_url)
+    )
+    provider_registry.started = True
+    user_id = await _setup()
+
+    for enabled in (False, True):
+        settings.PROVIDER_GUARD_ENABLED = enabled
+        provider_guards.clear()
+        print(f"provider guard {'on' if enabled else 'off'}:")
+        server.outage = False
+        await _phase("healthy", server, user_id, waves, concurrency)
+        server.outage = True
+        await _phase("outage", server, user_id, waves, concurrency)
+        server.outage = False
+        # Let the open circuit reach half-open before traffic resumes
+        await asyncio.sleep(settings.PROVIDER_BREAKER_OPEN_SECONDS)
+        await _phase("recovered", server, user_id, waves, concurrency)
+        if enabled:
+            print(f"  guard: {provider_guards.stats()['google']}")
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(ConversationHistory).where(ConversationHistory.user_id == user_id))
+        await db.execute(delete(User).where(User.id == user_id))
+        await db.commit()
+    await engine.dispose()
+    server.stop()
+
+
+if __name__ == "__main__":
+    w = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    c = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    asyncio.run(main(w, c))
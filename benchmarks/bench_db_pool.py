@@ -0,0 +1,102 @@
+"""
+Benchmark: DB connections held by concurrent chat requests while the LLM is working.
+
+Runs `requests` concurrent ChatService.process_chat calls, each on its own
+AsyncSession, against a stub Gemini server that holds every
+call for `delay` seconds. It samples the engine pool while they run and
+reports the peak number of checked-out connections. A request only holds a
+connection around its history read and exchange write, so the peak should
+stay near the pool size, not the request count, and nothing should hit
+DB_POOL_TIMEOUT.
+
+Uses a throwaway SQLite file by default; export DATABASE_URL to measure
+against Postgres with the DB_POOL_* settings applied.
+
+Usage:
+    python -m benchmarks.bench_db_pool [requests] [delay_seconds]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-google-key")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.gettempdir()}/bench_db_pool.db")
+os.environ.setdefault("EXCHANGE_WRITE_MODE", "direct")
+
+from google import genai  # noqa: E402
+from google.genai import types  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.db.models import Base, ConversationHistory, User  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+from app.services.chat_service import ChatService  # noqa: E402
+from app.services.provider_registry import provider_registry  # noqa: E402
+from benchmarks.stub_gemini import StubGeminiServer  # noqa: E402
+
+MODEL = "gemini-3-flash"
+
+
+async def _setup() -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"bench-pool-{time.time_ns()}@example.com", hashed_password="x", is_active=True)
+        db.add(user)
+        await db.commit()
+        return user.id
+
+
+async def main(requests: int, delay: float) -> None:
+    server = StubGeminiServer(delay=delay).start()
+    provider_registry.google_client = genai.Client(
+        api_key="stub", http_options=types.HttpOptions(base_url=server.base_url)
+    )
+    provider_registry.started = True
+    user_id = await _setup()
+
+    peak = 0
+    done = asyncio.Event()
+
+    async def sample():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, engine.pool.checkedout())
+            await asyncio.sleep(0.005)
+
+    async def one(i: int):
+        await ChatService.process_chat(
+            session_id=f"bench-pool-{i}", prompt=f"ping {i}", model_name=MODEL, user_id=user_id
+        )
+
+    sampler = asyncio.create_task(sample())
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(requests)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    done.set()
+    await sampler
+
+    failed = [r for r in results if isinstance(r, Exception)]
+    print(f"{requests} concurrent requests, LLM delay {delay:.1f}s, db={engine.url.drivername}, "
+          f"pool={engine.pool.__class__.__name__}({engine.pool.status()})")
+    print(f"peak checked-out connections: {peak}")
+    print(f"stub peak in flight:          {server.peak_in_flight}")
+    print(f"wall time:                    {elapsed:.2f}s   failed: {len(failed)}")
+    if failed:
+        print(f"first failure: {failed[0]!r}")
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(ConversationHistory).where(ConversationHistory.user_id == user_id))
+        await db.execute(delete(User).where(User.id == user_id))
+        await db.commit()
+    await engine.dispose()
+    server.stop()
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    d = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    asyncio.run(main(n, d))
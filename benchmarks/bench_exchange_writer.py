@@ -0,0 +1,102 @@
+"""
+Benchmark: rows/s persisting chat exchanges, one commit per exchange vs. the batched writer.
+
+Saves `exchanges` exchanges (2 rows each) from `clients` concurrent clients:
+
+  - "direct":     save_exchange on a fresh session per call, one commit each
+  - "await":      through ExchangeWriter, every caller awaits its batch commit
+  - "background": through ExchangeWriter, callers only enqueue (time includes drain)
+
+Reports rows/s, and p50/p99 of the time a request spends in save_exchange.
+Run against Postgres by exporting DATABASE_URL (postgresql+asyncpg://...);
+without it a throwaway SQLite file is used, which serializes writers and
+understates the difference.
+
+Usage:
+    python -m benchmarks.bench_exchange_writer [exchanges] [clients]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-google-key")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.gettempdir()}/bench_exchange_writer.db")
+
+from sqlalchemy import delete  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.db.models import Base, ConversationHistory, User  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+from app.services.chat_service import save_exchange  # noqa: E402
+from app.services.exchange_writer import exchange_writer  # noqa: E402
+
+BENCH_EMAIL = "bench-writer@example.com"
+REPLY = "lorem ipsum dolor sit amet " * 20
+
+
+async def _setup() -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"{BENCH_EMAIL}-{time.time_ns()}", hashed_password="x", is_active=True)
+        db.add(user)
+        await db.commit()
+        return user.id
+
+
+async def _cleanup(user_id: int) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(ConversationHistory).where(ConversationHistory.user_id == user_id))
+        await db.execute(delete(User).where(User.id == user_id))
+        await db.commit()
+
+
+async def _run(mode: str, user_id: int, exchanges: int, clients: int) -> None:
+    settings.EXCHANGE_WRITE_MODE = mode
+    sem = asyncio.Semaphore(clients)
+    latencies = []
+
+    async def one(i: int):
+        async with sem:
+            async with AsyncSessionLocal() as db:
+                started = time.perf_counter()
+                await save_exchange(f"bench-{mode}-{i % 500}", f"prompt {i}", REPLY, db, user_id=user_id)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    if mode != "direct":
+        exchange_writer.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(exchanges)))
+    if mode != "direct":
+        await exchange_writer.drain(timeout=300)
+    elapsed = time.perf_counter() - started
+
+    q = statistics.quantiles(latencies, n=100)
+    print(
+        f"{mode:<11} {2 * exchanges / elapsed:9.0f} rows/s   "
+        f"save p50={q[49]:7.2f} ms  p99={q[98]:7.2f} ms"
+    )
+
+
+async def main(exchanges: int, clients: int) -> None:
+    user_id = await _setup()
+    print(f"{exchanges} exchanges, {clients} clients, db={engine.url.drivername}, "
+          f"batch={settings.EXCHANGE_WRITER_BATCH_SIZE}, flush={settings.EXCHANGE_WRITER_FLUSH_MS} ms")
+    settings.HISTORY_CACHE_ENABLED = False
+    try:
+        for mode in ("direct", "await", "background"):
+            await _run(mode, user_id, exchanges, clients)
+        print(f"writer: {exchange_writer.stats()}")
+    finally:
+        await _cleanup(user_id)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    c = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    asyncio.run(main(n, c))
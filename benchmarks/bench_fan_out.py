@@ -0,0 +1,91 @@
+"""
+Benchmark: one prompt sent to several models, one after another vs fan-out.
+
+Three Gemini models answer from a stub server after different delays. The
+sequential baseline calls ChatService.process_chat per model; fan_out sends
+them concurrently, so mode=all should take about as long as the slowest
+model (not the sum), and mode=first about as long as the fastest, with the
+slower calls cancelled.
+
+Usage:
+    python -m benchmarks.bench_fan_out
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-google-key")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.gettempdir()}/bench_fan_out.db")
+os.environ.setdefault("EXCHANGE_WRITE_MODE", "direct")
+
+from google import genai  # noqa: E402
+from google.genai import types  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+from app.db.models import Base, ConversationHistory, User  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+from app.services.chat_service import ChatService  # noqa: E402
+from app.services.fan_out import fan_out, fan_out_stream  # noqa: E402
+from app.services.provider_registry import provider_registry  # noqa: E402
+from benchmarks.stub_gemini import StubGeminiServer  # noqa: E402
+
+DELAYS = {"gemini-3.1-flash-lite": 0.3, "gemini-3-flash": 0.6, "gemini-3.1-pro": 1.2}
+MODELS = list(DELAYS)
+
+
+async def _setup() -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"bench-fan-out-{time.time_ns()}@example.com", hashed_password="x", is_active=True)
+        db.add(user)
+        await db.commit()
+        return user.id
+
+
+async def main() -> None:
+    server = StubGeminiServer(model_delays=DELAYS).start()
+    provider_registry.google_client = genai.Client(
+        api_key="stub", http_options=types.HttpOptions(base_url=server.base_url)
+    )
+    provider_registry.started = True
+    user_id = await _setup()
+
+    started = time.perf_counter()
+    for model in MODELS:
+        await ChatService.process_chat(
+            session_id="bench-fan-out-seq", prompt="ping", model_name=model, user_id=user_id
+        )
+    print(f"sequential ({len(MODELS)} models): {time.perf_counter() - started:.2f}s")
+
+    for mode in ("all", "quorum", "first"):
+        server.reset()
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            results, persisted = await fan_out(
+                session_id=f"bench-fan-out-{mode}", prompt="ping", models=MODELS, db=db, user_id=user_id, mode=mode
+            )
+        elapsed = time.perf_counter() - started
+        statuses = ", ".join(f"{r.model}={r.status}" for r in results)
+        print(f"fan_out mode={mode:<6}: {elapsed:.2f}s  saved={persisted}  [{statuses}]")
+
+    server.reset()
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        events = [e async for e in fan_out_stream(
+            session_id="bench-fan-out-stream", prompt="ping", models=MODELS, db=db, user_id=user_id, mode="first"
+        )]
+    print(f"fan_out_stream mode=first: {time.perf_counter() - started:.2f}s  {events}")
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(ConversationHistory).where(ConversationHistory.user_id == user_id))
+        await db.execute(delete(User).where(User.id == user_id))
+        await db.commit()
+    await engine.dispose()
+    server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
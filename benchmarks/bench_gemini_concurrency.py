@@ -0,0 +1,81 @@
+"""
+Concurrency benchmark: sync Gemini SDK in asyncio.to_thread vs. native client.aio.
+
+Fires N concurrent generate_content calls at a local stub Gemini server that
+holds each request for DELAY seconds, and reports how many were in flight at
+the server at once. With to_thread the ceiling is the default executor size
+(min(32, cpu + 4)); with client.aio it is bounded only by the HTTP pool.
+
+Usage:
+    python -m benchmarks.bench_gemini_concurrency [requests] [delay_seconds]
+"""
+import asyncio
+import sys
+import time
+
+import httpx
+from google import genai
+from google.genai import types
+
+from benchmarks.stub_gemini import StubGeminiServer
+
+MODEL = "gemini-3-flash"
+
+
+async def _run(client: genai.Client, n: int, use_thread: bool) -> float:
+    def _call_sync():
+        return client.models.generate_content(model=MODEL, contents="ping")
+
+    async def _one():
+        if use_thread:
+            return await asyncio.to_thread(_call_sync)
+        return await client.aio.models.generate_content(model=MODEL, contents="ping")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_one() for _ in range(n)))
+    return time.perf_counter() - start
+
+
+async def _timeout_cancels(client: genai.Client, server: StubGeminiServer) -> int:
+    """Returns how many server-side requests saw the client go away on timeout."""
+    server.reset()
+    try:
+        await asyncio.wait_for(
+            client.aio.models.generate_content(model=MODEL, contents="ping"),
+            timeout=server.delay / 4,
+        )
+    except asyncio.TimeoutError:
+        pass
+    await asyncio.sleep(server.delay)
+    return server.cancelled
+
+
+async def _bench(server: StubGeminiServer, n: int) -> None:
+    limits = {"limits": httpx.Limits(max_connections=n, max_keepalive_connections=n)}
+    client = genai.Client(
+        api_key="stub",
+        http_options=types.HttpOptions(base_url=server.base_url, client_args=limits, async_client_args=limits),
+    )
+
+    for label, use_thread in (("to_thread (before)", True), ("client.aio (after)", False)):
+        server.reset()
+        elapsed = await _run(client, n, use_thread)
+        print(f"{label:20s} requests={n} peak_in_flight={server.peak_in_flight:4d} wall={elapsed:6.2f}s")
+
+    cancelled = await _timeout_cancels(client, server)
+    print(f"timeout cancels upstream call (client.aio): {bool(cancelled)}")
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+
+    server = StubGeminiServer(delay=delay).start()
+    try:
+        asyncio.run(_bench(server, n))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark: cost of the hot-path metrics (app/core/metrics.py).
+
+1. Micro: nanoseconds per histogram observation / counter increment, with a
+   pre-bound series and with a per-call label lookup.
+2. End to end: ChatService.process_chat against a stub Gemini server that
+   answers immediately (worst case: no LLM time to hide the overhead), in
+   alternating rounds with the metrics on and with observe/inc patched to
+   no-ops. Reports the median request time of each and the difference, plus
+   the overhead implied by (metric updates per request x cost per update).
+
+Usage:
+    python -m benchmarks.bench_metrics_overhead [rounds] [requests_per_round]
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-google-key")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.gettempdir()}/bench_metrics.db")
+os.environ.setdefault("EXCHANGE_WRITE_MODE", "direct")
+os.environ.setdefault("LLM_TOKEN_BUDGET", "")
+
+from google import genai  # noqa: E402
+from google.genai import types  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+from app.core import metrics  # noqa: E402
+from app.db.models import Base, ConversationHistory, User  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+from app.services.chat_service import ChatService  # noqa: E402
+from app.services.provider_registry import provider_registry  # noqa: E402
+from benchmarks.stub_gemini import StubGeminiServer  # noqa: E402
+
+MODEL = "gemini-3-flash"
+
+
+def _micro() -> float:
+    n = 200_000
+    histogram = metrics.Histogram("bench_seconds", "bench", ["model"], registry=metrics.Registry())
+    counter = metrics.Counter("bench_total", "bench", ["model", "exception"], registry=metrics.Registry())
+    bound = histogram.labels(MODEL)
+    cases = {
+        "histogram.observe (bound series)": lambda: bound.observe(0.123),
+        "histogram.labels(m).observe": lambda: histogram.labels(MODEL).observe(0.123),
+        "counter.labels(m, e).inc": lambda: counter.labels(MODEL, "TimeoutError").inc(),
+        "perf_counter() pair": lambda: time.perf_counter() - time.perf_counter(),
+    }
+    baseline = min(timeit.repeat(lambda: None, number=n, repeat=5)) / n
+    costs = {}
+    for label, fn in cases.items():
+        costs[label] = min(timeit.repeat(fn, number=n, repeat=5)) / n - baseline
+        print(f"  {label:<36} {costs[label] * 1e9:7.0f} ns")
+    # One update = a labelled observation plus the timing around it
+    return costs["histogram.labels(m).observe"] + costs["perf_counter() pair"]
+
+
+def _updates() -> int:
+    total = 0
+    for metric in metrics.REGISTRY._metrics:
+        for child in getattr(metric, "_children", {}).values():
+            total += sum(child.counts) if hasattr(child, "counts") else int(child.value)
+    return total
+
+
+async def _round(user_id: int, requests: int, tag: str) -> list:
+    latencies = []
+    for i in range(requests):
+        started = time.perf_counter()
+        await ChatService.process_chat(
+            session_id=f"bench-metrics-{i % 10}", prompt=f"{tag} {i}", model_name=MODEL, user_id=user_id
+        )
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def main(rounds: int, requests: int) -> None:
+    logging.disable(logging.CRITICAL)
+    print("micro (per call):")
+    per_update = _micro()
+
+    server = StubGeminiServer(delay=0.0).start()
+    provider_registry.google_client = genai.Client(
+        api_key="stub", http_options=types.HttpOptions(base_url=server.base_url)
+    )
+    provider_registry.started = True
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"bench-metrics-{time.time_ns()}@example.com", hashed_password="x", is_active=True)
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+
+    await _round(user_id, requests, "warmup")
+    observe, inc = metrics._HistogramChild.observe, metrics._CounterChild.inc
+    on, off = [], []
+    updates = 0
+    for r in range(rounds):
+        before = _updates()
+        on += await _round(user_id, requests, f"on-{r}")
+        updates += _updates() - before
+        metrics._HistogramChild.observe = lambda self, value: None
+        metrics._CounterChild.inc = lambda self, amount=1.0: None
+        try:
+            off += await _round(user_id, requests, f"off-{r}")
+        finally:
+            metrics._HistogramChild.observe, metrics._CounterChild.inc = observe, inc
+
+    med_on, med_off = statistics.median(on), statistics.median(off)
+    per_request = updates / len(on)
+    implied = per_request * per_update / med_on * 100
+    print(f"end to end ({rounds} rounds x {requests} requests, stub answers immediately):")
+    print(f"  metrics on   median={med_on * 1000:.3f}ms")
+    print(f"  metrics off  median={med_off * 1000:.3f}ms")
+    print(f"  measured difference {(med_on - med_off) / med_off * 100:+.2f}% (includes run-to-run noise)")
+    print(f"  {per_request:.1f} metric updates per request x {per_update * 1e9:.0f} ns "
+          f"= {per_request * per_update * 1e6:.2f} us -> implied overhead {implied:.3f}%")
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(ConversationHistory).where(ConversationHistory.user_id == user_id))
+        await db.execute(delete(User).where(User.id == user_id))
+        await db.commit()
+    await engine.dispose()
+    server.stop()
+
+
+if __name__ == "__main__":
+    r = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    asyncio.run(main(r, n))
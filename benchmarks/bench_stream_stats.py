@@ -0,0 +1,118 @@
+"""
+Benchmark: per-stream statistics of POST /api/v1/chat/stream.
+
+Streams from the models of one tier, served by a stub Gemini server where
+each model has its own time to first chunk and chunk pace, through the app
+in-process (httpx ASGI transport). Prints the final `stats` event of one
+stream per model and the aggregate chat_stream_* metrics from /metrics,
+which is what picking the fastest model of a tier would be based on.
+
+Usage:
+    python -m benchmarks.bench_stream_stats [streams_per_model]
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-google-key")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.gettempdir()}/bench_stream_stats.db")
+os.environ.setdefault("EXCHANGE_WRITE_MODE", "direct")
+os.environ.setdefault("LLM_TOKEN_BUDGET", "")
+
+import httpx  # noqa: E402
+from google import genai  # noqa: E402
+from google.genai import types  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+from app.core import security  # noqa: E402
+from app.core.rate_limit import limiter  # noqa: E402
+from app.db.models import Base, ConversationHistory, User  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services.provider_registry import provider_registry  # noqa: E402
+from benchmarks.stub_gemini import StubGeminiServer  # noqa: E402
+
+# model -> (delay before the first chunk, chunk count, seconds between chunks)
+PROFILES = {
+    "gemini-3-flash": (0.15, 20, 0.01),
+    "gemini-3.1-flash-lite": (0.05, 20, 0.03),
+    "gemini-3.1-pro": (0.40, 20, 0.005),
+}
+METRICS = ("chat_stream_time_to_first_chunk_seconds", "chat_stream_duration_seconds", "chat_stream_tokens_per_second")
+
+
+async def _stream(client: httpx.AsyncClient, token: str, model: str, i: int) -> dict:
+    stats = None
+    async with client.stream(
+        "POST", "/api/v1/chat/stream",
+        json={"session_id": f"bench-stream-{model}-{i}", "prompt": f"ping {i}", "model": model},
+        headers={"Authorization": f"Bearer {token}"},
+    ) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("data: {"):
+                event = json.loads(line[len("data: "):])
+                stats = event.get("stats", stats)
+    return stats
+
+
+def _averages(text: str) -> dict:
+    """(metric, model) -> sum / count from the Prometheus exposition."""
+    sums, counts = {}, {}
+    for line in text.splitlines():
+        for metric in METRICS:
+            for suffix, target in (("_sum{", sums), ("_count{", counts)):
+                if line.startswith(metric + suffix):
+                    model = line.split('model="')[1].split('"')[0]
+                    target[(metric, model)] = float(line.rsplit(" ", 1)[1])
+    return {key: sums[key] / counts[key] for key in sums if counts.get(key)}
+
+
+async def main(n: int) -> None:
+    logging.disable(logging.CRITICAL)
+    limiter.enabled = False
+    server = StubGeminiServer(
+        delay=0.1,
+        model_delays={model: delay for model, (delay, _, _) in PROFILES.items()},
+        stream_chunks={model: (chunks, gap) for model, (_, chunks, gap) in PROFILES.items()},
+    ).start()
+    provider_registry.google_client = genai.Client(
+        api_key="stub", http_options=types.HttpOptions(base_url=server.base_url)
+    )
+    provider_registry.started = True
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"bench-stream-{time.time_ns()}@example.com", hashed_password="x", is_active=True)
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+    token = security.create_access_token(user_id)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+        print("final stats event, one stream per model:")
+        for model in PROFILES:
+            stats = [await _stream(client, token, model, i) for i in range(n)]
+            print(f"  {json.dumps(stats[-1])}")
+        averages = _averages((await client.get("/metrics")).text)
+
+    print(f"aggregate metrics over {n} streams per model (mean):")
+    print(f"  {'model':<24}{'ttft':>10}{'duration':>12}{'tokens/s':>10}")
+    for model in PROFILES:
+        ttft, duration, tps = (averages.get((metric, model), float("nan")) for metric in METRICS)
+        print(f"  {model:<24}{ttft * 1000:>8.0f}ms{duration * 1000:>10.0f}ms{tps:>10.0f}")
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(ConversationHistory).where(ConversationHistory.user_id == user_id))
+        await db.execute(delete(User).where(User.id == user_id))
+        await db.commit()
+    await engine.dispose()
+    server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
@@ -0,0 +1,145 @@
+"""
+Data generator + query timings for a large (partitioned) conversation_history.
+
+Fills conversation_history with `rows` synthetic messages spread over the
+last `months` months and `sessions` sessions (server-side, with
+generate_series, in 1M-row chunks), creating any missing monthly partitions
+first. It then times the get_history query for random sessions:
+
+  - "lookback":    as the app runs it (timestamp >= now() - HISTORY_LOOKBACK_DAYS)
+  - "no-cutoff":   the same query without the cutoff (every partition is probed)
+
+and prints the EXPLAIN of one lookback query, showing which partitions are
+scanned. Needs a migrated PostgreSQL database (alembic upgrade head):
+
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.gen_conversation_history 10000000
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.gen_conversation_history 100000000 24 2000000
+
+Usage:
+    python -m benchmarks.gen_conversation_history [rows] [months] [sessions] [--no-insert]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-google-key")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+
+from sqlalchemy import text  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.db.partitions import ensure_partitions  # noqa: E402
+from app.db.session import engine  # noqa: E402
+
+CHUNK = 1_000_000
+BENCH_EMAIL = "bench-history@example.com"
+QUERIES = 500
+
+
+async def _user_id(conn) -> int:
+    await conn.execute(text(
+        "INSERT INTO users (email, hashed_password, is_active) VALUES (:email, 'x', true) "
+        "ON CONFLICT (email) DO NOTHING"
+    ), {"email": BENCH_EMAIL})
+    return (await conn.execute(text("SELECT id FROM users WHERE email = :email"), {"email": BENCH_EMAIL})).scalar_one()
+
+
+async def _generate(rows: int, months: int, sessions: int) -> int:
+    # Partitions for the whole backfill range (the migration only creates them
+    # from the oldest existing row onwards).
+    first = date.today().replace(day=1)
+    for _ in range(months):
+        first = (first - timedelta(days=1)).replace(day=1)
+    await ensure_partitions(engine, months + settings.HISTORY_PARTITION_MONTHS_AHEAD, today=first)
+
+    async with engine.begin() as conn:
+        user_id = await _user_id(conn)
+
+    span_seconds = months * 30 * 86400
+    started = time.perf_counter()
+    for offset in range(0, rows, CHUNK):
+        n = min(CHUNK, rows - offset)
+        async with engine.begin() as conn:
+            await conn.execute(text("""
+                INSERT INTO conversation_history (session_id, role, content, "timestamp", user_id)
+                SELECT 'bench-' || (g % :sessions),
+                       CASE WHEN g % 2 = 0 THEN 'user' ELSE 'model' END,
+                       repeat(md5(g::text), 8),
+                       now() - make_interval(secs => (:span * (1 - g::float8 / :total))),
+                       :user_id
+                FROM generate_series(:start, :stop) AS g
+            """), {
+                "sessions": sessions, "span": span_seconds, "total": rows,
+                "start": offset, "stop": offset + n - 1, "user_id": user_id,
+            })
+        done = offset + n
+        rate = done / (time.perf_counter() - started)
+        print(f"  inserted {done:>12,} rows ({rate:,.0f} rows/s)")
+
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE conversation_history"))
+    return user_id
+
+
+def _query(with_cutoff: bool) -> str:
+    cutoff = 'AND "timestamp" >= :cutoff ' if with_cutoff else ""
+    return (
+        "SELECT id, role, content FROM conversation_history "
+        f"WHERE session_id = :session_id AND user_id = :user_id {cutoff}"
+        'ORDER BY "timestamp" DESC, id DESC LIMIT :limit'
+    )
+
+
+async def _time_queries(user_id: int, sessions: int) -> None:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.HISTORY_LOOKBACK_DAYS or 36500)
+    rng = random.Random(7)
+    async with engine.connect() as conn:
+        for name, with_cutoff in (("lookback", True), ("no-cutoff", False)):
+            sql = text(_query(with_cutoff))
+            samples = []
+            for _ in range(QUERIES):
+                params = {
+                    "session_id": f"bench-{rng.randrange(sessions)}", "user_id": user_id,
+                    "limit": settings.HISTORY_LIMIT, "cutoff": cutoff,
+                }
+                started = time.perf_counter()
+                (await conn.execute(sql, params)).all()
+                samples.append((time.perf_counter() - started) * 1000)
+            q = statistics.quantiles(samples, n=100)
+            print(f"{name:<10} p50={q[49]:8.2f} ms  p99={q[98]:8.2f} ms  ({QUERIES} queries)")
+
+        plan = await conn.execute(text("EXPLAIN (ANALYZE, BUFFERS) " + _query(True)), {
+            "session_id": "bench-0", "user_id": user_id, "limit": settings.HISTORY_LIMIT, "cutoff": cutoff,
+        })
+        print("\nEXPLAIN (lookback):")
+        for (line,) in plan.all():
+            print("  " + line)
+
+
+async def main(rows: int, months: int, sessions: int, insert: bool) -> None:
+    if engine.dialect.name != "postgresql":
+        sys.exit("Needs a PostgreSQL DATABASE_URL")
+    if insert:
+        print(f"Generating {rows:,} rows over {months} months, {sessions:,} sessions")
+        user_id = await _generate(rows, months, sessions)
+    else:
+        async with engine.begin() as conn:
+            user_id = await _user_id(conn)
+    async with engine.connect() as conn:
+        total = (await conn.execute(text("SELECT reltuples::bigint FROM pg_class WHERE relname = 'conversation_history_default'"))).scalar()
+        parts = (await conn.execute(text("SELECT count(*) FROM pg_inherits WHERE inhparent = 'conversation_history'::regclass"))).scalar()
+    print(f"\n{parts} partitions (default partition ~{total or 0:,} rows), lookback={settings.HISTORY_LOOKBACK_DAYS} days")
+    await _time_queries(user_id, sessions)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    n = int(args[0]) if len(args) > 0 else 10_000_000
+    m = int(args[1]) if len(args) > 1 else 24
+    s = int(args[2]) if len(args) > 2 else max(n // 100, 1)
+    asyncio.run(main(n, m, s, insert="--no-insert" not in sys.argv))
@@ -0,0 +1,145 @@
+"""
+Deterministic simulation of the model router (no network, virtual clock).
+
+Three fake providers of one tier answer with log-normal latencies. Requests
+arrive every `interval` virtual seconds through three phases:
+
+  1. healthy        - A is the fastest model
+  2. A degraded     - A rate-limits 60% of calls and its p95 jumps past the timeout
+  3. A recovered    - back to phase 1
+
+Each routing policy is replayed with the same seed and reports, per phase,
+the latency seen by clients (including failover time), requests that failed
+outright, failovers and the share of traffic per model. The latency policy
+should move traffic off A during the outage and back once its bad samples
+age out (MODEL_ROUTER_MAX_AGE_SECONDS); the static policy keeps trying A
+first and pays the failover cost on every request.
+
+Usage:
+    python -m benchmarks.simulate_model_router [seed]
+"""
+import asyncio
+import logging
+import math
+import os
+import random
+import sys
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-google-key")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+import httpx  # noqa: E402
+import openai  # noqa: E402
+
+from app.services.model_router import LatencyPolicy, ModelRouter, RoutingPolicy  # noqa: E402
+
+TIMEOUT = 10.0  # seconds, like LLM_TIMEOUT_SECONDS
+PHASE_SECONDS = 900.0
+
+
+@dataclass
+class Profile:
+    median: float  # seconds
+    sigma: float  # log-normal spread
+    rate_limited: float = 0.0  # share of calls answered with 429
+
+
+HEALTHY = {"A": Profile(0.8, 0.3), "B": Profile(1.2, 0.3), "C": Profile(1.6, 0.4)}
+PHASES = [
+    ("healthy", HEALTHY),
+    ("A degraded", {**HEALTHY, "A": Profile(4.0, 0.9, rate_limited=0.6)}),
+    ("A recovered", HEALTHY),
+]
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeProvider:
+    """Advances the virtual clock by a sampled latency instead of sleeping."""
+
+    def __init__(self, name: str, clock: VirtualClock, rng: random.Random):
+        self.name = name
+        self.clock = clock
+        self.rng = rng
+        self.profile = HEALTHY[name]
+
+    async def generate(self) -> str:
+        if self.rng.random() < self.profile.rate_limited:
+            self.clock.now += 0.05
+            raise openai.RateLimitError(
+                "simulated 429", response=httpx.Response(429, request=httpx.Request("POST", "http://sim")), body=None
+            )
+        latency = self.profile.median * math.exp(self.rng.gauss(0, self.profile.sigma))
+        if latency > TIMEOUT:
+            self.clock.now += TIMEOUT
+            raise asyncio.TimeoutError()
+        self.clock.now += latency
+        return f"reply from {self.name}"
+
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))] if values else float("nan")
+
+
+async def simulate(policy: RoutingPolicy, seed: int, interval: float) -> List[Dict[str, object]]:
+    clock = VirtualClock()
+    rng = random.Random(seed)
+    providers = {name: FakeProvider(name, clock, rng) for name in HEALTHY}
+    router = ModelRouter(tiers={"balanced": list(HEALTHY)}, policy=policy, default_tier="balanced", clock=clock)
+
+    report = []
+    for phase, profiles in PHASES:
+        for name, provider in providers.items():
+            provider.profile = profiles[name]
+        end = clock.now + PHASE_SECONDS
+        latencies: List[float] = []
+        served: Counter = Counter()
+        failed = 0
+        failovers_before = router.failovers
+        arrival = clock.now
+        while arrival < end:
+            # Requests are replayed one at a time; a slow one delays the next arrival
+            clock.now = max(clock.now, arrival)
+            started = clock.now
+            try:
+                model, _ = await router.run(router.candidates("auto"), lambda m: providers[m].generate())
+                served[model] += 1
+            except Exception:
+                failed += 1
+            latencies.append(clock.now - started)
+            arrival += interval
+        report.append({
+            "phase": phase,
+            "requests": len(latencies),
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "failed": failed,
+            "failovers": router.failovers - failovers_before,
+            "served": {name: served[name] for name in HEALTHY},
+        })
+    return report
+
+
+async def main(seed: int) -> None:
+    logging.getLogger("app.services.model_router").setLevel(logging.ERROR)
+    for policy in (RoutingPolicy(), LatencyPolicy()):
+        print(f"policy={policy.name} seed={seed}")
+        for row in await simulate(policy, seed, interval=2.0):
+            shares = " ".join(f"{m}={n}" for m, n in row["served"].items())
+            print(f"  {row['phase']:<12} n={row['requests']:<4} p50={row['p50']:.2f}s p95={row['p95']:.2f}s "
+                  f"failed={row['failed']:<3} failovers={row['failovers']:<4} served: {shares}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 7))
@@ -0,0 +1,139 @@
+"""
+Minimal stand-in for the Gemini REST API, used by the benchmarks.
+
+Serves `POST /{api_version}/models/{model}:generateContent` (and
+`:streamGenerateContent`) with a fixed (or load-dependent) delay and a
+canned response, and tracks how many requests are in flight at once.
+Point a client at it with:
+
+    genai.Client(api_key="stub", http_options=types.HttpOptions(base_url=server.base_url))
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StubGeminiServer:
+    """Runs the stub app with uvicorn in a background thread."""
+
+    def __init__(
+        self, delay: float = 1.0, failure_rate: float = 0.0, model_delays=None, capacity=None, stream_chunks=None
+    ):
+        self.delay = delay
+        # Per-model overrides of `delay`, e.g. {"gemini-3-flash": 0.2}
+        self.model_delays = model_delays or {}
+        # Requests served at full speed; beyond it the delay grows in proportion
+        # to the load (in_flight / capacity), like a saturated provider
+        self.capacity = capacity
+        # Per-model (chunk count, seconds between chunks) of streamed replies;
+        # the default is the reply in two chunks sent back to back
+        self.stream_chunks = stream_chunks or {}
+        # While True, every request is answered with HTTP 503 right away
+        self.outage = False
+        # Fraction of requests answered with HTTP 503 (deterministic, every 1/rate)
+        self.failure_rate = failure_rate
+        self.port = _free_port()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total = 0
+        self.cancelled = 0
+        self._thread = None
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def reset(self) -> None:
+        self.in_flight = self.peak_in_flight = self.total = self.cancelled = 0
+
+    async def _generate(self, request: Request):
+        self.total += 1
+        if self.outage:
+            return JSONResponse(
+                {"error": {"code": 503, "message": "stub outage", "status": "UNAVAILABLE"}},
+                status_code=503,
+            )
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await request.body()
+            # Sleep in small steps so a client that hangs up (e.g. on timeout)
+            # is noticed and counted as cancelled.
+            delay = self.model_delays.get(request.path_params["model"], self.delay)
+            if self.capacity:
+                delay *= max(1.0, self.in_flight / self.capacity)
+            deadline = time.monotonic() + delay
+            while time.monotonic() < deadline:
+                await asyncio.sleep(min(0.05, max(0.0, deadline - time.monotonic())))
+                if await request.is_disconnected():
+                    self.cancelled += 1
+                    return JSONResponse({}, status_code=499)
+        finally:
+            self.in_flight -= 1
+
+        if self.failure_rate and self.total % max(1, round(1 / self.failure_rate)) == 0:
+            return JSONResponse(
+                {"error": {"code": 503, "message": "stub outage", "status": "UNAVAILABLE"}},
+                status_code=503,
+            )
+
+        return JSONResponse(self._response("stub reply"))
+
+    async def _stream(self, request: Request):
+        """streamGenerateContent (?alt=sse): the reply in chunks, after the delay."""
+        response = await self._generate(request)
+        if response.status_code != 200:
+            return response
+        count, gap = self.stream_chunks.get(request.path_params["model"], (2, 0.0))
+
+        async def events():
+            for i in range(count):
+                if i and gap:
+                    await asyncio.sleep(gap)
+                text = "stub " if i < count - 1 else "reply"
+                yield f"data: {json.dumps(self._response(text))}\r\n\r\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @staticmethod
+    def _response(text: str) -> dict:
+        return {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": text}]},
+                "finishReason": "STOP",
+            }],
+            "usageMetadata": {"promptTokenCount": 10, "candidatesTokenCount": 2, "totalTokenCount": 12},
+        }
+
+    def start(self) -> "StubGeminiServer":
+        app = Starlette(routes=[
+            Route("/{api_version}/models/{model}:generateContent", self._generate, methods=["POST"]),
+            Route("/{api_version}/models/{model}:streamGenerateContent", self._stream, methods=["POST"]),
+        ])
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="error")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
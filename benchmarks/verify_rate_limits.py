@@ -0,0 +1,132 @@
+"""
+Checks user-keyed rate limits, shared counters and LLM token budgets.
+
+Runs the app in-process (no lifespan, SQLite, stub Gemini server) with
+RATE_LIMIT_STORAGE_URI pointing at "shared-memory://", a local stand-in for
+Redis: every storage created from that URI in this process shares one set of
+counters, the way all uvicorn workers share one Redis. Checks that:
+
+  - two users behind the same IP get separate request budgets
+  - anonymous endpoints (login) fall back to per-IP limits
+  - two "workers" on the shared storage enforce one combined limit
+    (with "memory://" each worker would allow the full limit again)
+  - the LLM token budget refuses a chat with 429 + Retry-After once the
+    tokens charged for earlier replies exhaust it
+
+Usage:
+    python -m benchmarks.verify_rate_limits
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-google-key")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='rate-limits-')}/app.db")
+os.environ["EXCHANGE_WRITE_MODE"] = "direct"
+os.environ["RATE_LIMIT_STORAGE_URI"] = "shared-memory://"
+os.environ["LLM_TOKEN_BUDGET"] = "60/minute"
+
+from limits import parse  # noqa: E402
+from limits.storage import MemoryStorage, storage_from_string  # noqa: E402
+from limits.strategies import STRATEGIES  # noqa: E402
+
+
+class SharedMemoryStorage(MemoryStorage):
+    """MemoryStorage whose state is shared by every instance (Redis stand-in)."""
+
+    STORAGE_SCHEME = ["shared-memory"]
+    _shared = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._shared is None:
+            cls._shared = super().__new__(cls)
+            cls._shared._ready = False
+        return cls._shared
+
+    def __init__(self, *args, **kwargs):
+        if not self._ready:
+            super().__init__(*args, **kwargs)
+            self._ready = True
+
+
+from fastapi.testclient import TestClient  # noqa: E402
+from google import genai  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from app.core import security  # noqa: E402
+from app.db.models import Base, User  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services.provider_registry import provider_registry  # noqa: E402
+from benchmarks.stub_gemini import StubGeminiServer  # noqa: E402
+
+
+async def _users(n: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        users = [User(email=f"limits-{i}-{time.time_ns()}@example.com", hashed_password="x", is_active=True)
+                 for i in range(n)]
+        db.add_all(users)
+        await db.commit()
+        return [u.id for u in users]
+
+
+def _check(label: str, ok: bool) -> bool:
+    print(f"  [{'ok' if ok else 'FAIL'}] {label}")
+    return ok
+
+
+def main() -> None:
+    server = StubGeminiServer(delay=0.05).start()
+    provider_registry.google_client = genai.Client(
+        api_key="stub", http_options=types.HttpOptions(base_url=server.base_url)
+    )
+    provider_registry.started = True
+    alice, bob, carol = asyncio.run(_users(3))
+    client = TestClient(app)
+
+    def auth(user_id: int):
+        return {"Authorization": f"Bearer {security.create_access_token(user_id)}"}
+
+    results = []
+
+    # Per-user budgets: export is limited to 5/minute
+    codes = [client.get("/api/v1/chat/sessions/s/export", headers=auth(alice)).status_code for _ in range(6)]
+    results.append(_check(f"alice: 5 exports allowed, 6th refused {codes}", codes[:5] == [200] * 5 and codes[5] == 429))
+    code = client.get("/api/v1/chat/sessions/s/export", headers=auth(bob)).status_code
+    results.append(_check(f"bob, same IP, has a separate budget ({code})", code == 200))
+
+    # Anonymous: login is limited to 3/minute per IP
+    codes = [client.post("/api/v1/auth/login", data={"username": "nobody@example.com", "password": "x"}).status_code
+             for _ in range(4)]
+    results.append(_check(f"login falls back to per-IP limits {codes}", codes[3] == 429))
+
+    # Two workers on the shared storage vs per-worker memory
+    item = parse("5/minute")
+    for uri, expected in (("shared-memory://", 5), ("memory://", 10)):
+        workers = [STRATEGIES["moving-window"](storage_from_string(uri)) for _ in range(2)]
+        allowed = sum(workers[i % 2].hit(item, "two-workers", uri) for i in range(10))
+        results.append(_check(f"{uri:<17} 2 workers x 5/minute -> {allowed} of 10 allowed", allowed == expected))
+
+    # Token budget: 60 tokens/minute; the first exchange spends most of it
+    prompt = "x" * 160  # ~40 tokens
+    first = client.post("/api/v1/chat/", json={"session_id": "budget", "prompt": prompt,
+                                               "model": "gemini-3-flash"}, headers=auth(carol))
+    second = client.post("/api/v1/chat/", json={"session_id": "budget", "prompt": prompt,
+                                                "model": "gemini-3-flash"}, headers=auth(carol))
+    results.append(_check(
+        f"token budget: first chat {first.status_code}, second {second.status_code} "
+        f"(Retry-After {second.headers.get('retry-after')})",
+        first.status_code == 200 and second.status_code == 429 and "retry-after" in second.headers,
+    ))
+
+    server.stop()
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
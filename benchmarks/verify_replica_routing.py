@@ -0,0 +1,122 @@
+"""
+Checks read-replica routing end to end with SQLite stand-ins (or real servers).
+
+Creates a primary and a replica database that deliberately differ (the
+replica is a stale copy), plus a replica URL that cannot be opened, and
+checks that:
+
+  - get_history reads are served by a replica (stale data visible)
+  - the unreachable replica is ejected and the read retried elsewhere
+  - save_exchange writes land on the primary
+  - right after a write, the same user's reads stick to the primary
+  - the same holds for an exchange saved by ChatService.process_chat
+    (stub LLM provider), which runs on its own session
+
+With Postgres, pass the URLs explicitly (two local instances, no replication
+needed: the check relies on them differing):
+
+    DATABASE_URL=postgresql+asyncpg://.../primary \\
+    DATABASE_REPLICA_URLS='["postgresql+asyncpg://.../replica"]' \\
+    python -m benchmarks.verify_replica_routing
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="replica-routing-")
+os.environ.setdefault("GOOGLE_API_KEY", "bench-google-key")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_tmp}/primary.db")
+os.environ.setdefault("DATABASE_REPLICA_URLS", json.dumps([
+    f"sqlite+aiosqlite:///{_tmp}/missing-dir/replica-down.db",
+    f"sqlite+aiosqlite:///{_tmp}/replica.db",
+]))
+os.environ["EXCHANGE_WRITE_MODE"] = "direct"
+os.environ["HISTORY_CACHE_ENABLED"] = "false"
+
+from sqlalchemy import delete  # noqa: E402
+
+from app.db.models import Base, ConversationHistory, User  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine, replica_engines, replica_router  # noqa: E402
+from app.services.chat_service import ChatService, get_history, save_exchange  # noqa: E402
+from app.services.llm_providers import LLMProvider, LLMResult  # noqa: E402
+
+SESSION = "replica-check"
+
+
+class StubProvider(LLMProvider):
+    async def generate(self, prompt, history, image_data=None, file_data=None, use_search=False,
+                       system_instruction=None):
+        return LLMResult(text=f"reply to {prompt}", model="stub")
+
+
+async def _seed(target, email: str, contents) -> int:
+    async with target.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(delete(ConversationHistory).where(ConversationHistory.session_id == SESSION))
+        await conn.execute(delete(User).where(User.email == email))
+        await conn.execute(User.__table__.insert().values(id=424242, email=email, hashed_password="x", is_active=True))
+        for content in contents:
+            await conn.execute(ConversationHistory.__table__.insert().values(
+                session_id=SESSION, role="user", content=content, user_id=424242,
+            ))
+    return 424242
+
+
+def _check(label: str, ok: bool) -> bool:
+    print(f"  [{'ok' if ok else 'FAIL'}] {label}")
+    return ok
+
+
+async def main() -> None:
+    email = "replica-check@example.com"
+    user_id = await _seed(engine, email, ["primary-1", "primary-2"])
+    for replica in replica_engines:
+        try:
+            await _seed(replica, email, ["primary-1"])  # stale copy
+        except Exception:
+            print(f"  (replica {replica.url} is down, as intended)")
+
+    results = []
+    print(f"primary={engine.url}  replicas={len(replica_engines)}")
+
+    async with AsyncSessionLocal() as db:
+        db.info["user_id"] = user_id
+        contents = [r.content for r in await get_history(SESSION, db, user_id=user_id)]
+    results.append(_check(f"read served by the replica (stale: {contents})", contents == ["primary-1"]))
+    results.append(_check(f"unreachable replica ejected ({replica_router.stats()})", replica_router.ejections >= 1))
+
+    async with AsyncSessionLocal() as db:
+        db.info["user_id"] = user_id
+        await save_exchange(SESSION, "question", "answer", db, user_id=user_id)
+    async with engine.connect() as conn:
+        rows = (await conn.execute(
+            ConversationHistory.__table__.select().where(ConversationHistory.session_id == SESSION)
+        )).all()
+    results.append(_check(f"write landed on the primary ({len(rows)} rows)", len(rows) == 4))
+
+    async with AsyncSessionLocal() as db:
+        db.info["user_id"] = user_id
+        contents = [r.content for r in await get_history(SESSION, db, user_id=user_id)]
+    results.append(_check(f"read-your-writes: next read on the primary ({contents})", contents[-1] == "answer"))
+
+    replica_router._recent_writes.clear()
+    ChatService.get_provider = staticmethod(lambda model_name, openai_client=None: StubProvider())
+    reply, _ = await ChatService.process_chat(SESSION, "follow-up", "gemini-3-flash", user_id=user_id)
+    async with AsyncSessionLocal() as db:
+        db.info["user_id"] = user_id
+        contents = [r.content for r in await get_history(SESSION, db, user_id=user_id)]
+    results.append(_check(
+        f"read-your-writes after process_chat ({contents[-2:]})",
+        replica_router.is_sticky(user_id) and contents[-1] == reply,
+    ))
+
+    for target in [engine, *replica_engines]:
+        await target.dispose()
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""
+Checks that LLM token usage and latency are recorded per exchange and
+aggregated by GET /api/v1/usage/.
+
+Sends JSON and streamed chats through the app in-process (httpx ASGI
+transport) to a stub Gemini server that reports 10 input / 2 output tokens
+per call, once with direct writes and once through the batched exchange
+writer, then asserts one llm_usage row per exchange, linked to the stored
+model reply, and the per-model totals of the endpoint.
+
+Usage:
+    python -m benchmarks.verify_usage [chats_per_mode]
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "bench-google-key")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.gettempdir()}/verify_usage.db")
+os.environ.setdefault("EXCHANGE_WRITE_MODE", "direct")
+os.environ.setdefault("LLM_TOKEN_BUDGET", "")
+
+import httpx  # noqa: E402
+from google import genai  # noqa: E402
+from google.genai import types  # noqa: E402
+from sqlalchemy import delete, select  # noqa: E402
+
+from app.core import security  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.rate_limit import limiter  # noqa: E402
+from app.db.models import Base, ConversationHistory, LLMUsage, User  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services.exchange_writer import exchange_writer  # noqa: E402
+from app.services.provider_registry import provider_registry  # noqa: E402
+from benchmarks.stub_gemini import StubGeminiServer  # noqa: E402
+
+MODELS = ("gemini-3-flash", "gemini-3.1-flash-lite")
+
+
+async def _chat(client: httpx.AsyncClient, token: str, model: str, session_id: str, stream: bool) -> None:
+    body = {"session_id": session_id, "prompt": f"ping {session_id}", "model": model}
+    headers = {"Authorization": f"Bearer {token}"}
+    if not stream:
+        response = await client.post("/api/v1/chat/", json=body, headers=headers)
+        assert response.status_code == 200, response.text
+        return
+    async with client.stream("POST", "/api/v1/chat/stream", json=body, headers=headers) as response:
+        assert response.status_code == 200
+        async for line in response.aiter_lines():
+            if line.startswith("data: {"):
+                assert "error" not in json.loads(line[len("data: "):]), line
+
+
+async def _run(client: httpx.AsyncClient, token: str, mode: str, n: int) -> None:
+    settings.EXCHANGE_WRITE_MODE = mode
+    for model in MODELS:
+        for i in range(n):
+            await _chat(client, token, model, f"usage-{mode}-{model}-{i}", stream=bool(i % 2))
+
+
+async def main(n: int) -> None:
+    logging.disable(logging.CRITICAL)
+    limiter.enabled = False
+    server = StubGeminiServer(delay=0.01).start()
+    provider_registry.google_client = genai.Client(
+        api_key="stub", http_options=types.HttpOptions(base_url=server.base_url)
+    )
+    provider_registry.started = True
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"verify-usage-{time.time_ns()}@example.com", hashed_password="x", is_active=True)
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+    token = security.create_access_token(user_id)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+        await _run(client, token, "direct", n)
+        exchange_writer.start()
+        await _run(client, token, "await", n)
+        await exchange_writer.drain()
+        report = (await client.get("/api/v1/usage/", headers={"Authorization": f"Bearer {token}"})).json()
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(LLMUsage).where(LLMUsage.user_id == user_id))).scalars().all()
+        replies = dict((await db.execute(
+            select(ConversationHistory.id, ConversationHistory.session_id)
+            .where(ConversationHistory.user_id == user_id, ConversationHistory.role == "model")
+        )).all())
+
+    exchanges = 2 * len(MODELS) * n
+    assert len(rows) == exchanges, f"{len(rows)} usage rows for {exchanges} exchanges"
+    for row in rows:
+        assert replies.get(row.message_id) == row.session_id, f"usage row {row.id} not linked to its reply"
+        assert (row.input_tokens, row.output_tokens, row.estimated) == (10, 2, False), row.__dict__
+        assert row.latency_ms is not None and row.latency_ms > 0
+    by_model = {m["model"]: m for m in report["models"]}
+    assert set(by_model) == set(MODELS), report
+    for m in by_model.values():
+        assert (m["calls"], m["input_tokens"], m["output_tokens"]) == (2 * n, 20 * n, 4 * n), m
+    assert report["totals"]["calls"] == exchanges, report
+    print(f"{len(rows)} usage rows, linked to their replies; GET /api/v1/usage/:")
+    print(json.dumps(report, indent=2))
+    print("OK")
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(LLMUsage).where(LLMUsage.user_id == user_id))
+        await db.execute(delete(ConversationHistory).where(ConversationHistory.user_id == user_id))
+        await db.execute(delete(User).where(User.id == user_id))
+        await db.commit()
+    await engine.dispose()
+    server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 4))
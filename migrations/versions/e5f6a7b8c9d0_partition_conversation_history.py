@@ -0,0 +1,124 @@
+"""partition conversation_history by month
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2026-10-17
+
+On PostgreSQL, rebuilds conversation_history as a table range-partitioned by
+month on `timestamp` (one partition per month from the oldest row to three
+months ahead, plus a DEFAULT partition), copies the rows over and keeps the
+id sequence. Later months are created by app.db.partitions at startup.
+The primary key becomes (id, timestamp), since it must contain the
+partition key.
+
+On every dialect, drops the indexes made redundant by the composite ones:
+ix_conversation_history_id (primary key), ix_conversation_history_session_id
+(prefix of ix_session_id_timestamp) and ix_conv_history_user_id (prefix of
+ix_conv_history_user_session).
+
+The copy runs in the migration transaction: on a large table, plan for a
+maintenance window.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "e5f6a7b8c9d0"
+down_revision: Union[str, None] = "d4e5f6a7b8c9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_REDUNDANT_INDEXES = (
+    ("ix_conversation_history_id", ["id"]),
+    ("ix_conversation_history_session_id", ["session_id"]),
+    ("ix_conv_history_user_id", ["user_id"]),
+)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        for name, _ in _REDUNDANT_INDEXES:
+            op.drop_index(name, table_name="conversation_history")
+        return
+
+    op.execute("ALTER TABLE conversation_history RENAME TO conversation_history_legacy")
+    for name, _ in _REDUNDANT_INDEXES:
+        op.drop_index(name, table_name="conversation_history_legacy")
+    op.execute("ALTER INDEX ix_session_id_timestamp RENAME TO ix_session_id_timestamp_legacy")
+    op.execute("ALTER INDEX ix_conv_history_user_session RENAME TO ix_conv_history_user_session_legacy")
+    op.execute("ALTER TABLE conversation_history_legacy RENAME CONSTRAINT conversation_history_pkey TO conversation_history_legacy_pkey")
+
+    op.execute("""
+        CREATE TABLE conversation_history (
+            id integer NOT NULL DEFAULT nextval('conversation_history_id_seq'),
+            session_id varchar NOT NULL,
+            role varchar NOT NULL,
+            content text NOT NULL,
+            "timestamp" timestamptz NOT NULL DEFAULT now(),
+            user_id integer REFERENCES users (id),
+            CONSTRAINT conversation_history_pkey PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+    """)
+    op.execute("CREATE TABLE conversation_history_default PARTITION OF conversation_history DEFAULT")
+    op.execute("""
+        DO $$
+        DECLARE
+            month_start date := date_trunc('month', COALESCE(
+                (SELECT min("timestamp") FROM conversation_history_legacy), now()));
+            last_month date := date_trunc('month', now()) + interval '3 months';
+        BEGIN
+            WHILE month_start <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF conversation_history FOR VALUES FROM (%L) TO (%L)',
+                    'conversation_history_' || to_char(month_start, 'YYYY_MM'),
+                    month_start, (month_start + interval '1 month')::date);
+                month_start := month_start + interval '1 month';
+            END LOOP;
+        END $$
+    """)
+    op.create_index("ix_session_id_timestamp", "conversation_history", ["session_id", "timestamp"])
+    op.create_index("ix_conv_history_user_session", "conversation_history", ["user_id", "session_id", "timestamp"])
+
+    op.execute("""
+        INSERT INTO conversation_history (id, session_id, role, content, "timestamp", user_id)
+        SELECT id, session_id, role, content, COALESCE("timestamp", now()), user_id
+        FROM conversation_history_legacy
+    """)
+    op.execute("ALTER SEQUENCE conversation_history_id_seq OWNED BY conversation_history.id")
+    op.execute("DROP TABLE conversation_history_legacy")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        for name, columns in reversed(_REDUNDANT_INDEXES):
+            op.create_index(name, "conversation_history", columns)
+        return
+
+    op.execute("ALTER TABLE conversation_history RENAME TO conversation_history_partitioned")
+    op.execute("ALTER INDEX ix_session_id_timestamp RENAME TO ix_session_id_timestamp_partitioned")
+    op.execute("ALTER INDEX ix_conv_history_user_session RENAME TO ix_conv_history_user_session_partitioned")
+    op.execute("ALTER TABLE conversation_history_partitioned RENAME CONSTRAINT conversation_history_pkey TO conversation_history_partitioned_pkey")
+
+    op.execute("""
+        CREATE TABLE conversation_history (
+            id integer NOT NULL DEFAULT nextval('conversation_history_id_seq'),
+            session_id varchar NOT NULL,
+            role varchar NOT NULL,
+            content text NOT NULL,
+            "timestamp" timestamptz DEFAULT now(),
+            user_id integer REFERENCES users (id),
+            CONSTRAINT conversation_history_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("""
+        INSERT INTO conversation_history (id, session_id, role, content, "timestamp", user_id)
+        SELECT id, session_id, role, content, "timestamp", user_id
+        FROM conversation_history_partitioned
+    """)
+    op.execute("ALTER SEQUENCE conversation_history_id_seq OWNED BY conversation_history.id")
+    op.execute("DROP TABLE conversation_history_partitioned CASCADE")
+
+    op.create_index("ix_session_id_timestamp", "conversation_history", ["session_id", "timestamp"])
+    op.create_index("ix_conv_history_user_session", "conversation_history", ["user_id", "session_id", "timestamp"])
+    for name, columns in reversed(_REDUNDANT_INDEXES):
+        op.create_index(name, "conversation_history", columns)